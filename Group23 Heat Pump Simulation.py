@@ -14,12 +14,8 @@ between the dates that have been set
 
 ## Importing Modules ##
 
-# Maths and Graph Plotting/Fitting
-import statistics #Finding mean of an array
-import math #For Maths Functions
-import numpy as np
-from scipy.optimize import curve_fit # For performing curve fitting (fitting a function to a dataset).
-from scipy.integrate import solve_ivp #Solving ODE
+# Maths and Graph Plotting
+import math  # Import to check for missing cycling values (nan)
 import matplotlib.pyplot as plt #Plotting Graph
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg # Embeds plot figures into a tkinter GUI
 from matplotlib.figure import Figure 
@@ -29,61 +25,61 @@ from tkcalendar import DateEntry  # Import DateEntry widget for calendar-based d
 from tkinter import messagebox, ttk  # Import messagebox for pop-up messages and ttk for themed widgets
 from datetime import datetime  # Import datetime to handle date and time operations
 import tkinter as tk  # Import tkinter for building the main GUI framework
+import threading  # Import to solve runs in a background thread so the window stays responsive
+import queue  # Import to hand progress and finished runs from the background thread to the main thread
 
 
 # Data Collection/Extraction
 import os  # Import for interacting with the operating system (e.g., file paths, environment variables)
 from sys import platform  # Import to check the platform (e.g., Windows, macOS, Linux) for compatibility handling
-import yaml  # Import to parse YAML files for configuration or input data
-from meteostat import Point, Hourly  # Import Meteostat library to fetch weather data for a specific location and time
 
+# Simulation
+from heat_pump_model import (HeatPumpModel, SimulationCancelled, BUILDING_CONFIGURATIONS, GUI_TO_INPUT_KEYS,
+                             SOLVER_PROFILE_DEFAULTS)  # Headless simulation core (COP fit, weather, ODE, metrics)
+from heat_pump_report import (draw_cop_fit, draw_tank_temperature, draw_heat_load, draw_cop_over_time,
+                              draw_hot_water_demand, draw_pump_status)  # Figures shared with the headless reports
+from heat_pump_surrogate import SurrogateModel, DEFAULT_SURROGATE_FILE  # Instant estimates while the fields are edited
 
+POLL_MS = 100  # How often (ms) the main thread checks for progress and finished runs
+MAX_RUN_DAYS = 366  # Longest run the window accepts (runs are solved in the background, so a year is fine)
 
-class HeatPumpSimulationApp:
+
+class HeatPumpSimulationApp(HeatPumpModel):
     def __init__(self):
         # Initialize the main application window
         self.root = tk.Tk()  # Create the main Tkinter window
         self.root.title("Heat Pump Simulation")  # Window Title
         self.root.geometry("1200x800")  # Set the default window size (width x height)
 
-        # Initialize data arrays and variables
-        # Dictionary to store user inputs from GUI fields
-        self.input_values = {}
-    
-        # Arrays to store simulation data for analysis
-        self.energy_array = []         # Stores energy consumption values during the simulation
-        self.cop_array = []            # Stores Coefficient of Performance (COP) values
-        self.q_transfer_array = []     # Stores heat transfer data from the heat pump
-        self.q_loss_list = []          # Tracks heat loss throughout the simulation
-        self.q_load_array = []         # Tracks heat load on the building
-        
-        # Variables to manage heat pump status and temperature tracking
-        self.pump_status = []          # Tracks whether the heat pump is on or off at each timestep
-        self.run_temps = []            # Stores the tank temperatures for each simulation run
-        self.run_times = []            # Stores the timestamps for each simulation run
-        self.dT_ambient_list = []      # Stores differences between indoor and outdoor temperatures
-        
-        # Simulation settings and file paths
-        self.building_number = 3  # Default building number index, representing the third building option (e.g., Industrial Warehouse). 
-        # This is used to determine the hot water demand profile and other building-specific parameters.
+        # Initialize data arrays, simulation settings and file paths (see HeatPumpModel).
+        # input_values starts empty and is filled from inputs.yaml (and the GUI fields from it) by load_yaml_inputs.
+        # Building number 3 is the default apartment hot water demand profile.
+        HeatPumpModel.__init__(self, input_values={}, building_number=3,
+                               yaml_sim_file_path="inputs.yaml", yaml_cop_file_path="heat_pump_cop_synthetic_full.yaml")
         self.include_hot_water_demand = tk.BooleanVar(value=False)  # Boolean flag to include/exclude hot water demand in the simulation
-        self.yaml_sim_file_path = "inputs.yaml"  # File path for the simulation input YAML file
-        self.yaml_cop_file_path = "heat_pump_cop_synthetic_full.yaml"  # File path for the COP data YAML file
-        
-        # Arrays for hot water demand and total demand tracking
-        self.hot_water_demand = []     # Stores the generated hot water demand profile
-
-
-        # Initialize time settings
-        self.total_hours = 24 #Function with only simulation for 24 hours
-        self.time_steps = self.total_hours * 60 #Total Time steps of the simulation
-        # Create a time array spanning 24 hours, with each step representing one minute
-        self.time = np.linspace(0, self.total_hours, self.time_steps) 
+        # Surrogate model trained on sweep results (heat_pump_surrogate.py), if one has been trained
+        self.surrogate = SurrogateModel.load(DEFAULT_SURROGATE_FILE) if os.path.exists(DEFAULT_SURROGATE_FILE) else None
+
+        # Background runs. Tk must only be used from the main thread, so one worker thread solves the queued runs
+        # (run_queue) and puts progress and finished runs in result_queue, which poll_results reads every POLL_MS
+        self.run_queue = queue.Queue()
+        self.result_queue = queue.Queue()
+        self.queued_runs = []  # Runs waiting or being solved, oldest first
+        self.run_hot_water = False  # Whether the run being shown included hot water demand
+        # Stage outputs kept between runs (see HeatPumpModel.run_stage): a run only recomputes the stages whose
+        # inputs were edited, and only the figures of those stages are redrawn. shown_stages holds the
+        # fingerprint of each stage as it is drawn now
+        self.stage_cache = {}
+        self.shown_stages = {}
+        self.graph_colors = plt.cm.tab10.colors
+        threading.Thread(target=self.simulation_worker, daemon=True).start()
 
         # Initialize GUI elements
         self.gui_entries = {}
         self.create_gui()
         self.load_yaml_inputs()
+        self.root.protocol("WM_DELETE_WINDOW", self.close_window)
+        self.root.after(POLL_MS, self.poll_results)
         self.root.mainloop()
 
     def create_gui(self):
@@ -189,51 +185,15 @@ class HeatPumpSimulationApp:
             entry.insert(0, "1")  # Default value for tank length
 
         self.gui_entries[name] = entry
+        entry.bind("<KeyRelease>", lambda event: self.update_estimate())  # Live surrogate estimate as the value is typed
         #Frame for the various buttons
     def create_building_buttons_frame(self):
         # Frame for Buttons
         buttons_frame = tk.Frame(self.main_frame)
         buttons_frame.grid(row=0, column=2, sticky="nw", padx=10, pady=10)
         tk.Label(buttons_frame, text="Select Building Configuration:").grid(row=0, column=0, columnspan=3, sticky="w", padx=5, pady=5)
-        #Creating a dictionary to store all the 3 building variables
-        self.building_configurations = {
-             "Library": {
-                 "wall_area": "150",
-                 "wall_u_value": "0.3",
-                 "roof_area": "150",
-                 "roof_u_value": "0.23",
-                 "mass_of_water": "200",
-                 "indoor_setpoint": "293.15",
-                 "heat_loss_coefficient": "5",
-                 "heat_transfer_coefficient": "300",
-                 "off_threshold": "333.15",
-                 "tank_length":"0.6",
-             },
-             "Modern Office Building": {
-                 "wall_area": "220",
-                 "wall_u_value": "0.2",
-                 "roof_area": "170",
-                 "roof_u_value": "0.2",
-                 "mass_of_water": "220",
-                 "indoor_setpoint": "293.15",
-                 "heat_loss_coefficient": "2.5",
-                 "heat_transfer_coefficient": "250",
-                 "off_threshold": "333.15",
-                 "tank_length":"0.7",
-             },
-             "Industrial Warehouse": {
-                 "wall_area": "250",
-                 "wall_u_value": "0.35",
-                 "roof_area": "180",
-                 "roof_u_value": "0.45",
-                 "mass_of_water": "230",
-                 "indoor_setpoint": "293.15",
-                 "heat_loss_coefficient": "8",   
-                 "heat_transfer_coefficient": "500",
-                 "off_threshold": "333.15",
-                 "tank_length":"0.7",
-             }
-        }
+        #Creating a dictionary to store all the 3 building variables (shared with batch scenario files)
+        self.building_configurations = BUILDING_CONFIGURATIONS
 
         # Dynamically create buttons for each building type
         for i, building_type in enumerate(self.building_configurations.keys()):
@@ -250,7 +210,8 @@ class HeatPumpSimulationApp:
             text="Include Hot Water Demand",
             variable=self.include_hot_water_demand,
             onvalue=True,
-            offvalue=False
+            offvalue=False,
+            command=self.update_estimate
         )
         self.hot_water_checkbox.grid(row=2, column=1, padx=5, pady=5, sticky="w")
         #Resetting values back to the input file values.
@@ -280,6 +241,14 @@ class HeatPumpSimulationApp:
         self.message_label = tk.Label(buttons_frame, text="", fg="red", font=("Arial", 10, "bold"))
         self.message_label.config(text="Fixed condenser temperature must be above 60°C (333.15K)", fg="red")
         self.message_label.grid(row=4, column=0, columnspan=3, padx=5, pady=5, sticky="w")
+
+        # Progress of the background runs, and buttons to cancel them
+        self.progress_bar = ttk.Progressbar(buttons_frame, maximum=1.0, length=300)
+        self.progress_bar.grid(row=5, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        tk.Button(buttons_frame, text="Cancel Run", command=self.cancel_run, width=20).grid(row=5, column=2, padx=5, pady=5)
+        self.status_label = tk.Label(buttons_frame, text="Idle", font=("Arial", 10))
+        self.status_label.grid(row=6, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        tk.Button(buttons_frame, text="Cancel All", command=self.cancel_all_runs, width=20).grid(row=6, column=2, padx=5, pady=5)
     def apply_building_configuration(self, building_type, building_number):
         '''  Applies the selected building configuration to the GUI fields.
             - Updates the simulation parameters based on the chosen building type 
@@ -293,6 +262,7 @@ class HeatPumpSimulationApp:
                 if key in self.gui_entries:
                     self.gui_entries[key].delete(0, tk.END)
                     self.gui_entries[key].insert(0, value)
+        self.update_estimate()
 
     def create_graphs_frame(self):
         '''
@@ -397,6 +367,12 @@ class HeatPumpSimulationApp:
         self.cop_avg_label = self.add_label(self.output_frame, "COP Average: --", 1, 0)
         self.heat_loss_avg_label = self.add_label(self.output_frame, "Total Heat Loss: --kWh", 1, 1)
         self.hot_water_avg_label = self.add_label(self.output_frame, "Hot Water Demand Average: -- kWh", 1, 2)
+        # Pump cycling of the latest run (starts, run lengths, short cycles and hourly duty cycle)
+        self.cycling_label = tk.Label(self.output_frame, text="Pump Cycling: --", font=("Arial", 10, "bold"), justify="left")
+        self.cycling_label.grid(row=2, column=0, columnspan=3, sticky="w")
+        # Surrogate estimate of the values in the fields (updated as they change, before Run Simulation)
+        self.estimate_label = tk.Label(self.output_frame, text="", font=("Arial", 10), justify="left")
+        self.estimate_label.grid(row=3, column=0, columnspan=3, sticky="w")
 
         # Create heat load figure
         self.fig_heat_load = Figure(figsize=(5, 4))  # Create a figure for the heat load graph with dimensions 5x4 inches
@@ -413,13 +389,13 @@ class HeatPumpSimulationApp:
         # Embed the heat load plot into the output frame
         self.canvas_heat_load = FigureCanvasTkAgg(self.fig_heat_load, master=self.output_frame)  # Embed the figure in the GUI
         self.canvas_heat_load.draw()  # Render the figure for display
-        self.canvas_heat_load.get_tk_widget().grid(row=3, column=0, padx=5, pady=5, sticky="w")  
-        # Place the graph in the output frame at row 3, column 0 with padding and left alignment
+        self.canvas_heat_load.get_tk_widget().grid(row=4, column=0, padx=5, pady=5, sticky="w")  
+        # Place the graph in the output frame at row 4, column 0 with padding and left alignment
 
         # Create heat pump status figure
         self.fig_hp_status = Figure(figsize=(5, 4))
         self.ax_hp_status = self.fig_hp_status.add_subplot(111)
-        self.ax_hp_status.set_title("Heat Pump Status Over 24 Hours", fontsize=12, fontweight="bold")
+        self.ax_hp_status.set_title("Heat Pump Status Over Time", fontsize=12, fontweight="bold")
         self.ax_hp_status.set_xlabel("Time (hours)", fontsize=10)
         self.ax_hp_status.set_ylabel("Heat Pump Status", fontsize=10)
         self.ax_hp_status.grid(True, linestyle="--", alpha=0.5)
@@ -427,12 +403,12 @@ class HeatPumpSimulationApp:
         # Embed the heat pump status plot into the output frame
         self.canvas_hp_status = FigureCanvasTkAgg(self.fig_hp_status, master=self.output_frame)
         self.canvas_hp_status.draw()
-        self.canvas_hp_status.get_tk_widget().grid(row=3, column=1, padx=5, pady=5, sticky="w")
+        self.canvas_hp_status.get_tk_widget().grid(row=4, column=1, padx=5, pady=5, sticky="w")
 
     def create_hot_water_demand_frame(self):
         # Create Hot Water Demand Frame
         self.hot_water_demand_frame = tk.LabelFrame(self.output_frame, text="Hot Water Demand")
-        self.hot_water_demand_frame.grid(row=3, column=2, columnspan=2, padx=10, pady=10, sticky="nw")
+        self.hot_water_demand_frame.grid(row=4, column=2, columnspan=2, padx=10, pady=10, sticky="nw")
         self.hot_water_demand_frame.grid_remove()  # Hide initially
 
         # Create hot water demand figure
@@ -462,66 +438,30 @@ class HeatPumpSimulationApp:
         try:
             if not os.path.exists(self.yaml_sim_file_path):
                 raise FileNotFoundError(f"The file {self.yaml_sim_file_path} was not found.")
-            # Open the YAML file and load its contents
-            with open(self.yaml_sim_file_path, "r") as input_file:
-                inputs_gui = yaml.safe_load(input_file)
-
-            # Mapping of YAML keys to GUI entry names
-            #This ensures the data is correctly linked to the corresponding GUI field
-            yaml_to_gui_mapping = {
-                'building_properties.wall_area.value': 'wall_area',
-                'building_properties.wall_U_value.value': 'wall_u_value',
-                'building_properties.roof_area.value': 'roof_area',
-                'building_properties.roof_U_value.value': 'roof_u_value',
-                'hot_water_tank.mass_of_water.value': 'mass_of_water',
-                'building_properties.indoor_setpoint_temperature_K.value': 'indoor_setpoint',
-                'heat_pump.on_temperature_threshold_K.value': 'on_threshold',
-                'heat_pump.off_temperature_threshold_K.value': 'off_threshold',
-                'initial_conditions.initial_tank_temperature_K.value': 'initial_tank_temp',
-                'hot_water_tank.heat_loss_coefficient.value': 'heat_loss_coefficient',
-                'heat_pump.overall_heat_transfer_coefficient.value': 'heat_transfer_coefficient',
-                'heat_pump.heat_transfer_area.value': 'heat_transfer_area',
-                'heat_pump.fixed_condenser_temperature_K.value': 'fixed_condenser_temperature_K',
-                'hot_water_tank.specific_heat_capacity.value': 'specific_heat_capacity',
-            }
-          # Iterate through the mapping to populate GUI fields and store the input values
-            for yaml_key, gui_key in yaml_to_gui_mapping.items():
-                value = self.get_nested_value(inputs_gui, yaml_key.split('.'))
-                if gui_key in self.gui_entries:
-                    self.gui_entries[gui_key].delete(0, tk.END)
-                    self.gui_entries[gui_key].insert(0, value)
-                # Store all input values regardless of GUI entries
-                self.input_values[gui_key] = float(value)
-                # Set default tank_length to 1 meter if not in the YAML file
-            if 'tank_length' in self.gui_entries:
-                self.gui_entries['tank_length'].delete(0, tk.END)
-                self.gui_entries['tank_length'].insert(0, "1")
-                self.input_values['tank_length'] = 1.0
+            # Read the file exactly as a headless run does (input values, settings, solver profile and run history),
+            # starting from empty values and default solver settings so nothing is left over from before a reset
+            self.input_values = {}
+            self.solver_settings = dict(SOLVER_PROFILE_DEFAULTS)
+            self.load_inputs()
+            # Set default tank_length to 1 meter, as it is not in the YAML file
+            self.input_values['tank_length'] = 1.0
+            # Fill the GUI fields from the values just read
+            for gui_key, entry in self.gui_entries.items():
+                value = self.input_values[GUI_TO_INPUT_KEYS.get(gui_key, gui_key)]
+                entry.delete(0, tk.END)
+                entry.insert(0, int(value) if value.is_integer() else value)
+            self.update_estimate()
 
         except Exception as e:
            messagebox.showerror("Error", f"Failed to load inputs: {e}")
 
-    def get_nested_value(self, data, keys):
-        """
-        "Fetch a value from a nested dictionary using a list of keys. Returns the value at the specified path or an empty dictionary if any key is missing."
-        """
-        for key in keys:
-            data = data.get(key, {})
-        return data
-    
-    def initialise_tank_params(self):
-        # Finding the Real U_loss
-        water_volume = float(self.gui_entries['mass_of_water'].get()) / 1000 #density of water is assumed to be 1000kg/m³
-        tank_length = float(self.gui_entries['tank_length'].get()) #Gather from the GUI
-        # Finding the radius of the water tank
-        water_tank_radius = np.sqrt(water_volume/(tank_length*np.pi))
-        # Surface area of a cylinder = A=2πrh+2πr²
-        tank_area = 2 * np.pi * water_tank_radius * tank_length + 2 * np.pi * water_tank_radius **2
-        # Tank area is related to the amount of heat lost in the system
-        self.real_U_loss = float(self.gui_entries['heat_loss_coefficient'].get()) * tank_area
-
     #This function will be played when the run simulation button is pressed
     def run_simulation(self):
+        '''
+        Queues a run of the values in the fields. The run is solved in the background (simulation_worker) so
+        the window can still be used, and more runs queued, while it computes. The plots and metrics are
+        updated when it finishes (poll_results).
+        '''
         try:
             # Fetch start and end dates
             start_datetime = datetime.strptime(f"{self.start_date.get()} {self.start_hour.get()}", "%Y-%m-%d %H:%M")
@@ -529,17 +469,110 @@ class HeatPumpSimulationApp:
 
             # Fetch input values from GUI
             self.fetch_input_values()
-
-            # Initialize and run the simulation
-            self.reset_simulation_data()
-            self.initialise_tank_params()
-            self.initialize_simulation(start_datetime, end_datetime)
-            self.calculate_metrics()
-            self.update_plots()
-            self.display_metrics()
+            self.check_run_settings(start_datetime, end_datetime)
 
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            return
+
+        run = {'start': start_datetime, 'end': end_datetime, 'model': self.make_run_model(),
+               'cancel': threading.Event(), 'stage': "waiting", 'fraction': 0.0}
+        run['model'].cancel_event = run['cancel']
+        run['model'].progress_callback = lambda stage, fraction: self.result_queue.put(("progress", run, (stage, fraction)))
+        self.queued_runs.append(run)
+        self.run_queue.put(run)
+        self.show_status()
+
+    def make_run_model(self):
+        # A separate model with a copy of the current settings, so the worker thread never changes the model the plots are drawn from
+        model = HeatPumpModel(input_values=dict(self.input_values), building_number=self.building_number,
+                              include_hot_water_demand=self.include_hot_water_demand.get(),
+                              yaml_sim_file_path=self.yaml_sim_file_path, yaml_cop_file_path=self.yaml_cop_file_path,
+                              weather_file=self.weather_file, rng=self.rng)
+        for name in ("building_model", "output_grid", "energy_accounting", "location", "cop_map_file", "control_mode",
+                     "carbon_intensity_file", "tariff_file"):
+            setattr(model, name, getattr(self, name))
+        model.solver_settings = dict(self.solver_settings)
+        model.stage_cache = self.stage_cache  # Only the worker thread runs models, so the cache is never used by two runs at once
+        return model
+
+    def simulation_worker(self):
+        '''
+        Background thread: solves the queued runs one at a time (weather, COP fit, ODE and metrics).
+        Nothing here touches Tk; progress, finished runs and errors go to result_queue instead.
+        '''
+        while True:
+            run = self.run_queue.get()
+            try:
+                run['model'].initialize_simulation(run['start'], run['end'])
+                run['model'].report_progress("calculating metrics", 1.0)
+                run['model'].calculate_metrics()
+                self.result_queue.put(("finished", run, None))
+            except SimulationCancelled:
+                self.result_queue.put(("cancelled", run, None))
+            except Exception as e:
+                self.result_queue.put(("failed", run, str(e)))
+
+    def poll_results(self):
+        # Main thread: applies the progress and finished runs reported by the worker, then checks again in POLL_MS
+        try:
+            while True:
+                kind, run, detail = self.result_queue.get_nowait()
+                if kind == "progress":
+                    run['stage'], run['fraction'] = detail
+                    continue
+                self.queued_runs.remove(run)
+                if kind == "finished" and not run['cancel'].is_set():
+                    self.show_run(run['model'])
+                elif kind == "failed":
+                    messagebox.showerror("Error", f"An error occurred: {detail}")
+        except queue.Empty:
+            pass
+        self.show_status()
+        self.root.after(POLL_MS, self.poll_results)
+
+    def show_run(self, model):
+        # Takes over a finished run (adding it to the run history) and updates the plots and metrics
+        # that are out of date (the stages whose results differ from the ones drawn)
+        self.reset_simulation_data()
+        self.adopt_results(model)
+        self.run_hot_water = model.include_hot_water_demand
+        stale = {stage for stage, fingerprint in model.stage_fingerprints.items() if self.shown_stages.get(stage) != fingerprint}
+        self.shown_stages = dict(model.stage_fingerprints)
+        self.update_plots(stale)
+        if "metrics" in stale:
+            self.display_metrics()
+        self.update_estimate()
+
+    def show_status(self):
+        # Progress bar and status line for the run being solved and the runs waiting behind it
+        if not self.queued_runs:
+            self.progress_bar['value'] = 0.0
+            self.status_label.config(text="Idle")
+            return
+        run = self.queued_runs[0]
+        stage = "cancelling" if run['cancel'].is_set() else run['stage']
+        waiting = len(self.queued_runs) - 1
+        self.progress_bar['value'] = run['fraction']
+        self.status_label.config(text=f"{stage[0].upper()}{stage[1:]} ({100 * run['fraction']:.0f} %)"
+                                      + (f", {waiting} more queued" if waiting else ""))
+
+    def cancel_run(self):
+        # Cancels the run being solved (the runs queued after it still run)
+        if self.queued_runs:
+            self.queued_runs[0]['cancel'].set()
+        self.show_status()
+
+    def cancel_all_runs(self):
+        # Cancels the run being solved and every queued run
+        for run in self.queued_runs:
+            run['cancel'].set()
+        self.show_status()
+
+    def close_window(self):
+        # Stops the background runs with the window
+        self.cancel_all_runs()
+        self.root.destroy()
 
     def fetch_input_values(self):
         """
@@ -547,7 +580,11 @@ class HeatPumpSimulationApp:
             and updates the `self.input_values` dictionary. These values are
             converted to floats for numerical calculations in the simulation.
         """
-        self.input_values.update({
+        self.input_values.update(self.read_input_fields())
+
+    def read_input_fields(self):
+        # Values of the GUI fields under their input_values names (raises ValueError for a field that is not a number)
+        return {
             'wall_area': float(self.gui_entries['wall_area'].get()),
             'wall_u_value': float(self.gui_entries['wall_u_value'].get()),
             'roof_area': float(self.gui_entries['roof_area'].get()),
@@ -561,7 +598,34 @@ class HeatPumpSimulationApp:
             'overall_heat_transfer_coefficient': float(self.gui_entries['heat_transfer_coefficient'].get()),
             'fixed_condenser_temperature_K': float(self.gui_entries['fixed_condenser_temperature_K'].get()),
             'tank_length': float(self.gui_entries['tank_length'].get())
-        })
+        }
+
+    def update_estimate(self):
+        '''
+        Shows the surrogate estimate of the daily energy, average COP and minimum tank temperature for the
+        values in the fields. The outdoor temperatures of the last run are used (typical sweep weather before
+        the first run). The estimate turns red, with the reason, when the full simulation should be run instead
+        (also when the sweep it learned from used another control mode, building model or COP map).
+        '''
+        if self.surrogate is None:
+            return
+        try:
+            features = {**self.input_values, **self.read_input_fields()}
+        except ValueError:
+            self.estimate_label.config(text="Estimate: -- (a field is not a number)", fg="black")
+            return
+        features['include_hot_water_demand'] = float(self.include_hot_water_demand.get())
+        if len(getattr(self, 'outdoor_temp_K_array', [])):
+            features.update(self.weather_summary())
+        settings = {'control_mode': self.control_mode, 'building_model': self.building_model,
+                    'cop_map_file': self.cop_map_file or ""}
+        estimates, errors, reasons = self.surrogate.predict(features, settings)
+        text = (f"Estimate: {estimates['daily_energy_kWh']:.2f} ± {errors['daily_energy_kWh']:.2f} kWh/day, "
+                f"COP {estimates['COP_average']:.2f} ± {errors['COP_average']:.2f}, "
+                f"min tank {estimates['min_tank_temperature_K'] - 273.15:.1f} ± {errors['min_tank_temperature_K']:.1f} °C")
+        if reasons:
+            text += "\nRun the full simulation: " + "; ".join(reasons)
+        self.estimate_label.config(text=text, fg="red" if reasons else "black")
 
     def reset_simulation_data(self):
         """
@@ -585,13 +649,16 @@ class HeatPumpSimulationApp:
                 - Reloads YAML input values to initialize the application with default parameters.
 
         """
+        self.cancel_all_runs() # Runs still in the queue would otherwise be drawn after the reset
+        self.shown_stages = {} # Every figure is cleared, so the next run redraws all of them
         attributes_to_clear = [
             self.energy_array,self.q_transfer_array,self.cop_array,self.dT_ambient_list,self.pump_status,self.q_loss_list,
-            self.q_load_array,self.run_temps,self.run_times,
+            self.q_load_array,
             ]
 
         for attr in attributes_to_clear:
             attr.clear()
+        self.clear_run_history() # Stored runs (and any spilled to disk)
             
         self.outdoor_temp_K_array = []
         self.ax_cop.clear()
@@ -656,25 +723,19 @@ class HeatPumpSimulationApp:
         self.hot_water_avg_label.grid()  # Ensure it is visible after reset
         
         self.include_hot_water_demand.set(False) #Uncheck tick box
+        self.run_hot_water = False
         self.hot_water_demand_frame.grid_remove()
         
-    def initialize_simulation(self, start_datetime, end_datetime):
-        # Define constants
-        self.Pump_Power = 2000  # W
-        self.condenserT = 60 + 273.15  # K #Condenser Temperature
-        self.steps_each_hour = 30
-        self.pump_switch = False  # Start with pump Off
-        self.graph_colors = plt.cm.tab10.colors
-        
-        # Store total simulation time
-        self.total_seconds = (end_datetime - start_datetime).total_seconds()
-        # Validate that the simulation duration is exactly 24 hours
-        if self.total_seconds != 86400:  # 24 hours = 86400 seconds
+    def check_run_settings(self, start_datetime, end_datetime):
+        # Validate the simulation duration: after the start, and at most MAX_RUN_DAYS long
+        duration_s = (end_datetime - start_datetime).total_seconds()
+        if duration_s <= 0 or duration_s > MAX_RUN_DAYS * 86400:
             messagebox.showerror(
                 "Invalid Duration",
-                "The simulation requires exactly 24 hours. Please adjust your start and end times."
+                f"The end must be after the start, and a run can be at most {MAX_RUN_DAYS} days long. "
+                "Please adjust your start and end times."
             )
-            raise ValueError("Simulation duration must be exactly 24 hours.") 
+            raise ValueError(f"Simulation duration must be between 1 hour and {MAX_RUN_DAYS} days.")
         
         CheckingCondenserTemp=float(self.gui_entries['fixed_condenser_temperature_K'].get()) 
 
@@ -684,329 +745,25 @@ class HeatPumpSimulationApp:
                 "Fixed condenser temperature must be above 60°C (333.15K)"
             )
             raise ValueError("Simulation Parameters invalid") 
-        # Load COP data from the YAML file
-        # The file path is specified by 'self.yaml_cop_file_path'
-        with open(self.yaml_cop_file_path) as cop_file:
-            cop_data = yaml.safe_load(cop_file)  # Parse the YAML file into a Python dictionary
-
-        # Extract the noisy COP values from the loaded data
-        # 'COP_noisy' contains the Coefficient of Performance values from the dataset
-        self.COPData = [entry['COP_noisy'] for entry in cop_data['heat_pump_cop_data']]
-
-        # Extract the corresponding outdoor temperatures (in °C) from the dataset
-        # These temperatures are needed to analyze the relationship between outdoor conditions and COP
-        outdoor_temps = [entry['outdoor_temp_C'] for entry in cop_data['heat_pump_cop_data']]
-        
-        #Finding Temperature Difference between condenser and outside temp
-        self.deltaT_array = [self.condenserT - (temp + 273.15) for temp in outdoor_temps]
-
-        # Fit COP function
-        self.A, self.B = curve_fit(self.COPFunction, self.deltaT_array, self.COPData)[0]
-        
-        # Extract weather data
-        self.outdoor_temp_K_array = self.extract_weather_data(start_datetime, end_datetime)
-
-        # Calculate Q load values
-        self.calculate_q_load_values()
-
-        # Solve ODE
-        self.solve_ode(start_datetime, end_datetime)
-
-    ''' Collecting Weather Data'''
-    def extract_weather_data(self, start_datetime, end_datetime):
-        # Define the location based on longitude and latitude defined at the start
-        location = Point(55.9533, -3.1883)  # EDINBURGH
-        # Fetch hourly temperature data
-        weather_data = Hourly(location, start_datetime, end_datetime)
-        weather_data = weather_data.fetch()
-        outdoor_temp_list = weather_data['temp'].values #Only need temperature
-        # Converting each outdoor temperature (from manufacturer) into a deltaT value and appending to list.
-        outdoor_temp_K_array = [temp + 273.15 for temp in outdoor_temp_list]
-        return outdoor_temp_K_array
-    
-    # Function that finds COP based on temperature difference between condenser and outdoors
-    def COPFunction(self, delta_T, A, B):
-        return A + B / delta_T
-
-    # Determines the Q_load for each outside temperature (T_amb) value entered.
-    def find_heat_load(self, TAmb):
-        '''The heat load, Q_load is the heat used to heat up the Room/House. 
-            It is based on the equation:
-            
-            Q_load = A_w * U_w * (T_amb - T_sp) + A_r * U_r * (T_amb - T_sp)
-            
-        where:
-            A_w   :  Wall area (m²)
-            U_w   :  Wall U-value (W/m²K)
-            A_r   :  Roof area (m²)
-            U_r   :  Roof U-value (W/m²K)
-            T_amb :  Ambient outdoor temperature (K)
-            T_sp  :  Indoor setpoint temperature (K)
-
-        Only ambient outdoor temperature varies.
-        Q load units will be in Watts (W)
-        '''
-        wall_area = self.input_values['wall_area']
-        wall_u_value = self.input_values['wall_u_value']
-        roof_area = self.input_values['roof_area']
-        roof_u_value = self.input_values['roof_u_value']
-        TSetP = self.input_values['indoor_setpoint_temperature_K']
-        Q_load = wall_area * wall_u_value * (TAmb - TSetP) + roof_area * roof_u_value * (TAmb - TSetP)
-        return Q_load
-    
-    # with the outdoor temperature in kelvin this function is used to determine the necessary Q_load.
-    def calculate_q_load_values(self):
-        self.q_load_array.clear()
-        self.dT_ambient_list.clear()
-        for TAmb in self.outdoor_temp_K_array:
-            Q_load = self.find_heat_load(TAmb)
-            dT_ambient = TAmb - self.input_values['indoor_setpoint_temperature_K']
-            self.q_load_array.append(Q_load)
-            self.dT_ambient_list.append(dT_ambient)
-
-    
-    def combined_heat_load(self, t, TAmb):
-        '''
-        The combined heat load accounts for both the building's heat load (Q_load) and the 
-        stochastic hot water demand. It calculates the net heat load based on the following:
-            
-            1. Building heat load (Q_load): The energy required to maintain the desired indoor
-            setpoint temperature (T_sp) considering the ambient temperature (T_amb), wall
-            area, roof area, and their respective U-values. Unit : Watts
-            
-            2. Hot water demand: This is a time-varying component representing the energy
-            required to heat water for usage (e.g., showers, taps). It is stochastic and depends
-            on the building's usage pattern. Unit : Watts 
-            
-            3. Net heat load: The total heat demand minus the hot water demand.
-            
-        Formula:
-            Net Heat Load = Q_load - Hot Water Demand (MINUS BECAUSE QLOAD is negative)
-                
-       '''
-        self.hot_water_demand = self.generate_hot_water_demand()
-        index = int((t / 3600) * self.time_steps / self.total_hours) % len(self.hot_water_demand)
-        Q_load = self.find_heat_load(TAmb)
-        return Q_load - self.hot_water_demand[index]
-    
-    def update_pump_status(self, Temp_tank):
-        '''
-        The heat pump is turned off when T_tank is higher than the off threshold (T_off),
-        and vice versa for turning on the tank.
-        
-        The heat into the tank (Q_transfer) follows the equation:
-            
-            if heat pump is on:
-                
-                Q_transfer = U_cond * A_cond * (T_cond - T_tank)
-            
-            if heat pump is off:
-                
-                Q_transfer = 0
-            
-        '''
-        if Temp_tank <= self.input_values['on_temperature_threshold_K']:
-            self.pump_switch = True #Turn on heat pump
-        elif Temp_tank >= self.input_values['off_temperature_threshold_K']:
-            self.pump_switch = False #Turn off heat pump
-    #Finding Q_Transfer
-    def get_Q_transfer(self, Temp_tank, TAmb):
-        '''
-        Heat input from the heat pump, Q_hp. We assume that all the 
-        heat from the heat pump is transferred into the heat tank (Q_hp = Q_transfer)
-                
-        where:
-            U_cond  :  Overall heat transfer coefficient (W/m²K)
-            A_cond  :  Heat transfer area (m²)
-            T_cond  :  Fixed temperature of the condenser (K)
-            T_tank  :  Temperature of the water in the tank (K)
-            
-        '''
-        self.update_pump_status(Temp_tank) #Determine if pump is on or not
-        if self.pump_switch:
-            Q_max = self.max_Q_hp(TAmb) # Finding possible maximum Q
-            U_cond = self.input_values['overall_heat_transfer_coefficient']
-            A_cond = self.input_values['heat_transfer_area']
-            #Q Transfer Formula as mention before. Q Transfer is in terms of Watts
-            Q_transf = U_cond * A_cond * (self.input_values['fixed_condenser_temperature_K'] - Temp_tank) #Watts
-            if Q_transf > Q_max:
-                Q_transf = Q_max #Watts
-        else:
-            Q_transf = 0
-        self.q_transfer_array.append(Q_transf)
-        return Q_transf
-            
-        # Find maximum heat output based on current conditions. We set heat pump power as 2000 which is based on the power supply
-        # for a typical household. We can determine the maximum heat output with the following equation : Q_max = COP * Pump_power
-    def max_Q_hp(self, TAmb):
-        COP = self.COPFunction(self.input_values['fixed_condenser_temperature_K'] - TAmb, self.A, self.B)
-        Q_max = COP * self.Pump_Power #Watts
-        return Q_max
-
-    def get_Q_loss(self, Temp_tank, TAmb):
-        #Define heat loss in system to be used in the ODE
-        '''Aside from thermal load and supply, the tank also loses heat to the surroundings. '''
-        Q_loss = self.real_U_loss * (Temp_tank - TAmb) #Watts
-        self.q_loss_list.append(Q_loss) #Store it in an array for the performance metrics calculation later on
-        return Q_loss
-
-    def find_T_ambient(self, t):
-        hour = int(abs(t) // 3600)# Finds the hour in which the time is taken. Use floor division to get only hour number
-        if hour < len(self.outdoor_temp_K_array):# Gives ambient outdoor temperature based on time
-            return self.outdoor_temp_K_array[hour]
-        else:
-            return self.outdoor_temp_K_array[-1]
-        
-    def tank_ode(self, t, Temp_tank):
-        """
-        Step 5 combines the supply, extraction, and loss of heat from the Thermal Energy Supply (TES).
-        We also take into account heat loss to the surroundings. 
-        
-        The temperature change in the tank can be modelled with the ODE:
-            
-            d(T_tank)/dt = (Q_hp + Q_load - Q_loss)/(M_water * c_water)
-            
-        where:
-            M_water :  Mass of water in tank (kg)
-            c_water      : Specific heat capacity of water (J/kg·K)
-
-        Note: we add the value of Q_load as it is given as a negative value
-            : we use the equation with M_water as M_water is a given input parameter
-        """
-        # Step 1: Find the ambient temperature at the current time (t).
-        TAmb = self.find_T_ambient(t)
-
-        # Step 2: Calculate the heat transferred into the tank by the heat pump (Q_transfer).
-        Q_transfer = self.get_Q_transfer(Temp_tank, TAmb)
-        
-        # Step 3: Compute the heat lost to the surroundings (Q_loss).
-        Q_loss = self.get_Q_loss(Temp_tank, TAmb)
-        
-        # Step 4: Compute the heat load (Q_load), including hot water demand if enabled.
-        if self.include_hot_water_demand.get():
-                Q_load = self.combined_heat_load(t, TAmb)  # Net heat load (building + hot water demand).
-        else:
-                Q_load = self.find_heat_load(TAmb)  # Heat load from building only.
 
-        # Step 5: Define constants for water's specific heat capacity and the mass of water in the tank.
-        c_water = self.input_values['specific_heat_capacity']  # Specific heat capacity of water (J/kg·K).
-        MassWater = self.input_values['mass_of_water']  # Mass of water in the tank (kg).
+    def hot_water_included(self):
+        # Hot water demand of the run being shown (the checkbox is read when a run is queued and may have changed since)
+        return self.run_hot_water
 
-        # Step 6: Calculate the rate of temperature change using the ODE formula.
-        # This considers heat inputs (Q_transfer), heat loads (Q_load), and heat losses (Q_loss).
-        dT_tankdt = (Q_transfer + Q_load - Q_loss) / (MassWater * c_water)
-
-        return dT_tankdt
-
-    def solve_ode(self, start_datetime, end_datetime):
-        # Solve ODE for tank temperature dynamics over the simulation period.
-        # Initial condition for the ODE (starting tank temperature)
-        y0 = [self.input_values['initial_tank_temperature_K']]
-
-        ODE_solution = solve_ivp(
-            self.tank_ode,  # ODE function
-            t_span=(0, self.total_seconds), # Time range (start to end in seconds)
-            y0=y0,# Initial condition
-            max_step=3600 / self.steps_each_hour # Maximum step size
-        )
-        # Store results for plotting and analysis
-        self.run_times.append(ODE_solution.t)
-        self.run_temps.append(ODE_solution.y[0])
-
-# TASK C : PERFORMANCE Metrics
-    def calculate_metrics(self):
-        # Only calculate metrics for the latest run
-        '''
-        Calculates key performance metrics for the heating system, including average and total energy consumption, average COP
-        , average heat loss, and hot water demand energy (if applicable).
-
-        '''
-        # Retrieve the latest tank temperatures and timestamps
-        temp_tank_list = self.run_temps[-1]
-        time_list = self.run_times[-1]
-        # Initialize arrays to store computed data
-        energyarray = []  # Stores energy consumption at each timestep
-        q_transfer_array = []  # Stores heat transfer data
-        cop_array = []  # Tracks COP values
-        q_loss_list = []  # Tracks heat loss over time
-        pump_status_list = []  # Tracks heat pump on/off status
-        pump_switch = False  # Initial pump status
-        # Define threshold Temperature for pump control
-        on_threshold = math.floor(self.input_values['on_temperature_threshold_K'])
-        off_threshold = math.floor(self.input_values['off_temperature_threshold_K'])
-
-        for i in range(len(temp_tank_list)):
-            Temp_tank = temp_tank_list[i] #Tank temp at i
-            t = time_list[i] #Time at i
-            TAmb = self.find_T_ambient(t) #Ambient temperature at t
-
-            # Update pump status
-            if round(Temp_tank) <= on_threshold:
-                pump_switch = True
-            elif round(Temp_tank) >= off_threshold:
-                pump_switch = False
-            pump_status_list.append(int(pump_switch))
-
-            # Compute Q_transfer
-            if pump_switch:
-                Q_max = self.max_Q_hp(TAmb)
-                U_cond = self.input_values['overall_heat_transfer_coefficient']
-                A_cond = self.input_values['heat_transfer_area']
-                Q_transf = U_cond * A_cond * (self.input_values['fixed_condenser_temperature_K'] - Temp_tank)
-                if Q_transf > Q_max:
-                    Q_transf = Q_max #Limit Q_transfer to maximum capacity if necessary
-            else:
-                Q_transf = 0
-
-            # Compute Q_loss: heat lost to the surroundings
-            Q_loss = self.get_Q_loss(Temp_tank, TAmb)
-
-            # Compute COP based on temperature difference
-            delta_T = self.input_values['fixed_condenser_temperature_K'] - TAmb
-            COP = self.COPFunction(delta_T, self.A, self.B)
-            cop_array.append(COP)
-
-            # Compute Energy Consumption
-            if COP > 0:
-                energy = Q_transf / COP
-                energyarray.append(energy)
-                
-            else:
-                energyarray.append(0)
-            # Append computed values to respective arrays    
-            q_transfer_array.append(Q_transf)
-            q_loss_list.append(Q_loss)
-
-         # Store computed data in class attributes
-        self.pump_status = pump_status_list
-        self.energy_array = energyarray
-        self.q_transfer_array = q_transfer_array
-        self.cop_array = cop_array
-        self.q_loss_list = q_loss_list
-        self.time_cop_array = np.array(time_list)
-
-        # Calculate performance metrics
-        self.energy_metrics = {
-            "average": statistics.fmean(energyarray) / 1000,  # Average energy consumption in kW, computed by finding the mean of `energyarray` (in Watts) and converting to kW.
-            "total": sum(energyarray) / (self.steps_each_hour * 1000)  # Total energy consumption in kWh, calculated by summing `energyarray` (in Joules/second), averaging per hour, and converting to kW.
-            }
-        self.COP_average = sum(cop_array) / len(cop_array)  # Average COP over the simulation
-        
-        # Compute total heat loss and calculate the average heat loss in kWh
-        self.Q_loss_average = sum(q_loss_list) / (1000*self.steps_each_hour)  #in kW
-            #`self.Q_loss_average` calculates the average heat loss in kilowatts (kW) by summing `q_loss_list` (J/s),
-            #dividing by `self.steps_each_hour` for hourly average, and converting to kW by dividing by 1000.
-        if self.include_hot_water_demand.get():
-            # Total hot water demand in kWh. Similar calculations to Energy
-            self.total_HotWater = (sum(self.hot_water_demand) / 1000)/self.steps_each_hour
-
-    def update_plots(self):
+    def update_plots(self, stages=None):
         # Update GUI plots with latest simulation data.
-        self.plot_cop_data()
+        # Only the plots of the given pipeline stages are redrawn (all of them if stages is None).
+        # The tank temperature plot shows every run in the history, so it is always redrawn.
+        stages = set(HeatPumpModel.PIPELINE_STAGES) if stages is None else stages
+        if "cop" in stages:
+            self.plot_cop_data()
         self.plot_temperature_over_time()
-        self.plot_heat_load_over_deltaT()
-        self.update_cop_over_time_plot()
-        self.update_hot_water_demand_plot()
+        if "heat_load" in stages:
+            self.plot_heat_load_over_deltaT()
+        if "metrics" in stages:
+            self.update_cop_over_time_plot()
+        if "hot_water" in stages:
+            self.update_hot_water_demand_plot()
 
     def plot_cop_data(self):
         '''
@@ -1014,15 +771,7 @@ class HeatPumpSimulationApp:
         Includes data points and the best-fit line.
         '''
         self.ax_cop.clear()
-        self.ax_cop.scatter(self.deltaT_array, self.COPData, label="Data Points", color="royalblue", edgecolor="black", s=50)
-        x = np.linspace(min(self.deltaT_array), max(self.deltaT_array), 200)
-        y = [self.COPFunction(i, self.A, self.B) for i in x]
-        self.ax_cop.plot(x, y, label="Best Fit Line", color="darkorange", linewidth=2, linestyle='--')
-        self.ax_cop.set_title("COP vs Temperature Difference", fontsize=16, fontweight='bold')
-        self.ax_cop.set_xlabel(r"Temperature Difference ($\Delta T$ in °C)", fontsize=14)  # Add delta and degree symbols
-        self.ax_cop.set_ylabel("COP", fontsize=14)
-        self.ax_cop.grid(True, linestyle='--', alpha=0.6)
-        self.ax_cop.legend(fontsize=12, loc="best")
+        draw_cop_fit(self.ax_cop, self)
         self.canvas_cop.draw()
 
     def update_threshold_values_from_GUI(self):
@@ -1032,40 +781,24 @@ class HeatPumpSimulationApp:
         '''
         threshold_on = float(self.gui_entries['on_threshold'].get()) - 273.15
         threshold_off = float(self.gui_entries['off_threshold'].get()) - 273.15
-        threshold_on_list = [threshold_on] * len(self.run_times)
-        threshold_off_list = [threshold_off] * len(self.run_times)
+        run_count = len(self.spilled_runs) + len(self.run_times) # Runs on the plot, including those spilled to disk
+        threshold_on_list = [threshold_on] * run_count
+        threshold_off_list = [threshold_off] * run_count
         return threshold_on_list, threshold_off_list
 
     def plot_temperature_over_time(self):
         '''
-        Plots the tank temperature over time for each simulation run.
+        Plots the tank temperature over time for each simulation run, including runs spilled to disk.
         Includes temperature thresholds as horizontal lines.
         '''
         self.ax_temp_over_time.clear()
         threshold_on_list, threshold_off_list = self.update_threshold_values_from_GUI()
         #Allow the user to plot as many graph as they want to. Allowing them to compare between 2 different graphs
-        for run_index, (time_data, temp_data) in enumerate(zip(self.run_times, self.run_temps)):
-            # Plot the temperature over time
-            elapsed_hours = time_data / 3600 
-            temps_in_celsius = [temp - 273.15 for temp in temp_data]
-            color = self.graph_colors[run_index % len(self.graph_colors)] #Pick a different color for next simulation
-            label = f'Run {run_index + 1}'
-            self.ax_temp_over_time.plot(elapsed_hours, temps_in_celsius, color=color, linewidth=2, label=label)
-
-            # Plot the threshold lines
-            threshold_on = threshold_on_list[run_index]
-            threshold_off = threshold_off_list[run_index]
-            self.ax_temp_over_time.axhline(y=threshold_on, color=color, linestyle='--', alpha=0.8)
-            self.ax_temp_over_time.axhline(y=threshold_off, color=color, linestyle='--', alpha=0.8)
-
-        self.ax_temp_over_time.set_title("Tank Temperature Vs Time", fontsize=16, fontweight="bold")
-        self.ax_temp_over_time.set_xlabel("Time (hours)", fontsize=14)
-        self.ax_temp_over_time.set_ylabel("Temperature (°C)", fontsize=14)
-        self.ax_temp_over_time.grid(True, linestyle="--", alpha=0.5)
-        # Position the legend on the right side of the graph
-        self.ax_temp_over_time.legend(
-        fontsize=10, loc="center left", bbox_to_anchor=(1, 0.5)
-        )
+        # Run numbers keep counting when old runs are dropped, thresholds are converted back to K for the shared plot
+        runs = [(run_number, time_data, temp_data, threshold_on + 273.15, threshold_off + 273.15)
+                for (run_number, time_data, temp_data), threshold_on, threshold_off
+                in zip(self.history_runs(), threshold_on_list, threshold_off_list)]
+        draw_tank_temperature(self.ax_temp_over_time, runs, self.graph_colors)
         self.canvas_temp.draw()
 
     def plot_heat_load_over_deltaT(self):
@@ -1073,11 +806,7 @@ class HeatPumpSimulationApp:
         Plots the heat load of the building as a function of the temperature difference (ΔT).
         '''
         self.ax_heat_load.clear()
-        self.ax_heat_load.plot(self.dT_ambient_list, self.q_load_array, label="Heat Load vs ΔT", color="royalblue", linewidth=2)
-        self.ax_heat_load.set_title("Heat Load vs ΔT", fontsize=16, fontweight="bold")
-        self.ax_heat_load.set_xlabel("ΔT (K)", fontsize=14)
-        self.ax_heat_load.set_ylabel("Heat Load (W)", fontsize=14)
-        self.ax_heat_load.grid(True, linestyle="--", alpha=0.6)
+        draw_heat_load(self.ax_heat_load, self)
         self.canvas_heat_load.draw()
 
     def update_cop_over_time_plot(self):
@@ -1085,13 +814,7 @@ class HeatPumpSimulationApp:
         Plots the Coefficient of Performance (COP) as a function of time over the simulation period.
         '''
         self.ax_cop_time.clear()
-        time_in_hours = self.time_cop_array / 3600
-        self.ax_cop_time.plot(time_in_hours, self.cop_array, label="COP Over Time", color="royalblue", linewidth=2)
-        self.ax_cop_time.set_title("COP Over Time", fontweight="bold", fontsize=16)
-        self.ax_cop_time.set_xlabel("Time (hours)", fontsize=14)
-        self.ax_cop_time.set_ylabel("COP", fontsize=14)
-        self.ax_cop_time.grid(True, linestyle="--", alpha=0.6)
-        self.ax_cop_time.legend(fontsize=12, loc="best")
+        draw_cop_over_time(self.ax_cop_time, self)
         self.canvas_cop.draw()
 
     def update_hot_water_demand_plot(self):
@@ -1099,100 +822,15 @@ class HeatPumpSimulationApp:
         Updates the hot water demand plot based on the generated stochastic demand.
         Hides the plot if hot water demand is not included in the simulation.
         '''
-        if self.include_hot_water_demand.get():
+        if self.hot_water_included():
             self.hot_water_demand_frame.grid()
-            hot_water_demand = self.generate_hot_water_demand()
-            time = np.linspace(0, 24, len(hot_water_demand))
             self.ax_hot_water.clear()
-            self.ax_hot_water.plot(time, hot_water_demand/1000, label="Stochastic Hot Water Demand", color="blue", linewidth=2)
-            self.ax_hot_water.grid(True, linestyle="--", linewidth=0.5, alpha=0.7)
-            self.ax_hot_water.set_title("Hot Water Demand Profile", fontsize=14, fontweight="bold")
-            self.ax_hot_water.set_xlabel("Time (hours)", fontsize=12)
-            self.ax_hot_water.set_ylabel("Hot Water Demand (kW)", fontsize=12) #Hot water demand is measured in terms of kWh
-            self.ax_hot_water.legend(loc="upper right", fontsize=10, frameon=True, borderpad=1)
+            draw_hot_water_demand(self.ax_hot_water, self) # Same profile that was used in the simulation
             self.canvas_hot_water.draw()
             
         else:
             self.hot_water_demand_frame.grid_remove()
 
-    def generate_hot_water_demand(self):
-        '''
-        Generates a stochastic hot water demand profile over the simulation period.
-
-        Steps:
-            1. Creates a base demand using a normal distribution (in kW).
-            2. Ensures demand values are non-negative by clipping to zero.
-            3. Applies a bias factor based on a human usage pattern, which depends on the hour of the day
-            and the building type (e.g., office, townhall, or apartment).
-            4. Combines base demand with the bias to create the final demand profile.
-        '''
-        #Base demand (in W) using a normal distribution
-        # - loc=0.1: Mean demand is 0.1 W
-        # - scale=0.05: Standard deviation is 0.05 W
-        base_demand = np.random.normal(loc=0.1, scale=0.05, size=self.time_steps)  # (kW)
-
-        # Step 2: Ensure all demand values are non-negative by clipping below-zero values to 0
-        base_demand = np.clip(base_demand, 0, None)
-
-        # Step 3: Apply a human usage pattern bias based on hour and building type
-        demand_profile = []
-        for i in range(self.time_steps):
-            hour = (i / 60) % 24  # Convert timestep index to hour of the day
-            bias = self.human_usage_pattern(hour, self.building_number)  # Bias factor (unitless multiplier)
-            demand_profile.append(base_demand[i] * bias*1000)  # Final demand = base demand × bias
-
-        # Step 4: Return the demand profile as a numpy array (in kW)
-        return np.array(demand_profile)
-
-    def human_usage_pattern(self, hour, building_number):
-        """
-        Parameters:
-            hour (float): Hour of the day (0-24). Units: hours.
-            building_number (int): Type of building. Options:
-                0 = Library
-                1 = Modern Office Building
-                2 = Industrial Warehouse
-                3 = Normal Apartment (We are assuming this)
-            int: Bias factor (unitless multiplier) to adjust the base demand profile.
-                    """
-        if building_number == 1 :  # Modern Office Building & Warehouse
-        # Office usage pattern
-            if 0 <= hour < 8 or 18 <= hour < 24:
-                return 0  # No water demand during off-hours
-            elif 12 <= hour < 14:
-                return 2.5  # Peak usage during lunch hours
-            else:
-                return 1  # Moderate usage during working hours
-        elif  building_number == 2:  # Modern Office Building & Warehouse
-        # Office usage pattern
-            if 0 <= hour < 8 or 18 <= hour < 24:
-                return 0.5  # Industrial warehouse is operating 24/7
-            elif 12 <= hour < 14:
-                return 2.5  # Peak usage during lunch hours
-            else:
-                return 1.25  # Moderate usage during working hours
-        elif building_number == 0:  # Library
-            # Library usage pattern
-            if 0 <= hour < 8 or 18 <= hour < 24:
-                return 0  # No water demand during off-hours
-            elif 12 <= hour < 14:
-                return 2.5  # Peak usage during lunch hours
-            else:
-                return 1.25  # Moderate usage during working hours
-
-        else:  # Default (Modelling an apartment)
-            # Default usage pattern
-            if 6 <= hour < 9:
-                return 1.4# Peak usage during morning hours (showers, cooking, cleaning)
-            elif 18 <= hour < 21:
-                return 1.75  # Peak usage during evening hours (showers, cooking, laundry)
-            elif 21 <= hour <= 24:
-                return 1.05  # Moderate usage during late evening (wrapping up daily activities)
-            elif 9 <= hour <= 18:
-                return 0.5  # Low usage during daytime (occupants typically out of home)
-            else:
-                return 0  # Minimal usage during nighttime/off-hours
-
     def display_metrics(self):
         '''
         Updates and displays performance metrics and plots in the GUI.
@@ -1201,22 +839,31 @@ class HeatPumpSimulationApp:
             - Updates the heat pump status plot for visualization.
        '''
         self.energy_avg_label.config(text=f"Average: {self.energy_metrics['average']:.2f} kW")
-        self.energy_total_label.config(text=f"Total: {self.energy_metrics['total']:.2f} kWh")
+        # Emissions and cost only when inputs.yaml gives a carbon intensity or tariff file
+        charges = "".join(text for name, text in (("carbon_kgCO2", f", {self.energy_metrics.get('carbon_kgCO2', 0):.2f} kgCO2"),
+                                                  ("energy_cost", f", cost {self.energy_metrics.get('energy_cost', 0):.2f}"))
+                          if name in self.energy_metrics)
+        self.energy_total_label.config(text=f"Total: {self.energy_metrics['total']:.2f} kWh{charges}")
         self.cop_avg_label.config(text=f"COP Average: {self.COP_average:.2f}")
         self.heat_loss_avg_label.config(text=f"Total Heat Loss: {self.Q_loss_average:.2f} kW")
         
-        if self.include_hot_water_demand.get():
+        if self.hot_water_included():
             self.hot_water_avg_label.config(text=f"Hot Water Demand Total: {self.total_HotWater:.2f} kWh")
         else: 
             self.hot_water_avg_label.config(text="Hot Water Demand Average: --kWh")
+        # Pump cycling: short cycles wear the compressor, so they are shown in red
+        cycling = self.cycling_summary()
+        on_minutes = "--" if math.isnan(cycling['mean_on_minutes']) else f"{cycling['mean_on_minutes']:.1f}"
+        off_minutes = "--" if math.isnan(cycling['mean_off_minutes']) else f"{cycling['mean_off_minutes']:.1f}"
+        self.cycling_label.config(
+            text=f"Pump Cycling: {cycling['pump_starts']} starts ({cycling['starts_per_hour']:.2f}/h, "
+                 f"most in an hour {cycling['max_starts_in_an_hour']}), mean on {on_minutes} min / off {off_minutes} min, "
+                 f"short cycles {cycling['short_cycles']}, hourly duty cycle {cycling['duty_cycle_p10']:.0%}-"
+                 f"{cycling['duty_cycle_p90']:.0%} (median {cycling['duty_cycle_p50']:.0%})",
+            fg="red" if cycling['short_cycles'] else "black")
         # Update Heat Pump Status Plot
         self.ax_hp_status.clear()
-        time_in_hours = self.time_cop_array / 3600
-        self.ax_hp_status.plot(time_in_hours, self.pump_status)
-        self.ax_hp_status.set_title("Heat Pump Status Over Time", fontsize=12, fontweight="bold")
-        self.ax_hp_status.set_xlabel("Time (hours)")
-        self.ax_hp_status.set_ylabel("Heat Pump Status")
-        self.ax_hp_status.grid(True)
+        draw_pump_status(self.ax_hp_status, self)
         self.canvas_hp_status.draw()
 
 # Entry point to initialize and launch the Heat Pump Simulation Application
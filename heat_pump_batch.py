@@ -0,0 +1,543 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Batch runs (parameter sweeps and scenario files) of the heat pump simulation.
+'''
+
+''' Purpose: Runs many scenarios of the headless HeatPumpModel, optionally on several worker processes, and
+writes one row of metrics per scenario to a CSV file. Sweeps can be checkpointed, so a sweep that is
+interrupted (crash or pre-empted batch node) carries on from the last finished scenario instead of starting again.
+
+Scenarios come either from a grid of swept parameters (--vary) or from a scenario file with one scenario per
+record: JSON Lines (.jsonl) or multi-document YAML (documents separated by ---). Each record uses the same
+layout as inputs.yaml, plus a few optional settings:
+
+    name: small-library
+    building_type: Library              # Library, Modern Office Building, Industrial Warehouse or Apartment
+    location: {latitude: 55.95, longitude: -3.19}
+    start: 2024-01-01
+    end: 2024-01-02
+    include_hot_water_demand: true
+    building_properties:
+      wall_U_value: {value: 0.25}       # or simply  wall_U_value: 0.25
+    hot_water_tank:
+      mass_of_water: 180
+      tank_length: 0.8
+
+Anything not given keeps its value from the building type preset, then from inputs.yaml, including the settings of
+its simulation_parameters, heat_pump.cop_map_file and grid sections (for swept scenarios as well).
+
+Examples:
+
+    python heat_pump_batch.py sweep --start 2024-01-01 --end 2024-01-02 --vary wall_u_value=0.2,0.35,0.5 --vary mass_of_water=150,200,250 --output sweep.csv --checkpoint sweep.ckpt
+    python heat_pump_batch.py run --scenarios scenarios.jsonl --start 2024-01-01 --end 2024-01-02 --workers 8 --output results.csv
+    python heat_pump_batch.py sweep --start 2024-01-01 --end 2024-01-08 --vary mass_of_water=150,300 --carbon-file carbon.csv --tariff-file tariff.csv --output costs.csv
+    python heat_pump_batch.py run --scenarios scenarios.jsonl --start 2024-01-01 --end 2025-01-01 --event-logs logs --output year.csv
+
+With --event-logs every on/off scenario is run on the "events" output grid and its event log (a few hundred kB for
+a year, see EventLog in heat_pump_model.py) is saved as scenario_<index>.npz, so the whole sweep can be kept and
+any run looked at again later without running it again.
+
+'''
+
+## Importing Modules ##
+
+import csv  # Import to write the results file
+import os  # Import to check that COP map files exist
+import json  # Import to read JSON Lines scenario files
+import math  # Import to check that numbers are finite
+import time  # Import to time checkpoints (wall clock)
+import argparse  # Import to read command line options
+import itertools  # Import to build every combination of the swept parameters and to read scenarios in blocks
+import multiprocessing  # Import to run scenarios on several worker processes
+import sys  # Import for writing progress to the terminal
+from datetime import date, datetime, timedelta  # Import datetime to handle date and time operations
+import numpy as np
+
+from heat_pump_model import (HeatPumpModel, DEFAULT_INPUTS_FILE, YAML_INPUT_KEYS, BUILDING_CONFIGURATIONS,
+                             BUILDING_NUMBERS, GUI_TO_INPUT_KEYS, save_checkpoint, load_checkpoint, clear_checkpoint,
+                             BUILDING_MASS_DEFAULTS, CONTROLLER_DEFAULTS, parse_datetime, load_solver_profile, load_yaml_file)
+
+
+# Scenario fields that follow the inputs.yaml layout. tank_length is not in inputs.yaml (the GUI defaults it to 1 m)
+# but can be set per scenario under hot_water_tank.
+SCENARIO_KEYS = dict(YAML_INPUT_KEYS)
+SCENARIO_KEYS['hot_water_tank.tank_length.value'] = 'tank_length'
+# Fields of inputs.yaml that are accepted in a scenario but are not simulation inputs
+IGNORED_SCENARIO_KEYS = {'hot_water_tank.total_thermal_capacity.value'} # Always mass of water x specific heat capacity
+
+# Settings of a scenario that are not input_values. Everything else in a scenario is an input value.
+SCENARIO_SETTINGS = ("name", "building_number", "include_hot_water_demand", "latitude", "longitude", "start", "end",
+                     "total_time_seconds", "output_grid", "energy_accounting", "building_model", "cop_map_file",
+                     "control_mode", "solver_profile", "carbon_intensity_file", "tariff_file")
+
+# Fields of inputs.yaml (and of scenario files) that are words or file names, stored in a scenario under their field name
+WORD_SETTING_KEYS = ("simulation_parameters.output_grid.value", "simulation_parameters.energy_accounting.value",
+                     "simulation_parameters.building_model.value", "simulation_parameters.control_mode.value",
+                     "simulation_parameters.solver_profile.value", "heat_pump.cop_map_file.value",
+                     "grid.carbon_intensity_file.value", "grid.tariff_file.value")
+
+# Number of scenarios handed to the workers at a time. Scenario files are read one block ahead,
+# so memory does not grow with the size of the file.
+SCENARIOS_PER_WORKER_BLOCK = 16
+
+# Settings shared by every scenario of a sweep, set once in each worker process by init_worker
+_worker_settings = {}
+
+
+def make_model(scenario, base_inputs, rng=None, weather_file=None):
+    '''
+    Builds a HeatPumpModel for one scenario. A scenario is a dictionary of input_values to change
+    (e.g. {"wall_u_value": 0.3}) and may also contain any of SCENARIO_SETTINGS.
+    Anything not in the scenario keeps its value from base_inputs.
+    '''
+    scenario = dict(scenario)
+    settings = {name: scenario.pop(name) for name in SCENARIO_SETTINGS if name in scenario}
+    input_values = dict(base_inputs)
+    input_values.update({key: float(value) for key, value in scenario.items()})
+    model = HeatPumpModel(input_values=input_values, building_number=int(settings.get("building_number", 3)),
+                          include_hot_water_demand=bool(settings.get("include_hot_water_demand", False)),
+                          weather_file=weather_file, rng=rng)
+    if "latitude" in settings:
+        model.location = (settings["latitude"], settings["longitude"])
+    if settings.get("solver_profile"):
+        # Applied first so an output_grid given in the scenario itself still wins over the profile's
+        model.solver_profile_file = settings["solver_profile"]
+        model.apply_solver_profile(load_solver_profile(settings["solver_profile"]))
+    model.output_grid = settings.get("output_grid", model.output_grid)
+    model.energy_accounting = settings.get("energy_accounting", model.energy_accounting)
+    model.building_model = settings.get("building_model", model.building_model)
+    model.cop_map_file = settings.get("cop_map_file", model.cop_map_file)
+    model.control_mode = settings.get("control_mode", model.control_mode)
+    model.carbon_intensity_file = settings.get("carbon_intensity_file", model.carbon_intensity_file)
+    model.tariff_file = settings.get("tariff_file", model.tariff_file)
+    return model
+
+
+def scenario_dates(scenario, start_datetime, end_datetime):
+    # Start and end of a scenario: its own dates if it has them, otherwise the dates of the sweep
+    start = parse_datetime(scenario["start"]) if scenario.get("start") else start_datetime
+    if scenario.get("end"):
+        end = parse_datetime(scenario["end"])
+    elif scenario.get("total_time_seconds"):
+        end = start + timedelta(seconds=scenario["total_time_seconds"])
+    else:
+        end = end_datetime
+    if start is None or end is None:
+        raise ValueError(f"Scenario '{scenario.get('name', '')}' has no start or end date and the sweep has none either.")
+    return start, end
+
+
+def init_worker(base_inputs, weather_file, start_datetime, end_datetime, event_log_dir=None):
+    # Runs once in each worker process (and once in the main process for a single worker run)
+    _worker_settings.update(base_inputs=base_inputs, weather_file=weather_file,
+                            start_datetime=start_datetime, end_datetime=end_datetime, event_log_dir=event_log_dir)
+
+
+def run_scenario(task):
+    '''
+    Runs one scenario and returns its results row. `task` is (index, scenario, seed); the seed
+    gives the scenario its own hot water demand draw, so results do not depend on which worker
+    ran it or in which order.
+    '''
+    index, scenario, seed = task
+    settings = _worker_settings
+    start, end = scenario_dates(scenario, settings["start_datetime"], settings["end_datetime"])
+    model = make_model(scenario, settings["base_inputs"], rng=np.random.default_rng(seed),
+                       weather_file=settings["weather_file"])
+    event_log_dir = settings.get("event_log_dir")
+    if event_log_dir and model.control_mode == "on_off":
+        model.output_grid = "events" # Only on/off runs have an event log
+    model.initialize_simulation(start, end)
+    model.calculate_metrics()
+    logged = {}
+    if event_log_dir:
+        logged["event_log"] = ""
+        if model.event_log is not None:
+            logged["event_log"] = os.path.join(event_log_dir, f"scenario_{index}.npz")
+            model.event_log.save(logged["event_log"])
+    # Same columns for every scenario: settings, every input value, the outdoor temperatures, then the metrics
+    return {
+        "scenario": index,
+        "name": scenario.get("name", ""),
+        "building_number": model.building_number,
+        "include_hot_water_demand": model.include_hot_water_demand,
+        "building_model": model.building_model,
+        "control_mode": model.control_mode,
+        "cop_map_file": model.cop_map_file or "",
+        # Solver and accounting settings, so a row can be run again exactly as it was (heat_pump_report.py --results)
+        "output_grid": model.output_grid,
+        "energy_accounting": model.energy_accounting,
+        "solver_profile": model.solver_profile_file or "",
+        "carbon_intensity_file": model.carbon_intensity_file or "",
+        "tariff_file": model.tariff_file or "",
+        "latitude": model.location[0],
+        "longitude": model.location[1],
+        "start": start.isoformat(sep=" "),
+        "end": end.isoformat(sep=" "),
+        "seed": seed, # Lets a scenario be run again exactly, e.g. for its report (heat_pump_report.py)
+        **logged,
+        **model.input_values,
+        **model.weather_summary(),
+        **model.results_summary(),
+        **model.cycling_summary(),
+        **model.accounting_summary(),
+    }
+
+
+def run_sweep(scenarios, start_datetime, end_datetime, results_path, base_inputs=None, weather_file=None, seed=None,
+              checkpoint_path=None, checkpoint_every=60.0, progress=None, workers=1, event_log_dir=None):
+    '''
+    Runs every scenario and writes one row per scenario (scenario index, settings, every input value
+    and the metrics from results_summary) to results_path, in scenario order. start_datetime and
+    end_datetime are used for scenarios that do not have their own dates.
+
+    The scenarios can be any iterable, including a generator reading a scenario file, and are read
+    one block at a time. With workers > 1 each block is shared between that many worker processes.
+    Each scenario gets its own seed for the hot water demand, drawn in order from one generator
+    seeded with `seed`, so results are the same for any number of workers.
+
+    With a checkpoint_path, the sweep index, the length of the results file and the state of the
+    seed generator are saved every `checkpoint_every` seconds (wall clock). If a checkpoint already
+    exists, finished scenarios are skipped and the results file is cut back to the checkpoint, so the
+    resumed sweep gives the same results as an uninterrupted one.
+    With an event_log_dir the event log of every on/off scenario is saved there (see run_scenario).
+    Returns the number of scenarios in the results file.
+    '''
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=DEFAULT_INPUTS_FILE).input_values
+    rng = np.random.default_rng(seed) # Draws one seed per scenario; its state is saved in the checkpoint
+
+    resume = load_checkpoint(checkpoint_path)
+    if resume is not None and resume.get("kind") != "sweep":
+        raise ValueError(f"{checkpoint_path} is not a checkpoint of a sweep.")
+    start_index = 0
+    if resume is not None:
+        start_index = resume["index"]
+        rng.bit_generator.state = resume["rng_state"]
+
+    def tasks():
+        # (index, scenario, seed) for every scenario not finished before the checkpoint
+        for index, scenario in enumerate(scenarios):
+            if index >= start_index:
+                yield index, scenario, int(rng.integers(2**63))
+
+    if event_log_dir:
+        os.makedirs(event_log_dir, exist_ok=True)
+    init_worker(base_inputs, weather_file, start_datetime, end_datetime, event_log_dir)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=init_worker,
+                                    initargs=(base_inputs, weather_file, start_datetime, end_datetime, event_log_dir))
+    try:
+        with open(results_path, "r+" if resume is not None else "w", newline="") as results_file:
+            if resume is not None:
+                results_file.seek(resume["csv_bytes"])
+                results_file.truncate()
+            writer = None
+            last_save = time.monotonic()
+            row_count = start_index
+            pending = tasks()
+            block_size = SCENARIOS_PER_WORKER_BLOCK * workers
+            while True:
+                block = list(itertools.islice(pending, block_size))
+                if not block:
+                    break
+                rows = pool.imap(run_scenario, block) if pool is not None else map(run_scenario, block)
+                for row in rows:
+                    if writer is None:
+                        writer = csv.DictWriter(results_file, fieldnames=list(row))
+                        if resume is None:
+                            writer.writeheader()
+                    writer.writerow(row)
+                    row_count = row["scenario"] + 1
+                    if progress is not None:
+                        progress(row_count)
+                # Checkpoints are only taken between blocks, when every drawn seed has its row written
+                if checkpoint_path is not None and time.monotonic() - last_save >= checkpoint_every:
+                    results_file.flush()
+                    save_checkpoint(checkpoint_path, {"kind": "sweep", "index": row_count, "csv_bytes": results_file.tell(),
+                                                      "rng_state": rng.bit_generator.state})
+                    last_save = time.monotonic()
+    finally:
+        if pool is not None:
+            pool.terminate()
+    clear_checkpoint(checkpoint_path)
+    return row_count
+
+
+def grid_scenarios(varied_values):
+    '''
+    Every combination of the swept parameters, generated lazily.
+    varied_values maps a parameter name to the list of values to try, e.g.
+    {"wall_u_value": [0.2, 0.3], "mass_of_water": [150, 200]} gives 4 scenarios.
+    '''
+    names = list(varied_values)
+    for values in itertools.product(*(varied_values[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def read_scenarios(scenario_path, base_inputs=None):
+    '''
+    Reads a scenario file one record at a time and yields each record as a validated scenario
+    (see validate_scenario). Files ending in .jsonl or .ndjson are JSON Lines, anything else is
+    multi-document YAML read with the C-accelerated loader when it is available. The file is never
+    loaded whole, so files with hundreds of thousands of scenarios start running immediately.
+    '''
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=DEFAULT_INPUTS_FILE).input_values
+    if scenario_path.endswith((".jsonl", ".ndjson")):
+        with open(scenario_path, "r") as scenario_file:
+            for line_number, line in enumerate(scenario_file, 1):
+                if not line.strip():
+                    continue
+                where = f"{scenario_path} line {line_number}"
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as error:
+                    raise ValueError(f"{where}: {error}") from None
+                yield validate_scenario(record, base_inputs, where)
+    else:
+        import yaml  # Import to parse YAML scenario files
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader) # libyaml when PyYAML was built with it
+        with open(scenario_path, "r") as scenario_file:
+            for document_number, record in enumerate(yaml.load_all(scenario_file, Loader=loader), 1):
+                if record is None:
+                    continue # Empty document, e.g. a trailing ---
+                yield validate_scenario(record, base_inputs, f"{scenario_path} document {document_number}")
+
+
+def validate_scenario(record, base_inputs, where="scenario"):
+    '''
+    Checks one scenario record and turns it into the flat form used by run_sweep: input_values
+    names for the physical inputs plus SCENARIO_SETTINGS. Values may be written as in inputs.yaml
+    ({value: x, comment: ...}) or as plain numbers. Raises ValueError naming the record on any
+    unknown field, bad number or impossible combination (e.g. on threshold above off threshold).
+    '''
+    if not isinstance(record, dict):
+        raise ValueError(f"{where}: a scenario must be a mapping, not {type(record).__name__}.")
+    record = dict(record)
+    scenario = {}
+
+    # Building type first, so explicit values in the record override its preset
+    building_type = record.pop("building_type", None)
+    if building_type is not None:
+        if building_type not in BUILDING_NUMBERS:
+            raise ValueError(f"{where}: unknown building_type '{building_type}'. Use one of {', '.join(BUILDING_NUMBERS)}.")
+        scenario["building_number"] = BUILDING_NUMBERS[building_type]
+        for gui_key, value in BUILDING_CONFIGURATIONS.get(building_type, {}).items():
+            scenario[GUI_TO_INPUT_KEYS.get(gui_key, gui_key)] = float(value)
+
+    for name in ("name", "include_hot_water_demand"):
+        if name in record:
+            scenario[name] = record.pop(name)
+    if "include_hot_water_demand" in scenario and not isinstance(scenario["include_hot_water_demand"], bool):
+        raise ValueError(f"{where}: include_hot_water_demand must be true or false.")
+
+    location = record.pop("location", None)
+    if location is not None:
+        latitude, longitude = (location["latitude"], location["longitude"]) if isinstance(location, dict) else location
+        latitude, longitude = float(latitude), float(longitude)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError(f"{where}: location ({latitude}, {longitude}) is not a valid latitude and longitude.")
+        scenario["latitude"], scenario["longitude"] = latitude, longitude
+
+    for name in ("start", "end"):
+        if name in record:
+            when = record.pop(name)
+            if isinstance(when, date) and not isinstance(when, datetime):
+                when = datetime(when.year, when.month, when.day) # YAML reads 2024-01-01 as a date
+            scenario[name] = when.isoformat(sep=" ") if isinstance(when, datetime) else parse_datetime(str(when)).isoformat(sep=" ")
+    if "start" in scenario and "end" in scenario and scenario["end"] <= scenario["start"]:
+        raise ValueError(f"{where}: end must be after start.")
+
+    # Sections with the same layout as inputs.yaml
+    for section, fields in record.items():
+        if not isinstance(fields, dict):
+            raise ValueError(f"{where}: unknown field '{section}'.")
+        for field, entry in fields.items():
+            key = f"{section}.{field}.value"
+            value = entry.get("value") if isinstance(entry, dict) else entry
+            if key in IGNORED_SCENARIO_KEYS:
+                continue
+            if key == "simulation_parameters.total_time_seconds.value":
+                scenario["total_time_seconds"] = float(value)
+            elif key in WORD_SETTING_KEYS:
+                scenario[field] = value
+            elif key in SCENARIO_KEYS:
+                try:
+                    number = float(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"{where}: {section}.{field} must be a number, not {value!r}.") from None
+                if not math.isfinite(number):
+                    raise ValueError(f"{where}: {section}.{field} must be finite.")
+                scenario[SCENARIO_KEYS[key]] = number
+            else:
+                raise ValueError(f"{where}: unknown field '{section}.{field}'.")
+
+    check_scenario_values({**base_inputs, **scenario}, where)
+    return scenario
+
+
+def check_scenario_values(values, where="scenario"):
+    # Checks on the combined values (scenario on top of the defaults). Raises ValueError naming `where`
+    for name in ("wall_area", "wall_u_value", "roof_area", "roof_u_value", "heat_loss_coefficient", "time_points"):
+        if values[name] < 0:
+            raise ValueError(f"{where}: {name} cannot be negative.")
+    for name in ("mass_of_water", "tank_length", "specific_heat_capacity", "heat_transfer_area", "overall_heat_transfer_coefficient"):
+        if values[name] <= 0:
+            raise ValueError(f"{where}: {name} must be positive.")
+    if values["on_temperature_threshold_K"] >= values["off_temperature_threshold_K"]:
+        raise ValueError(f"{where}: the on threshold must be below the off threshold.")
+    if values["fixed_condenser_temperature_K"] < 333.15:
+        raise ValueError(f"{where}: fixed condenser temperature must be above 60°C (333.15K).")
+    if values.get("output_grid", "uniform") not in ("uniform", "dense", "solver", "events"):
+        raise ValueError(f"{where}: output_grid must be uniform, dense, solver or events.")
+    if values.get("output_grid") == "events" and values.get("control_mode", "on_off") != "on_off":
+        raise ValueError(f"{where}: the events output grid needs the on_off control mode.")
+    if values.get("energy_accounting", "states") not in ("states", "samples"):
+        raise ValueError(f"{where}: energy_accounting must be states or samples.")
+    if values.get("building_model", "steady") not in ("steady", "rc"):
+        raise ValueError(f"{where}: building_model must be steady or rc.")
+    if values.get("control_mode", "on_off") not in ("on_off", "modulating"):
+        raise ValueError(f"{where}: control_mode must be on_off or modulating.")
+    for name in CONTROLLER_DEFAULTS:
+        if name != "part_load_cop_gain" and values.get(name, CONTROLLER_DEFAULTS[name]) < 0:
+            raise ValueError(f"{where}: {name} cannot be negative.")
+    if values.get("min_compressor_power_W", CONTROLLER_DEFAULTS["min_compressor_power_W"]) >= \
+            values.get("max_compressor_power_W", CONTROLLER_DEFAULTS["max_compressor_power_W"]):
+        raise ValueError(f"{where}: the minimum compressor power must be below the maximum compressor power.")
+    if values.get("controller_integral_time_s", CONTROLLER_DEFAULTS["controller_integral_time_s"]) <= 0:
+        raise ValueError(f"{where}: controller_integral_time_s must be positive.")
+    if values.get("cop_map_file") and not os.path.exists(values["cop_map_file"]):
+        raise ValueError(f"{where}: COP map file {values['cop_map_file']} was not found.")
+    if values.get("solver_profile") and not os.path.exists(values["solver_profile"]):
+        raise ValueError(f"{where}: solver profile {values['solver_profile']} was not found.")
+    for name in ("carbon_intensity_file", "tariff_file"):
+        if values.get(name) and not os.path.exists(values[name]):
+            raise ValueError(f"{where}: {name} {values[name]} was not found.")
+    for name in BUILDING_MASS_DEFAULTS:
+        if values.get(name, BUILDING_MASS_DEFAULTS[name]) <= 0:
+            raise ValueError(f"{where}: {name} must be positive.")
+
+
+def parse_vary(text):
+    # "wall_u_value=0.2,0.3,0.4" -> ("wall_u_value", [0.2, 0.3, 0.4])
+    name, values = text.split("=", 1)
+    return name.strip(), [float(value) for value in values.split(",")]
+
+
+def add_accounting_arguments(parser):
+    # Carbon intensity and tariff files for every scenario (a scenario's own files win)
+    parser.add_argument("--carbon-file", default=None, help="CSV of hourly carbon intensity (columns time, carbon_intensity in gCO2/kWh)")
+    parser.add_argument("--tariff-file", default=None, help="CSV of hourly electricity prices (columns time, price per kWh)")
+
+
+def inputs_file_settings(inputs_path=DEFAULT_INPUTS_FILE):
+    '''
+    The WORD_SETTING_KEYS set in inputs.yaml (output grid, energy accounting, building model, control mode,
+    solver profile, COP map file and grid files) as scenario settings. Every scenario of a batch or fleet run
+    starts from these, like a single run, so inputs.yaml is never silently ignored; settings left null are
+    left out.
+    '''
+    inputs = load_yaml_file(inputs_path)
+    settings = {}
+    for key in WORD_SETTING_KEYS:
+        section, field, _ = key.split(".")
+        entry = (inputs.get(section) or {}).get(field)
+        value = entry.get("value") if isinstance(entry, dict) else entry
+        if value is not None:
+            settings[field] = value
+    check_scenario_values({**HeatPumpModel(yaml_sim_file_path=inputs_path).input_values, **settings}, inputs_path)
+    return settings
+
+
+def with_inputs_file_settings(scenarios, inputs_path=DEFAULT_INPUTS_FILE):
+    # Scenarios on top of the inputs.yaml settings: anything a scenario gives itself (or the command line) wins
+    settings = inputs_file_settings(inputs_path)
+    profile_grids = {}  # Output grid of each solver profile used (None if it has none)
+    for scenario in scenarios:
+        inherited = dict(settings)
+        profile = scenario.get("solver_profile") or settings.get("solver_profile")
+        if profile and profile not in profile_grids:
+            profile_grids[profile] = load_solver_profile(profile).get("output_grid")
+        if profile and profile_grids[profile]:
+            inherited.pop("output_grid", None) # A solver profile's output grid wins over inputs.yaml's, as in load_inputs
+        yield {**inherited, **scenario}
+
+
+def with_accounting_files(scenarios, carbon_intensity_file=None, tariff_file=None):
+    # Scenarios with the carbon intensity and tariff files of the run, unless they give their own
+    files = {name: path for name, path in (("carbon_intensity_file", carbon_intensity_file), ("tariff_file", tariff_file)) if path}
+    for name, path in files.items():
+        if not os.path.exists(path):
+            raise ValueError(f"{name} {path} was not found.")
+    return (({**files, **scenario} for scenario in scenarios) if files else scenarios)
+
+
+def load_scenarios(scenario_path=None, varied_values=None, inputs_path=DEFAULT_INPUTS_FILE, base_inputs=None,
+                   carbon_intensity_file=None, tariff_file=None):
+    '''
+    The scenarios of a run: every record of a scenario file (read_scenarios), every combination of
+    varied_values (grid_scenarios), or just the inputs file itself when neither is given. A varied name that is not
+    one of base_inputs raises ValueError, as an unknown field in a scenario file does. Each one is put on top
+    of the carbon intensity and tariff files of the command line and then of the settings of inputs_path
+    (with_inputs_file_settings). Every tool that runs scenarios reads them here, so a scenario file gives the
+    same runs whichever tool it is given to.
+    '''
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=inputs_path).input_values
+    if scenario_path:
+        scenarios = read_scenarios(scenario_path, base_inputs)
+    elif varied_values:
+        for name in varied_values:
+            if name not in base_inputs:
+                raise ValueError(f"--vary: unknown input '{name}'. Use one of {', '.join(sorted(base_inputs))}.")
+        scenarios = grid_scenarios(varied_values)
+    else:
+        scenarios = [{}]
+    return with_inputs_file_settings(with_accounting_files(scenarios, carbon_intensity_file, tariff_file), inputs_path)
+
+
+def add_common_arguments(parser):
+    # Options shared by the sweep and run commands
+    parser.add_argument("--output", required=True, help="Results CSV file")
+    parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the hot water demand")
+    add_accounting_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file. An existing checkpoint is resumed")
+    parser.add_argument("--checkpoint-every", type=float, default=60.0, help="Seconds between checkpoints (wall clock)")
+    parser.add_argument("--event-logs", default=None, help="Directory to save the event log of every on/off scenario in")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch runs of the heat pump simulation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sweep_parser = subparsers.add_parser("sweep", help="Run every combination of the --vary parameters")
+    sweep_parser.add_argument("--start", type=parse_datetime, required=True, help="Start date, e.g. 2024-01-01")
+    sweep_parser.add_argument("--end", type=parse_datetime, required=True, help="End date, e.g. 2024-01-02")
+    sweep_parser.add_argument("--vary", type=parse_vary, action="append", required=True,
+                              help="Parameter and values to sweep, e.g. wall_u_value=0.2,0.3 (repeat for more parameters)")
+    add_common_arguments(sweep_parser)
+
+    run_parser = subparsers.add_parser("run", help="Run every scenario of a scenario file (.jsonl or multi-document YAML)")
+    run_parser.add_argument("--scenarios", required=True, help="Scenario file")
+    run_parser.add_argument("--start", type=parse_datetime, default=None, help="Start date for scenarios without one")
+    run_parser.add_argument("--end", type=parse_datetime, default=None, help="End date for scenarios without one")
+    add_common_arguments(run_parser)
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios if args.command == "run" else None,
+                               dict(args.vary) if args.command == "sweep" else None,
+                               carbon_intensity_file=args.carbon_file, tariff_file=args.tariff_file)
+    row_count = run_sweep(scenarios, args.start, args.end, args.output, weather_file=args.weather_file, seed=args.seed,
+                          checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every, workers=args.workers,
+                          event_log_dir=args.event_logs, progress=lambda done: sys.stderr.write(f"\r{done} scenarios finished"))
+    sys.stderr.write(f"\nWrote {row_count} scenarios to {args.output}\n")
+
+
+# Entry point for batch runs
+if __name__ == "__main__":
+    main()
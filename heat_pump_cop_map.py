@@ -0,0 +1,129 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Heat pump performance maps (COP against outdoor temperature, flow temperature and part-load ratio).
+'''
+
+''' Purpose: Manufacturers give the COP of a heat pump as a table over outdoor temperature and flow (condenser)
+temperature, sometimes also over part-load ratio. COPMap holds such a table on a regular grid so a COP can be
+looked up with a few multiplications: the grid index of a point is found by arithmetic rather than by searching,
+and the COP is the bilinear (trilinear with part load) interpolation of the surrounding table values.
+
+Lookups take scalars (inside the ODE right hand side, a pure Python path with no NumPy overhead) or arrays
+that broadcast together (e.g. the outdoor temperature of every time step, or one flow temperature per building).
+Points outside the table use the nearest edge of the table; maps are not extrapolated.
+
+Map files are YAML lists with one entry per table point, like heat_pump_cop_synthetic_full.yaml:
+
+    heat_pump_cop_map:
+    - outdoor_temp_C: -20.0
+      flow_temp_C: 35.0
+      part_load_ratio: 0.3      # optional axis
+      COP: 2.61
+
+'''
+
+## Importing Modules ##
+
+# Maths
+import math  # Import for the scalar lookup (floor)
+import itertools  # Import to list the corners of a grid cell
+import numpy as np
+
+
+MAP_AXES = ("outdoor_temp_C", "flow_temp_C", "part_load_ratio")  # Axes of a map file, in table order
+
+
+class COPMap:
+    '''
+    COP table on a regular grid. `axes` are the grid values of outdoor temperature (K), flow temperature (K)
+    and optionally part-load ratio; `table` has one dimension per axis.
+    Axes that are not evenly spaced (common in data sheets) are resampled onto an even grid that still has
+    every original point on it, so the interpolated COP is unchanged (linear interpolation between the
+    original points is also linear between the extra points).
+    '''
+    def __init__(self, axes, table):
+        table = np.asarray(table, dtype=float)
+        if table.ndim != len(axes) or not 2 <= table.ndim <= 3:
+            raise ValueError("A COP map needs outdoor and flow temperature axes and optionally a part-load axis.")
+        self.axes = []
+        for dimension, axis in enumerate(axes):
+            axis = np.asarray(axis, dtype=float)
+            if len(axis) < 2 or np.any(np.diff(axis) <= 0):
+                raise ValueError("Every COP map axis needs at least two increasing values.")
+            even_axis = np.linspace(axis[0], axis[-1], self.even_point_count(axis))
+            if len(even_axis) != len(axis) or not np.allclose(even_axis, axis):
+                table = np.apply_along_axis(lambda values: np.interp(even_axis, axis, values), dimension, table)
+            self.axes.append(even_axis)
+        self.table = table
+        self.start = [float(axis[0]) for axis in self.axes]
+        self.step = [float(axis[1] - axis[0]) for axis in self.axes]
+        self.last_cell = [len(axis) - 2 for axis in self.axes]  # Index of the last cell along each axis
+        self.table_list = table.tolist()  # Nested lists for the scalar lookup
+        self.corners = list(itertools.product((0, 1), repeat=table.ndim))
+        self.has_part_load = table.ndim == 3
+
+    @staticmethod
+    def even_point_count(axis, max_points=2001):
+        # Fewest evenly spaced points from the first to the last value of axis that include every value of axis
+        offsets = (axis - axis[0]) / (axis[-1] - axis[0])
+        for cells in range(len(axis) - 1, max_points):
+            if np.allclose(offsets * cells, np.round(offsets * cells), atol=1e-6):
+                return cells + 1
+        return max_points # No exact grid this fine: close enough for a data sheet
+
+    @classmethod
+    def from_entries(cls, entries):
+        # Map from a list of {outdoor_temp_C, flow_temp_C, [part_load_ratio], COP} entries covering a full grid
+        names = [name for name in MAP_AXES if name in entries[0]]
+        axes = [sorted({float(entry[name]) for entry in entries}) for name in names]
+        table = np.full([len(axis) for axis in axes], np.nan)
+        for entry in entries:
+            table[tuple(axis.index(float(entry[name])) for axis, name in zip(axes, names))] = float(entry['COP'])
+        if np.isnan(table).any():
+            raise ValueError(f"The COP map does not cover a full grid: {int(np.isnan(table).sum())} of {table.size} "
+                             f"{' x '.join(names)} points are missing.")
+        axes = [np.array(axis) + (273.15 if name.endswith("_C") else 0.0) for axis, name in zip(axes, names)]
+        return cls(axes, table)
+
+    def __call__(self, outdoor_K, flow_K, part_load=1.0):
+        '''
+        COP at outdoor temperature(s) outdoor_K and flow temperature(s) flow_K (and part-load ratio(s) if the
+        map has that axis). Scalars give a float; arrays broadcast together and give an array.
+        '''
+        point = (outdoor_K, flow_K, part_load)[:self.table.ndim]
+        if all(isinstance(value, (float, int)) or np.ndim(value) == 0 for value in point):
+            return self.scalar_lookup(point)
+        point = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in point])
+        index, fraction = [], []
+        for value, start, step, last_cell in zip(point, self.start, self.step, self.last_cell):
+            position = np.clip((value - start) / step, 0.0, last_cell + 1)
+            cell = np.minimum(position.astype(int), last_cell)
+            index.append(cell)
+            fraction.append(position - cell)
+        COP = np.zeros(point[0].shape)
+        for corner in self.corners:
+            weight = np.ones(point[0].shape)
+            for bit, part in zip(corner, fraction):
+                weight *= part if bit else 1.0 - part
+            COP += weight * self.table[tuple(cell + bit for cell, bit in zip(index, corner))]
+        return COP
+
+    def scalar_lookup(self, point):
+        # Same interpolation as __call__ for one point, in plain Python (faster than NumPy for a single value)
+        index, fraction = [], []
+        for value, start, step, last_cell in zip(point, self.start, self.step, self.last_cell):
+            position = min(max((float(value) - start) / step, 0.0), last_cell + 1.0)
+            cell = min(math.floor(position), last_cell)
+            index.append(cell)
+            fraction.append(position - cell)
+        # Interpolate along the flow temperature (and part load) axis first, then along the outdoor axis
+        COP = []
+        for row in self.table_list[index[0]:index[0] + 2]:
+            lower, upper = row[index[1]], row[index[1] + 1]
+            if self.has_part_load:
+                k, f = index[2], fraction[2]
+                lower = lower[k] + f * (lower[k + 1] - lower[k])
+                upper = upper[k] + f * (upper[k + 1] - upper[k])
+            COP.append(lower + fraction[1] * (upper - lower))
+        return COP[0] + fraction[0] * (COP[1] - COP[0])
@@ -0,0 +1,185 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Uncertainty of the fitted COP curve and what it means for the energy use.
+'''
+
+''' Purpose: The COP curve COP = A + B / ΔT is fitted to noisy data (heat_pump_cop_synthetic_full.yaml), so A and B
+are only known to within the noise. This module bootstrap-resamples the data thousands of times, refits A and B for
+every resample, then runs the simulation with a sample of those (A, B) draws to put a confidence interval on the
+energy use and the average COP.
+
+The curve is linear in A and B, so a resample does not need curve_fit: its least squares fit solves the 2 x 2 normal
+equations, weighted by how often each data point was drawn. With the draw counts of every resample as one matrix,
+all the fits are a couple of matrix products (thousands of refits in milliseconds).
+
+Every ensemble run uses the same weather and hot water demand, so the spread of the results is due to the COP curve
+alone. Runs are shared between worker processes.
+
+Examples:
+
+    python heat_pump_cop_uncertainty.py --start 2024-01-01 --end 2024-01-08 --draws 5000 --runs 200 --workers 8 --output cop_ensemble.csv
+    python heat_pump_cop_uncertainty.py --scenarios scenarios.jsonl --scenario-index 1 --start 2024-01-01 --end 2024-01-02 --confidence 90
+
+'''
+
+## Importing Modules ##
+
+import csv  # Import to write the ensemble runs and the bootstrap fits
+import argparse  # Import to read command line options
+import itertools  # Import to pick a scenario from a scenario file
+import multiprocessing  # Import to run the ensemble on several worker processes
+import sys  # Import for writing progress to the terminal
+import numpy as np
+
+from heat_pump_model import HeatPumpModel, DEFAULT_INPUTS_FILE, parse_datetime
+from heat_pump_batch import make_model, load_scenarios
+
+
+# Results of each ensemble run whose confidence intervals are reported
+ENSEMBLE_OUTPUTS = ("energy_total_kWh", "average_power_kW", "COP_average")
+
+# Settings shared by every run of an ensemble, set once in each worker process by init_ensemble_worker
+_ensemble_worker = {}
+
+
+def bootstrap_cop_fits(delta_T, COP, draws=2000, rng=None):
+    '''
+    A and B of COP = A + B / ΔT refitted to `draws` bootstrap resamples (n points drawn with replacement from
+    the n data points). Resample r is the least squares fit with weight w[r, i] = number of times point i was
+    drawn, which for x = 1 / ΔT solves
+
+        [ Σw     Σw x  ] [A]   [ Σw y   ]
+        [ Σw x   Σw x² ] [B] = [ Σw x y ]
+
+    All the sums for every resample come from one product of the (draws x n) weight matrix with the columns
+    1, x, x², y, x y, and the 2 x 2 systems are solved in closed form. Returns arrays A and B of length draws.
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    x = 1.0 / np.asarray(delta_T, dtype=float)
+    y = np.asarray(COP, dtype=float)
+    n = len(x)
+    weights = rng.multinomial(n, np.full(n, 1.0 / n), size=draws).astype(float)
+    sum_w, sum_x, sum_xx, sum_y, sum_xy = (weights @ np.column_stack((np.ones(n), x, x * x, y, x * y))).T
+    determinant = sum_w * sum_xx - sum_x * sum_x
+    # A resample with a single distinct ΔT cannot be fitted (determinant 0); it is dropped
+    fitted = np.abs(determinant) > 1e-12 * sum_w * sum_xx
+    A = (sum_xx * sum_y - sum_x * sum_xy)[fitted] / determinant[fitted]
+    B = (sum_w * sum_xy - sum_x * sum_y)[fitted] / determinant[fitted]
+    return A, B
+
+
+def confidence_interval(values, confidence=95.0):
+    # Mean, standard deviation and the central `confidence` % of the values (percentile interval)
+    values = np.asarray(values, dtype=float)
+    tail = (100.0 - confidence) / 2
+    low, high = np.percentile(values, (tail, 100.0 - tail))
+    return {"mean": float(np.mean(values)), "std": float(np.std(values, ddof=1)) if len(values) > 1 else 0.0,
+            "low": float(low), "high": float(high)}
+
+
+def init_ensemble_worker(scenario, base_inputs, weather_file, start_datetime, end_datetime, seed):
+    # Runs once in each worker process (and once in the main process for a single worker run)
+    _ensemble_worker.update(scenario=scenario, base_inputs=base_inputs, weather_file=weather_file,
+                            start_datetime=start_datetime, end_datetime=end_datetime, seed=seed)
+
+
+def run_draw(task):
+    # Runs the scenario with one (A, B) draw. `task` is (draw index, A, B); returns the results row
+    index, A, B = task
+    settings = _ensemble_worker
+    # Same seed for every draw, so every run has the same hot water demand
+    model = make_model(settings["scenario"], settings["base_inputs"], rng=np.random.default_rng(settings["seed"]),
+                       weather_file=settings["weather_file"])
+    model.cop_parameters = (A, B)
+    model.initialize_simulation(settings["start_datetime"], settings["end_datetime"])
+    model.calculate_metrics()
+    return {"draw": index, "A": A, "B": B, **model.results_summary()}
+
+
+def run_ensemble(scenario, start_datetime, end_datetime, draws=2000, runs=200, base_inputs=None, weather_file=None,
+                 seed=None, workers=1, confidence=95.0, output_path=None, fits_path=None, progress=None):
+    '''
+    Bootstraps the COP fit of the scenario `draws` times, then runs the simulation with `runs` of the (A, B)
+    draws picked at random (every draw when runs >= draws). Rows of the runs are written to output_path and all
+    the (A, B) draws to fits_path if they are given.
+    Returns {"fit": the fit to all the data, "A" and "B": confidence intervals of the draws,
+             each of ENSEMBLE_OUTPUTS: confidence interval over the runs}.
+    '''
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=DEFAULT_INPUTS_FILE).input_values
+    seed = seed if seed is not None else int(np.random.SeedSequence().entropy % 2**63)
+    rng = np.random.default_rng(seed)
+    model = make_model(scenario, base_inputs, weather_file=weather_file)
+    if model.cop_map_file:
+        raise ValueError("The scenario uses a COP map, which has no fitted curve to bootstrap.")
+    model.fit_cop_curve()
+    A, B = bootstrap_cop_fits(model.deltaT_array, model.COPData, draws, rng)
+    if fits_path:
+        with open(fits_path, "w", newline="") as fits_file:
+            writer = csv.writer(fits_file)
+            writer.writerow(["draw", "A", "B"])
+            writer.writerows(zip(range(len(A)), A, B))
+    picked = np.sort(rng.choice(len(A), size=len(A), replace=False)[:runs]) if runs < len(A) else np.arange(len(A))
+    tasks = [(int(index), float(A[index]), float(B[index])) for index in picked]
+
+    settings = (scenario, base_inputs, weather_file, start_datetime, end_datetime, seed)
+    init_ensemble_worker(*settings)
+    pool = multiprocessing.Pool(workers, initializer=init_ensemble_worker, initargs=settings) if workers > 1 else None
+    rows = []
+    try:
+        results = pool.imap(run_draw, tasks) if pool is not None else map(run_draw, tasks)
+        for row in results:
+            rows.append(row)
+            if progress is not None:
+                progress(len(rows), len(tasks))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    if output_path:
+        with open(output_path, "w", newline="") as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    standard_errors = np.sqrt(np.diag(model.cop_fit_covariance))
+    summary = {"fit": {"A": float(model.A), "B": float(model.B),
+                       "A_standard_error": float(standard_errors[0]), "B_standard_error": float(standard_errors[1])},
+               "A": confidence_interval(A, confidence), "B": confidence_interval(B, confidence)}
+    for name in ENSEMBLE_OUTPUTS:
+        summary[name] = confidence_interval([row[name] for row in rows], confidence)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Confidence intervals on the energy use from the uncertainty of the COP fit")
+    parser.add_argument("--start", type=parse_datetime, required=True, help="Start date, e.g. 2024-01-01")
+    parser.add_argument("--end", type=parse_datetime, required=True, help="End date, e.g. 2024-01-08")
+    parser.add_argument("--scenarios", default=None, help="Scenario file (.jsonl or multi-document YAML); default: inputs.yaml")
+    parser.add_argument("--scenario-index", type=int, default=0, help="Scenario of the file to run")
+    parser.add_argument("--draws", type=int, default=2000, help="Bootstrap resamples of the COP data")
+    parser.add_argument("--runs", type=int, default=200, help="Simulations, each with one of the (A, B) draws")
+    parser.add_argument("--confidence", type=float, default=95.0, help="Confidence level of the intervals (%%)")
+    parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the resamples and the hot water demand")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--output", default=None, help="CSV file with every ensemble run")
+    parser.add_argument("--fits", default=None, help="CSV file with every bootstrap (A, B)")
+    args = parser.parse_args(argv)
+
+    # With the inputs.yaml settings, so a COP map set there is seen before a curve it would not use is bootstrapped
+    scenario = next(itertools.islice(load_scenarios(args.scenarios), args.scenario_index, None))
+    summary = run_ensemble(scenario, args.start, args.end, draws=args.draws, runs=args.runs, weather_file=args.weather_file,
+                           seed=args.seed, workers=args.workers, confidence=args.confidence, output_path=args.output,
+                           fits_path=args.fits, progress=lambda done, total: sys.stderr.write(f"\r{done} of {total} runs finished"))
+    sys.stderr.write("\n")
+    fit = summary.pop("fit")
+    print(f"Fit to all the data: A = {fit['A']:.4f} ± {fit['A_standard_error']:.4f}, B = {fit['B']:.3f} ± {fit['B_standard_error']:.3f}")
+    print(f"{'':18}{'mean':>12}{'std':>12}{f'{args.confidence:g}% low':>12}{f'{args.confidence:g}% high':>12}")
+    for name, interval in summary.items():
+        print(f"{name:18}" + "".join(f"{interval[column]:12.4f}" for column in ("mean", "std", "low", "high")))
+
+
+# Entry point for COP uncertainty runs
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Fleet totals of the electrical demand of many heat pumps.
+'''
+
+''' Purpose: Network planning needs the demand of a whole fleet of heat pumps (a street, a town, 50,000 homes), in
+particular the coincident peak: the highest total demand at one time, which is much lower than the sum of every
+building's own peak because the pumps do not all run at once.
+
+Every building (scenario) is simulated over the same period and its electrical power is reduced to the mean power
+in each interval (15 minutes by default). FleetAggregator adds each building to running totals as soon as its
+simulation finishes and then forgets it, so memory depends on the number of intervals and not on the number of
+buildings. For every interval it keeps the fleet total, the running mean and variance (Welford's algorithm), the
+minimum and maximum and a histogram of the building powers, from which the percentiles are read.
+
+Buildings come from a scenario file (one record per building, see heat_pump_batch.py) or a grid of --vary values.
+With --carbon-file and --tariff-file every building's emissions and cost are worked out from its own run and the
+fleet totals are their sums.
+
+Examples:
+
+    python heat_pump_fleet.py --scenarios street.jsonl --start 2024-01-08 --end 2024-01-15 --workers 8 --output street_demand.csv
+    python heat_pump_fleet.py --vary wall_u_value=0.2,0.3,0.4,0.5 --vary mass_of_water=150,200,250 --start 2024-01-08 --end 2024-01-09 --output fleet.csv --buildings buildings.csv
+
+'''
+
+## Importing Modules ##
+
+import csv  # Import to write the fleet and building files
+import math  # Import to count the intervals
+import argparse  # Import to read command line options
+import itertools  # Import to read the buildings in blocks
+import multiprocessing  # Import to simulate the buildings on several worker processes
+import sys  # Import for writing progress to the terminal
+from datetime import timedelta  # Import to give every interval its start time
+import numpy as np
+
+from heat_pump_model import HeatPumpModel, DEFAULT_INPUTS_FILE, parse_datetime
+from heat_pump_batch import (make_model, scenario_dates, load_scenarios, parse_vary, add_accounting_arguments,
+                             SCENARIOS_PER_WORKER_BLOCK)
+
+
+DEFAULT_INTERVAL_S = 900  # Length of the fleet intervals (15 minutes, as used for network and settlement data)
+DEFAULT_BIN_WIDTH_W = 10.0  # Width of the histogram bins; percentiles are exact to within one bin
+DEFAULT_PERCENTILES = (10, 50, 90)
+
+# Settings shared by every building of a fleet run, set once in each worker process by init_fleet_worker
+_fleet_worker = {}
+
+
+class FleetAggregator:
+    '''
+    Online totals of the electrical power of many buildings over the same intervals. add() takes the power of one
+    building in every interval (W) and only updates running values per interval, so the series themselves never
+    need to be kept: memory is intervals x histogram bins, the same for ten buildings or 50,000.
+    '''
+    def __init__(self, interval_count, interval_s=DEFAULT_INTERVAL_S, bin_width_W=DEFAULT_BIN_WIDTH_W, start_datetime=None,
+                 total_seconds=None):
+        self.interval_count = interval_count
+        self.interval_s = interval_s
+        # Length of every interval (s); the last one is shorter when the period is not a whole number of intervals
+        self.interval_lengths_s = np.full(interval_count, float(interval_s))
+        if total_seconds is not None:
+            self.interval_lengths_s[-1] = total_seconds - (interval_count - 1) * interval_s
+        self.bin_width_W = bin_width_W
+        self.start_datetime = start_datetime  # Start of the first interval (only used to label the intervals)
+        self.buildings = 0
+        self.total_W = np.zeros(interval_count)  # Fleet demand in each interval
+        self.mean_W = np.zeros(interval_count)  # Running mean and sum of squared differences (Welford's algorithm)
+        self.squares_W2 = np.zeros(interval_count)
+        self.min_W = np.full(interval_count, np.inf)
+        self.max_W = np.full(interval_count, -np.inf)
+        # Number of buildings with a power in each bin, for every interval: column 0 counts buildings using no power
+        # (pump off all interval), column c > 0 powers from (c - 1) to c bin widths. Columns are added as higher powers are seen
+        self.histogram = np.zeros((interval_count, 1), dtype=np.uint32)
+        self.individual_peaks_W = 0.0  # Sum of every building's own highest interval power
+        # Emissions (kgCO2) and cost of the whole fleet, from the buildings' own totals (see HeatPumpModel.accounting_summary)
+        self.charges = {}
+
+    def add(self, power_W, charges=None):
+        # Adds one building's power (W) in every interval, and its emissions and cost ({name: total}), to the totals
+        for name, value in (charges or {}).items():
+            self.charges[name] = self.charges.get(name, 0.0) + value
+        power = np.asarray(power_W, dtype=float)
+        if power.shape != (self.interval_count,):
+            raise ValueError(f"A building has {power.size} intervals but the fleet has {self.interval_count}.")
+        self.buildings += 1
+        self.total_W += power
+        difference = power - self.mean_W
+        self.mean_W += difference / self.buildings
+        self.squares_W2 += difference * (power - self.mean_W)
+        np.minimum(self.min_W, power, out=self.min_W)
+        np.maximum(self.max_W, power, out=self.max_W)
+        self.individual_peaks_W += float(np.max(power))
+        bins = np.where(power > 0, power // self.bin_width_W + 1, 0).astype(np.int64)
+        if bins.max() >= self.histogram.shape[1]:
+            self.histogram = np.pad(self.histogram, ((0, 0), (0, int(bins.max()) + 1 - self.histogram.shape[1])))
+        self.histogram[np.arange(self.interval_count), bins] += 1
+
+    def std_W(self):
+        # Standard deviation of the building powers in each interval
+        return np.sqrt(self.squares_W2 / (self.buildings - 1)) if self.buildings > 1 else np.zeros(self.interval_count)
+
+    def percentile(self, q):
+        '''
+        q-th percentile (0-100) of the building powers in each interval, read from the histogram: the value
+        below which q % of the buildings are, taking the powers as evenly spread within each bin.
+        '''
+        target = q / 100 * self.buildings
+        cumulative = np.cumsum(self.histogram, axis=1)
+        rows = np.arange(self.interval_count)
+        column = np.argmax(cumulative >= target, axis=1)  # First bin that reaches the target count
+        inside = self.histogram[rows, column].astype(float)
+        below = cumulative[rows, column] - inside
+        fraction = np.divide(target - below, inside, out=np.zeros(self.interval_count), where=inside > 0)
+        value = np.where(column > 0, (column - 1 + fraction) * self.bin_width_W, 0.0)
+        return np.clip(value, self.min_W, self.max_W)
+
+    def interval_starts(self):
+        # Start of every interval: a datetime when the start of the period is known, otherwise seconds from the start
+        if self.start_datetime is None:
+            return [index * self.interval_s for index in range(self.interval_count)]
+        return [self.start_datetime + timedelta(seconds=index * self.interval_s) for index in range(self.interval_count)]
+
+    def summary(self):
+        # Fleet totals: coincident peak and when it happens, the sum of the individual peaks and the energy use
+        peak = int(np.argmax(self.total_W))
+        peak_W = float(self.total_W[peak])
+        return {
+            "buildings": self.buildings,
+            "peak_coincident_kW": peak_W / 1000,
+            "peak_interval_start": str(self.interval_starts()[peak]),
+            "sum_of_building_peaks_kW": self.individual_peaks_W / 1000,
+            # Diversity factor: how much lower the coincident peak is than if every building peaked at once
+            "diversity_factor": self.individual_peaks_W / peak_W if peak_W > 0 else 0.0,
+            "peak_per_building_kW": peak_W / 1000 / self.buildings if self.buildings else 0.0,
+            "energy_total_kWh": float(np.sum(self.total_W * self.interval_lengths_s)) / 3.6e6,
+            **self.charges,
+        }
+
+    def interval_rows(self, percentiles=DEFAULT_PERCENTILES):
+        # One row per interval: fleet demand and the spread of the building powers
+        values = {"fleet_power_kW": self.total_W / 1000, "mean_W": self.mean_W, "std_W": self.std_W(), "min_W": self.min_W}
+        values.update({f"p{q:g}_W": self.percentile(q) for q in percentiles})
+        values["max_W"] = self.max_W
+        for index, start in enumerate(self.interval_starts()):
+            yield {"interval_start": str(start), **{name: float(series[index]) for name, series in values.items()}}
+
+
+def init_fleet_worker(base_inputs, weather_file, start_datetime, end_datetime, interval_s):
+    # Runs once in each worker process (and once in the main process for a single worker run)
+    _fleet_worker.update(base_inputs=base_inputs, weather_file=weather_file, start_datetime=start_datetime,
+                         end_datetime=end_datetime, interval_s=interval_s)
+
+
+def run_building(task):
+    '''
+    Simulates one building of the fleet. `task` is (index, scenario, seed). Returns its results row
+    and its mean electrical power (W) in every fleet interval, as float32 to halve what is sent back.
+    '''
+    index, scenario, seed = task
+    settings = _fleet_worker
+    start, end = scenario_dates(scenario, settings["start_datetime"], settings["end_datetime"])
+    if (start, end) != (settings["start_datetime"], settings["end_datetime"]):
+        raise ValueError(f"Building {index} ({scenario.get('name', '')}) has its own dates; every building of a fleet "
+                         "must be simulated over the same period.")
+    model = make_model(scenario, settings["base_inputs"], rng=np.random.default_rng(seed), weather_file=settings["weather_file"])
+    model.initialize_simulation(start, end)
+    model.calculate_metrics()
+    row = {"building": index, "name": scenario.get("name", ""), "building_number": model.building_number,
+           "seed": seed, **model.results_summary(), **model.accounting_summary()}
+    return row, model.interval_power(settings["interval_s"]).astype(np.float32)
+
+
+def building_charges(row):
+    # Emissions and cost of a building's results row, for the fleet totals (only those its files gave)
+    return {name: row[name] for name in ("carbon_kgCO2", "energy_cost") if not math.isnan(row[name])}
+
+
+def run_fleet(scenarios, start_datetime, end_datetime, interval_s=DEFAULT_INTERVAL_S, bin_width_W=DEFAULT_BIN_WIDTH_W,
+              base_inputs=None, weather_file=None, seed=None, workers=1, buildings_path=None, progress=None):
+    '''
+    Simulates every building (scenario) from start_datetime to end_datetime and adds each to a FleetAggregator
+    as soon as it finishes. The scenarios can be any iterable, including a generator reading a scenario file,
+    and are read one block at a time. Seeds are drawn as in heat_pump_batch.run_sweep, so a building has the
+    same hot water demand as in a batch run with the same seed. With buildings_path, each building's results
+    row is also written there. Returns the FleetAggregator.
+    '''
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=DEFAULT_INPUTS_FILE).input_values
+    total_seconds = (end_datetime - start_datetime).total_seconds()
+    fleet = FleetAggregator(math.ceil(total_seconds / interval_s), interval_s, bin_width_W, start_datetime, total_seconds)
+    rng = np.random.default_rng(seed)
+    pending = ((index, scenario, int(rng.integers(2**63))) for index, scenario in enumerate(scenarios))
+
+    settings = (base_inputs, weather_file, start_datetime, end_datetime, interval_s)
+    init_fleet_worker(*settings)
+    pool = multiprocessing.Pool(workers, initializer=init_fleet_worker, initargs=settings) if workers > 1 else None
+    buildings_file = open(buildings_path, "w", newline="") if buildings_path else None
+    try:
+        writer = None
+        block_size = SCENARIOS_PER_WORKER_BLOCK * workers
+        while True:
+            block = list(itertools.islice(pending, block_size))
+            if not block:
+                break
+            results = pool.imap(run_building, block) if pool is not None else map(run_building, block)
+            for row, power in results:
+                fleet.add(power, building_charges(row))
+                if buildings_file is not None:
+                    if writer is None:
+                        writer = csv.DictWriter(buildings_file, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+                if progress is not None:
+                    progress(fleet.buildings)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if buildings_file is not None:
+            buildings_file.close()
+    return fleet
+
+
+def write_fleet_csv(fleet, output_path, percentiles=DEFAULT_PERCENTILES):
+    # One row per interval with the fleet demand and the spread of the building powers
+    with open(output_path, "w", newline="") as output_file:
+        writer = None
+        for row in fleet.interval_rows(percentiles):
+            if writer is None:
+                writer = csv.DictWriter(output_file, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fleet totals of the electrical demand of many heat pumps")
+    buildings_source = parser.add_mutually_exclusive_group(required=True)
+    buildings_source.add_argument("--scenarios", help="Scenario file with one building per record (.jsonl or multi-document YAML)")
+    buildings_source.add_argument("--vary", type=parse_vary, action="append",
+                                  help="Parameter and values; every combination is one building (repeat for more parameters)")
+    parser.add_argument("--start", type=parse_datetime, required=True, help="Start date, e.g. 2024-01-08")
+    parser.add_argument("--end", type=parse_datetime, required=True, help="End date, e.g. 2024-01-15")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_S, help="Length of the fleet intervals (s)")
+    parser.add_argument("--bin-width", type=float, default=DEFAULT_BIN_WIDTH_W, help="Histogram bin width for the percentiles (W)")
+    parser.add_argument("--percentiles", default=",".join(str(q) for q in DEFAULT_PERCENTILES),
+                        help="Percentiles of the building powers in each interval, e.g. 10,50,90,99")
+    parser.add_argument("--output", required=True, help="CSV file with the fleet demand in every interval")
+    parser.add_argument("--buildings", default=None, help="CSV file with the results of every building")
+    parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the hot water demand")
+    add_accounting_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios, dict(args.vary or []), carbon_intensity_file=args.carbon_file,
+                               tariff_file=args.tariff_file)
+    fleet = run_fleet(scenarios, args.start, args.end, interval_s=args.interval, bin_width_W=args.bin_width,
+                      weather_file=args.weather_file, seed=args.seed, workers=args.workers, buildings_path=args.buildings,
+                      progress=lambda done: sys.stderr.write(f"\r{done} buildings finished"))
+    write_fleet_csv(fleet, args.output, [float(q) for q in args.percentiles.split(",")])
+    sys.stderr.write(f"\nWrote {fleet.interval_count} intervals to {args.output}\n")
+    for name, value in fleet.summary().items():
+        print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+
+
+# Entry point for fleet runs
+if __name__ == "__main__":
+    main()
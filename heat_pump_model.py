@@ -0,0 +1,2244 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Headless simulation core for the heat pump and hot water tank model.
+'''
+
+''' Purpose: This module holds the physics of the simulation (COP fit, building heat load, hot water demand,
+tank ODE and performance metrics) without any GUI. "Group23 Heat Pump Simulation.py" builds the Tkinter
+application on top of the HeatPumpModel class, and the same class can be used on its own for long or batch runs.
+
+Example (stream a three year run to CSV using a local weather file):
+
+    python heat_pump_model.py stream --start 2021-01-01 --end 2024-01-01 --weather-file edinburgh.csv --output run.csv
+
+'''
+
+## Importing Modules ##
+# Only NumPy and the ODE solver are imported here so that headless workers start quickly.
+# Curve fitting, YAML and Meteostat are imported inside the functions that use them
+# (see check_import_time at the bottom of this file).
+
+# Maths and Fitting
+import statistics #Finding mean of an array
+import math #For Maths Functions
+import copy  # Import to keep cached stage outputs separate from the model that uses them
+import bisect  # Import to look up the pump status of a streamed run in its switch log
+import hashlib  # Import to fingerprint arrays (e.g. weather tables) by their contents
+import numpy as np
+from scipy.integrate import solve_ivp, RK45 #Solving ODE (all at once, or one step at a time when streaming)
+from heat_pump_cop_map import COPMap # Manufacturer COP maps as regular-grid lookup tables (NumPy only)
+
+# Data Collection/Extraction
+import os  # Import for interacting with the operating system (e.g., file paths)
+import sys  # Import for writing progress to the terminal
+import csv  # Import to read local weather files and write streamed results
+import argparse  # Import to read command line options
+import json  # Import to save and load checkpoints
+import time  # Import to time checkpoints (wall clock)
+import subprocess  # Import to measure the import time in a fresh interpreter
+from datetime import datetime, timedelta  # Import datetime to handle date and time operations
+
+
+# Import time budget (seconds) for `import heat_pump_model` in a fresh interpreter, and modules that must not be
+# loaded by that import. Checked with: python heat_pump_model.py check-import-time (run on every push by
+# .github/workflows/import-time.yml for this and the other headless modules)
+IMPORT_TIME_BUDGET_S = 1.0
+HEAVY_MODULES = ("matplotlib", "tkinter", "tkcalendar", "meteostat", "pandas")
+
+# Input files live next to this module
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUTS_FILE = os.path.join(MODULE_DIR, "inputs.yaml")
+DEFAULT_COP_FILE = os.path.join(MODULE_DIR, "heat_pump_cop_synthetic_full.yaml")
+
+# Mapping of inputs.yaml keys to the names used in input_values by the simulation
+YAML_INPUT_KEYS = {
+    'building_properties.wall_area.value': 'wall_area',
+    'building_properties.wall_U_value.value': 'wall_u_value',
+    'building_properties.roof_area.value': 'roof_area',
+    'building_properties.roof_U_value.value': 'roof_u_value',
+    'hot_water_tank.mass_of_water.value': 'mass_of_water',
+    'building_properties.indoor_setpoint_temperature_K.value': 'indoor_setpoint_temperature_K',
+    'heat_pump.on_temperature_threshold_K.value': 'on_temperature_threshold_K',
+    'heat_pump.off_temperature_threshold_K.value': 'off_temperature_threshold_K',
+    'initial_conditions.initial_tank_temperature_K.value': 'initial_tank_temperature_K',
+    'hot_water_tank.heat_loss_coefficient.value': 'heat_loss_coefficient',
+    'heat_pump.overall_heat_transfer_coefficient.value': 'overall_heat_transfer_coefficient',
+    'heat_pump.heat_transfer_area.value': 'heat_transfer_area',
+    'heat_pump.fixed_condenser_temperature_K.value': 'fixed_condenser_temperature_K',
+    'hot_water_tank.specific_heat_capacity.value': 'specific_heat_capacity',
+    'simulation_parameters.time_points.value': 'time_points',
+    'building_properties.envelope_heat_capacity.value': 'envelope_heat_capacity',
+    'building_properties.internal_heat_capacity.value': 'internal_heat_capacity',
+    'building_properties.storey_height.value': 'storey_height',
+    'heat_pump.min_compressor_power_W.value': 'min_compressor_power_W',
+    'heat_pump.max_compressor_power_W.value': 'max_compressor_power_W',
+    'heat_pump.modulation_setpoint_temperature_K.value': 'modulation_setpoint_temperature_K',
+    'heat_pump.controller_gain_W_per_K.value': 'controller_gain_W_per_K',
+    'heat_pump.controller_integral_time_s.value': 'controller_integral_time_s',
+    'heat_pump.part_load_cop_gain.value': 'part_load_cop_gain',
+    'heat_pump.cycling_degradation_coefficient.value': 'cycling_degradation_coefficient',
+}
+
+# Thermal mass inputs of the RC building model, with the values used when they are not given
+# (older input files and the GUI, which has no fields for them)
+BUILDING_MASS_DEFAULTS = {
+    'envelope_heat_capacity': 100000.0,  # J/m²K of wall and roof area (about 5 cm of masonry)
+    'internal_heat_capacity': 165000.0,  # J/m²K of floor area ("medium" building class of ISO 13790)
+    'storey_height': 2.5,                # m, sets the volume of indoor air
+}
+
+# Settings of the PI controlled compressor in the "modulating" control mode, with the values used when they
+# are not given (older input files and the GUI, which has no fields for them)
+CONTROLLER_DEFAULTS = {
+    'min_compressor_power_W': 600.0,     # Lowest continuous compressor power; below it the unit cycles at this power
+    'max_compressor_power_W': 2000.0,    # Full compressor power (the on/off mode always runs at Pump_Power)
+    'modulation_setpoint_temperature_K': 328.15,  # Tank temperature the controller holds (55°C)
+    'controller_gain_W_per_K': 500.0,    # Proportional gain
+    'controller_integral_time_s': 1800.0,  # Integral time
+    'part_load_cop_gain': 0.1,           # COP gain at minimum power over full power (when the COP map has no part-load axis)
+    'cycling_degradation_coefficient': 0.9,  # Cd of EN 14825, for cycling below minimum power
+}
+
+# Settings of the ODE solver that a solver profile can set, with the values used without a profile.
+# heat_pump_solver_tuning.py finds the cheapest settings that still match a reference run and writes them as a profile.
+SOLVER_PROFILE_DEFAULTS = {
+    'method': "RK45",     # solve_ivp method (the streaming runs always step with RK45)
+    'rtol': 1e-3,         # Relative tolerance (solve_ivp default)
+    'atol': 1e-6,         # Absolute tolerance of the tank temperature (K); running totals always use 1 J
+    'max_step_s': None,   # Longest solver step (s); None: 3600 / steps_each_hour of the control mode
+}
+
+# Pump runs shorter than this (s) count as short cycles, the main cause of compressor wear (10 minutes is a common
+# minimum run time in manufacturer data)
+SHORT_CYCLE_S = 600.0
+# Columns of pump_cycling, in order (one column each in the batch results)
+CYCLING_METRICS = ("pump_starts", "starts_per_hour", "max_starts_in_an_hour", "starts_per_day", "max_starts_in_a_day",
+                   "short_cycles", "mean_on_minutes", "min_on_minutes", "max_on_minutes", "mean_off_minutes",
+                   "min_off_minutes", "duty_cycle_mean", "duty_cycle_p10", "duty_cycle_p50", "duty_cycle_p90",
+                   "duty_cycle_max")
+
+# Hourly grid series charged against the electricity used: local CSV files with a 'time' column and the value column.
+# Carbon intensity in gCO2 per kWh, tariff as a price per kWh (in the currency of the file)
+CARBON_INTENSITY_COLUMN = "carbon_intensity"
+TARIFF_COLUMN = "price"
+# Columns of accounting_summary, in order (NaN when the run has no carbon intensity or tariff file)
+ACCOUNTING_METRICS = ("carbon_kgCO2", "energy_cost", "carbon_intensity_average_g_per_kWh", "price_average_per_kWh")
+
+# Preset building configurations, as typed into the GUI fields by the building buttons.
+# Also used by the building_type of batch scenario files.
+BUILDING_CONFIGURATIONS = {
+    "Library": {
+        "wall_area": "150",
+        "wall_u_value": "0.3",
+        "roof_area": "150",
+        "roof_u_value": "0.23",
+        "mass_of_water": "200",
+        "indoor_setpoint": "293.15",
+        "heat_loss_coefficient": "5",
+        "heat_transfer_coefficient": "300",
+        "off_threshold": "333.15",
+        "tank_length": "0.6",
+    },
+    "Modern Office Building": {
+        "wall_area": "220",
+        "wall_u_value": "0.2",
+        "roof_area": "170",
+        "roof_u_value": "0.2",
+        "mass_of_water": "220",
+        "indoor_setpoint": "293.15",
+        "heat_loss_coefficient": "2.5",
+        "heat_transfer_coefficient": "250",
+        "off_threshold": "333.15",
+        "tank_length": "0.7",
+    },
+    "Industrial Warehouse": {
+        "wall_area": "250",
+        "wall_u_value": "0.35",
+        "roof_area": "180",
+        "roof_u_value": "0.45",
+        "mass_of_water": "230",
+        "indoor_setpoint": "293.15",
+        "heat_loss_coefficient": "8",
+        "heat_transfer_coefficient": "500",
+        "off_threshold": "333.15",
+        "tank_length": "0.7",
+    }
+}
+
+# Building number of each building type (selects the hot water demand profile in human_usage_pattern)
+BUILDING_NUMBERS = {"Library": 0, "Modern Office Building": 1, "Industrial Warehouse": 2, "Apartment": 3}
+
+# GUI field names that differ from the input_values names used by the simulation
+GUI_TO_INPUT_KEYS = {
+    'indoor_setpoint': 'indoor_setpoint_temperature_K',
+    'on_threshold': 'on_temperature_threshold_K',
+    'off_threshold': 'off_temperature_threshold_K',
+    'initial_tank_temp': 'initial_tank_temperature_K',
+    'heat_transfer_coefficient': 'overall_heat_transfer_coefficient',
+}
+
+
+def load_yaml_file(path):
+    '''
+    Loads a YAML file with the C-accelerated loader when PyYAML was built with libyaml,
+    falling back to the pure Python loader otherwise.
+    '''
+    import yaml  # Import to parse YAML files for configuration or input data
+    with open(path, "r") as yaml_file:
+        return yaml.load(yaml_file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+# Caches kept for the life of the process, so repeated runs in one process (a sweep worker, a
+# service worker) fit the COP curve and read the weather only once.
+# COP fit: (COP file, modified time, condenser temperature) -> (COPData, deltaT_array, A, B, covariance of A and B)
+_cop_fit_cache = {}
+# COP map: (map file, modified time) -> COPMap
+_cop_map_cache = {}
+# Local weather file: (file, modified time) -> (times as datetime64, temperatures in K), sorted by time
+_weather_file_cache = {}
+# Meteostat downloads: (location, start, end) -> temperatures in K
+_meteostat_cache = {}
+# Carbon intensity and tariff files: (file, modified time, column) -> (times as datetime64, values), sorted by time
+_series_file_cache = {}
+WEATHER_CACHE_SIZE = 64  # Most date ranges / files kept per process before the oldest is dropped
+
+
+def remember(cache, key, value):
+    # Adds a value to one of the caches above, dropping the oldest entry when it is full
+    if len(cache) >= WEATHER_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    cache[key] = value
+    return value
+
+
+def remember_weather(location, start_datetime, end_datetime, outdoor_temp_K_array):
+    # Puts downloaded weather (K) into the cache, e.g. in a worker process, so it is not downloaded again
+    remember(_meteostat_cache, (tuple(location), start_datetime, end_datetime), list(outdoor_temp_K_array))
+
+
+def read_weather_table(path):
+    '''
+    Reads a local weather CSV (columns 'time' in ISO format and 'temp' in °C) once per process and
+    returns (times, temperatures in K) as numpy arrays sorted by time. Later calls for the same file
+    come from the cache until the file is changed.
+    '''
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in _weather_file_cache:
+        times, temps = read_series_csv(path, 'temp')
+        remember(_weather_file_cache, key, (times, temps + 273.15))
+    return _weather_file_cache[key]
+
+
+def read_series_csv(path, column):
+    # (times as datetime64[s], values) of one column of a CSV with a 'time' column in ISO format, sorted by time
+    times, values = [], []
+    with open(path, newline="") as series_file:
+        for row in csv.DictReader(series_file):
+            times.append(row['time'])
+            values.append(float(row[column]))
+    times = np.array([datetime.fromisoformat(time) for time in times], dtype="datetime64[s]")
+    values = np.array(values)
+    order = np.argsort(times, kind="stable")
+    return times[order], values[order]
+
+
+def read_hourly_series(path, column):
+    # A carbon intensity or tariff file (see read_series_csv), read once per process until the file is changed
+    key = (os.path.abspath(path), os.path.getmtime(path), column)
+    if key not in _series_file_cache:
+        remember(_series_file_cache, key, read_series_csv(path, column))
+    return _series_file_cache[key]
+
+
+def charge_energy(times_s, energy_J, start_datetime, series, source="the series"):
+    '''
+    Energy used in a run (kWh) times the value in force when it was used, e.g. gCO2/kWh or price/kWh.
+
+        times_s   : sample times (s from start_datetime), increasing
+        energy_J  : electrical energy used so far (J) at those times
+        series    : (times, values); each value holds from its time until the next one
+
+    The energy between two samples is split at every change of the series inside them (linear in time),
+    so each part is charged at its own value. Everything is array operations: the change times are found
+    with one searchsorted, the energy at them with one interp. Returns the total in value x kWh.
+    '''
+    series_times, values = series
+    changes_s = (series_times - np.datetime64(start_datetime, "s")).astype(float)
+    if len(changes_s) == 0 or changes_s[0] > times_s[0]:
+        raise ValueError(f"{source} starts after the start of the run.")
+    if changes_s[-1] + 3600 < times_s[-1]:
+        raise ValueError(f"{source} ends more than an hour before the end of the run.")
+    first, last = np.searchsorted(changes_s, (times_s[0], times_s[-1]), side="right")
+    edges = np.concatenate(([times_s[0]], changes_s[first:last], [times_s[-1]]))
+    energy_kWh = np.diff(np.interp(edges, times_s, energy_J)) / 3.6e6
+    # Value in force over each piece: the last change at or before its start
+    return float(np.dot(energy_kWh, values[np.arange(first - 1, last)]))
+
+
+def phi(x):
+    # (e^x - 1) / x, 1 at x = 0: how far an exponential segment has gone towards its end value, per unit of x
+    x = np.asarray(x, dtype=float)
+    return np.divide(np.expm1(x), x, out=np.ones_like(x), where=x != 0)
+
+
+def psi(x):
+    # (e^x - 1 - x) / x², 1/2 at x = 0: integral of phi, with the series where the formula loses its digits
+    x = np.asarray(x, dtype=float)
+    small = np.abs(x) < 1e-4
+    safe = np.where(small, 1.0, x)
+    return np.where(small, 0.5 + x / 6 + x * x / 24, (np.expm1(safe) - safe) / (safe * safe))
+
+
+def propagate(T0, x, c):
+    '''
+    Temperatures at the end of a run of pieces, each T_end = e^x T_start + c (see EventLog). Worked out for
+    all the pieces at once as T0 e^(L_n) + Σ_{k<=n} c_k e^(L_n - L_k) with L the running sum of x; every
+    exponent is <= 0 (x <= 0 as the tank only loses heat to a fixed gain), so nothing can overflow.
+    '''
+    L = np.cumsum(x)
+    weights = np.tril(np.exp(np.minimum(L[:, None] - L[None, :], 0.0)))
+    return T0 * np.exp(L) + weights @ c
+
+
+class EventLog:
+    '''
+    Compact record of an on/off run, the "events" output grid. Between a pump switch and the next change of
+    the weather (every hour) or of the hot water draw (every step of the daily profile) the tank ODE is linear,
+
+        C dT/dt = F - G T,   so   T(t0 + τ) = T0 e^(bτ) + f τ phi(bτ)   with b = -G/C, f = F/C
+
+    where G is the tank loss coefficient, plus U_cond A_cond while the pump runs below its maximum output.
+    The log only keeps what is needed to evaluate that at any time:
+
+        hour_temperature_K, hour_mode, hour_energy_J : tank temperature, pump mode and electrical energy used
+                                                       so far at every hour boundary
+        event_s, event_mode                          : times (s) of the pump mode changes and the new modes
+        outdoor_K, building_load_W, cop              : hourly weather, building heat load and COP
+        hot_water_W                                  : daily hot water profile (empty without hot water)
+
+    Temperatures, pump status and energy at any time are worked out when they are asked for (sample), one
+    hour at a time from the anchor at its start, so the dense solution is never kept. A year is a few hundred
+    kB in memory (less on disk, save compresses it) instead of tens of MB of solver t and y arrays.
+    '''
+    OFF, ON, FULL = 0, 1, 2  # Pump modes: off, on (output limited by the condenser), on at its maximum output
+    ARRAYS = ("hour_temperature_K", "hour_mode", "hour_energy_J", "event_s", "event_mode", "outdoor_K",
+              "building_load_W", "cop", "hot_water_W", "totals_J")
+    SCALARS = ("total_seconds", "capacity_J_per_K", "loss_W_per_K", "condenser_W_per_K", "condenser_temperature_K",
+               "pump_power_W", "on_threshold_K", "off_threshold_K", "hot_water_step_s")
+    MAX_EVENTS_PER_HOUR = 10000
+
+    def __init__(self, start_datetime, **values):
+        missing = set(self.ARRAYS + self.SCALARS) - set(values)
+        if missing:
+            raise ValueError(f"Event log without {', '.join(sorted(missing))}.")
+        self.start_datetime = start_datetime
+        for name in self.ARRAYS:
+            setattr(self, name, np.asarray(values[name]))
+        for name in self.SCALARS:
+            setattr(self, name, float(values[name]))
+
+    @classmethod
+    def from_model(cls, model):
+        '''
+        Runs the prepared model (prepare_simulation) from its initial tank temperature, finding every pump
+        mode change exactly: the time the closed form reaches the threshold. Totals (J) of electrical
+        energy, delivered heat, tank loss and hot water are integrated in closed form as well.
+        '''
+        hours = math.ceil(model.total_seconds / 3600)
+        outdoor = np.array([model.find_T_ambient(hour * 3600) for hour in range(hours)], dtype=float)
+        inputs = model.input_values
+        log = cls(model.start_datetime,
+                  hour_temperature_K=np.zeros(hours + 1), hour_mode=np.zeros(hours + 1, dtype=np.uint8),
+                  hour_energy_J=np.zeros(hours + 1), event_s=np.zeros(0), event_mode=np.zeros(0, dtype=np.uint8),
+                  outdoor_K=outdoor,
+                  building_load_W=np.array([model.building_heat_load(hour * 3600, T) for hour, T in enumerate(outdoor)]),
+                  cop=np.array([model.cop(T) for T in outdoor], dtype=float),
+                  hot_water_W=np.asarray(model.hot_water_demand if model.hot_water_included() else [], dtype=float),
+                  totals_J=np.zeros(4), total_seconds=model.total_seconds,
+                  capacity_J_per_K=inputs['mass_of_water'] * inputs['specific_heat_capacity'],
+                  loss_W_per_K=model.real_U_loss,
+                  condenser_W_per_K=inputs['overall_heat_transfer_coefficient'] * inputs['heat_transfer_area'],
+                  condenser_temperature_K=inputs['fixed_condenser_temperature_K'], pump_power_W=model.Pump_Power,
+                  on_threshold_K=inputs['on_temperature_threshold_K'], off_threshold_K=inputs['off_temperature_threshold_K'],
+                  hot_water_step_s=3600 * model.total_hours / model.time_steps)
+        T = inputs['initial_tank_temperature_K']
+        mode = log.running_mode(0, T, model.next_pump_status(T, False))
+        event_s, event_mode = [], []
+        for hour in range(hours):
+            log.hour_temperature_K[hour], log.hour_mode[hour], log.hour_energy_J[hour] = T, mode, log.totals_J[0]
+            t, end = hour * 3600.0, min((hour + 1) * 3600.0, log.total_seconds)
+            first = len(event_s)
+            while True:
+                event = log.next_event(hour, t, T, mode, end)
+                if event is None:
+                    break
+                t, T, mode = event
+                event_s.append(t)
+                event_mode.append(mode)
+                if len(event_s) - first > cls.MAX_EVENTS_PER_HOUR:
+                    raise RuntimeError(f"The pump changes mode more than {cls.MAX_EVENTS_PER_HOUR} times in hour {hour}.")
+            pieces = log.hour_pieces(hour, np.array(event_s[first:]), np.array(event_mode[first:], dtype=np.uint8))
+            log.totals_J += [np.sum(pieces[name]) for name in ("electrical_J", "delivered_J", "loss_J", "hot_water_J")]
+            T = pieces["end_temperature_K"]
+            mode = log.running_mode(min(hour + 1, hours - 1), T, pieces["modes"][-1] != cls.OFF)
+        log.hour_temperature_K[hours], log.hour_mode[hours], log.hour_energy_J[hours] = T, mode, log.totals_J[0]
+        log.event_s, log.event_mode = np.array(event_s), np.array(event_mode, dtype=np.uint8)
+        return log
+
+    def full_output_temperature_K(self, hour):
+        # Tank temperature below which the condenser could pass on more than the pump's maximum output
+        return self.condenser_temperature_K - self.cop[hour] * self.pump_power_W / self.condenser_W_per_K
+
+    def running_mode(self, hour, T, running):
+        # Pump mode of a pump that is (not) running at tank temperature T
+        if not running:
+            return self.OFF
+        return self.FULL if T < self.full_output_temperature_K(hour) else self.ON
+
+    def piece_starts(self, start, end):
+        # Start of every piece from start to end: start, then every step of the hot water profile inside
+        if len(self.hot_water_W) == 0:
+            return np.array([start])
+        steps = np.arange(math.floor(start / self.hot_water_step_s) + 1, math.ceil(end / self.hot_water_step_s)) * self.hot_water_step_s
+        return np.concatenate(([start], steps[(steps > start) & (steps < end)]))
+
+    def piece_rates(self, hour, starts, modes):
+        # b (1/s), f (K/s) and hot water power (W) of pieces starting at `starts` in `modes`, within one hour
+        if len(self.hot_water_W):
+            hot_water = self.hot_water_W[np.floor(starts / self.hot_water_step_s).astype(int) % len(self.hot_water_W)]
+        else:
+            hot_water = np.zeros(len(starts))
+        on = modes == self.ON
+        gain = (self.building_load_W[hour] + self.loss_W_per_K * self.outdoor_K[hour] - hot_water
+                + np.where(on, self.condenser_W_per_K * self.condenser_temperature_K, 0.0)
+                + np.where(modes == self.FULL, self.cop[hour] * self.pump_power_W, 0.0))
+        b = -(self.loss_W_per_K + np.where(on, self.condenser_W_per_K, 0.0)) / self.capacity_J_per_K
+        return b, gain / self.capacity_J_per_K, hot_water
+
+    def next_event(self, hour, t, T, mode, end):
+        '''
+        First pump mode change after time t (tank at T, pump in `mode`) and before `end`, the end of the
+        hour: (time, temperature, new mode), or None if the mode holds until `end`.
+        '''
+        starts = self.piece_starts(t, end)
+        deltas = np.diff(np.append(starts, end))
+        b, f, hot_water = self.piece_rates(hour, starts, np.full(len(starts), mode))
+        x = b * deltas
+        end_T = propagate(T, x, f * deltas * phi(x))
+        start_T = np.concatenate(([T], end_T[:-1]))
+        full_output_T = self.full_output_temperature_K(hour)
+        if mode == self.OFF:
+            # (threshold, crossed at the end of each piece, new mode)
+            candidates = [(self.on_threshold_K, end_T <= self.on_threshold_K, self.running_mode(hour, self.on_threshold_K, True))]
+        else:
+            candidates = [(self.off_threshold_K, end_T >= self.off_threshold_K, self.OFF)]
+            if mode == self.ON:
+                candidates.append((full_output_T, end_T < full_output_T - 1e-9, self.FULL))
+            else:
+                candidates.append((full_output_T, end_T > full_output_T + 1e-9, self.ON))
+        best = None
+        for threshold, crossed, new_mode in candidates:
+            pieces = np.flatnonzero(crossed)
+            if len(pieces) == 0:
+                continue
+            k = pieces[0]
+            when = starts[k] + min(max(self.crossing_time(start_T[k], b[k], f[k], threshold), 0.0), deltas[k])
+            if when < end and (best is None or when < best[0]):
+                best = (float(when), float(threshold), new_mode)
+        return best
+
+    @staticmethod
+    def crossing_time(T0, b, f, threshold):
+        # Time (s) for T0 e^(bτ) + f τ phi(bτ) to reach the threshold
+        if b == 0:
+            return (threshold - T0) / f if f != 0 else math.inf
+        T_end = -f / b  # Temperature the piece is heading to
+        ratio = (threshold - T_end) / (T0 - T_end) if T0 != T_end else 0.0
+        return math.log(ratio) / b if ratio > 0 else math.inf
+
+    def hour_pieces(self, hour, event_s=None, event_mode=None):
+        '''
+        Every piece of one hour: start (s), length, mode, b, f and tank temperature at its start, and the
+        electrical energy, delivered heat, tank loss and hot water energy (J) of each piece. Works from the
+        hour's anchor, so it costs the same for the first hour of a run as for the last.
+        '''
+        start, end = hour * 3600.0, min((hour + 1) * 3600.0, self.total_seconds)
+        if event_s is None:
+            first, last = np.searchsorted(self.event_s, (start, end))
+            event_s, event_mode = self.event_s[first:last], self.event_mode[first:last]
+        starts = np.union1d(self.piece_starts(start, end), event_s)
+        deltas = np.diff(np.append(starts, end))
+        modes = np.concatenate(([self.hour_mode[hour]], event_mode))[np.searchsorted(event_s, starts, side="right")]
+        b, f, hot_water = self.piece_rates(min(hour, len(self.cop) - 1), starts, modes)
+        x = b * deltas
+        end_T = propagate(self.hour_temperature_K[hour], x, f * deltas * phi(x))
+        start_T = np.concatenate(([self.hour_temperature_K[hour]], end_T[:-1]))
+        pieces = {"starts": starts, "deltas": deltas, "modes": modes, "b": b, "f": f, "start_temperature_K": start_T,
+                  "end_temperature_K": end_T[-1]}
+        pieces.update(self.piece_energies(hour, modes, start_T, b, f, deltas, hot_water))
+        return pieces
+
+    def piece_energies(self, hour, modes, start_T, b, f, durations, hot_water):
+        # Electrical energy, delivered heat, tank loss and hot water energy (J) over the first `durations` of pieces
+        x = b * durations
+        integral_T = start_T * durations * phi(x) + f * durations * durations * psi(x)  # ∫ T dt
+        delivered = np.where(modes == self.ON, self.condenser_W_per_K * (self.condenser_temperature_K * durations - integral_T),
+                             np.where(modes == self.FULL, self.cop[hour] * self.pump_power_W * durations, 0.0))
+        cop = self.cop[hour]
+        return {"electrical_J": delivered / cop if cop > 0 else np.zeros(len(modes)), "delivered_J": delivered,
+                "loss_J": self.loss_W_per_K * (integral_T - self.outdoor_K[hour] * durations),
+                "hot_water_J": hot_water * durations}
+
+    def sample(self, times_s):
+        '''
+        Tank temperature (K), pump status (0 or 1) and electrical energy used so far (J) at the given times
+        (s from the start of the run), worked out from the log one hour at a time.
+        '''
+        times = np.asarray(times_s, dtype=float)
+        temps, status, energy = np.zeros(len(times)), np.zeros(len(times), dtype=int), np.zeros(len(times))
+        last_hour = len(self.outdoor_K) - 1
+        hours = np.clip((times // 3600).astype(int), 0, last_hour)
+        for hour in np.unique(hours):
+            chosen = hours == hour
+            pieces = self.hour_pieces(hour)
+            k = np.maximum(np.searchsorted(pieces["starts"], times[chosen], side="right") - 1, 0)
+            tau = times[chosen] - pieces["starts"][k]
+            b, f, start_T, modes = pieces["b"][k], pieces["f"][k], pieces["start_temperature_K"][k], pieces["modes"][k]
+            x = b * tau
+            temps[chosen] = start_T * np.exp(x) + f * tau * phi(x)
+            status[chosen] = modes != self.OFF
+            before = np.concatenate(([0.0], np.cumsum(pieces["electrical_J"])))[k]
+            energy[chosen] = (self.hour_energy_J[hour] + before
+                              + self.piece_energies(hour, modes, start_T, b, f, tau, np.zeros(len(k)))["electrical_J"])
+        return temps, status, energy
+
+    def switch_times(self):
+        # Times (s) the pump was turned on or off (on first, as every run starts with the pump off)
+        running = np.concatenate(([False, self.hour_mode[0] != self.OFF], self.event_mode != self.OFF))
+        times = np.concatenate(([0.0, 0.0], self.event_s))
+        return times[1:][running[1:] != running[:-1]]
+
+    def nbytes(self):
+        # Memory used by the log's arrays (bytes)
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def save(self, path):
+        # Writes the log to a compressed .npz file (EventLog.load reads it back)
+        np.savez_compressed(path, start_datetime=np.array(self.start_datetime.isoformat()),
+                            **{name: getattr(self, name) for name in self.ARRAYS},
+                            **{name: np.array(getattr(self, name)) for name in self.SCALARS})
+
+    @classmethod
+    def load(cls, path):
+        # Reads a log written by save
+        with np.load(path) as data:
+            return cls(datetime.fromisoformat(str(data["start_datetime"])),
+                       **{name: data[name] for name in cls.ARRAYS + cls.SCALARS})
+
+
+def load_solver_profile(path):
+    '''
+    Reads a solver profile file (YAML, as written by heat_pump_solver_tuning.py) and returns its settings:
+    any of SOLVER_PROFILE_DEFAULTS, plus output_grid if the profile sets one.
+    '''
+    profile = load_yaml_file(path).get('solver_profile', {})
+    unknown = set(profile) - set(SOLVER_PROFILE_DEFAULTS) - {'output_grid'}
+    if unknown:
+        raise ValueError(f"Unknown solver profile settings in {path}: {', '.join(sorted(unknown))}.")
+    return profile
+
+
+def pump_cycling(times, status, short_cycle_s=SHORT_CYCLE_S):
+    '''
+    Cycling statistics (CYCLING_METRICS) of a pump status series sampled at `times` (s): 0/1 for the on/off mode,
+    or the fraction of full power in the modulating mode, where any power counts as running. Each status is held
+    until the next sample.
+
+    The runs of equal status are found by run-length encoding: the indices where the status changes mark where
+    each run begins, so everything is a handful of array operations (a year of one-minute samples takes a few
+    milliseconds). The first and last runs are cut short by the start and end of the period, so they are left out
+    of the on/off durations and the short cycles. Starts are counted per clock hour and per day from the start,
+    and the duty cycle (time-weighted status) per hour.
+    '''
+    times = np.asarray(times, dtype=float)
+    status = np.asarray(status, dtype=float)
+    running = status > 0
+    changes = np.flatnonzero(running[1:] != running[:-1]) + 1  # Sample index where each run after the first begins
+    run_is_on = running[np.concatenate(([0], changes))]
+    durations = np.diff(np.concatenate(([times[0]], times[changes], [times[-1]])))
+    complete = np.zeros(len(durations), dtype=bool)
+    complete[1:-1] = True
+    on_minutes = durations[run_is_on & complete] / 60
+    off_minutes = durations[~run_is_on & complete] / 60
+    starts = times[changes[running[changes]]] - times[0]  # Time of every off -> on switch from the start (s)
+
+    period_s = times[-1] - times[0]
+    starts_each_hour = np.bincount((starts // 3600).astype(int), minlength=max(math.ceil(period_s / 3600), 1))
+    starts_each_day = np.bincount((starts // 86400).astype(int), minlength=max(math.ceil(period_s / 86400), 1))
+    # Duty cycle of each hour: time integral of the held status over the hour, divided by its length
+    on_time = np.concatenate(([0.0], np.cumsum(np.diff(times) * status[:-1])))
+    edges = np.append(np.arange(times[0], times[-1], 3600.0), times[-1])
+    duty = np.diff(np.interp(edges, times, on_time)) / np.diff(edges) if len(edges) > 1 else status[:1]
+
+    def minutes(values, reduce):
+        return float(reduce(values)) if len(values) else float("nan")  # nan when there is no complete run
+    return dict(zip(CYCLING_METRICS, (
+        int(len(starts)),
+        float(len(starts) / (period_s / 3600)) if period_s > 0 else 0.0,
+        int(starts_each_hour.max()),
+        float(len(starts) / (period_s / 86400)) if period_s > 0 else 0.0,
+        int(starts_each_day.max()),
+        int(np.count_nonzero(on_minutes < short_cycle_s / 60)),
+        minutes(on_minutes, np.mean), minutes(on_minutes, np.min), minutes(on_minutes, np.max),
+        minutes(off_minutes, np.mean), minutes(off_minutes, np.min),
+        float(on_time[-1] / period_s) if period_s > 0 else float(status[0]),
+        *(float(value) for value in np.percentile(duty, (10, 50, 90))),
+        float(np.max(duty)),
+    )))
+
+
+def download_weather_table(location, start_datetime, end_datetime):
+    # Hourly Meteostat temperatures as (times as datetime64[s], temperatures in K), the same form as read_weather_table
+    from meteostat import Point, Hourly # Imported only when weather is actually downloaded
+    weather_data = Hourly(Point(*location), start_datetime, end_datetime).fetch()
+    return weather_data.index.values.astype("datetime64[s]"), weather_data['temp'].values + 273.15
+
+
+def weather_window(times, temps, start_datetime, end_datetime, source="the weather data"):
+    # Temperatures (K, as a list) of a weather table between the start and end dates, both included as Meteostat does
+    first = np.searchsorted(times, np.datetime64(start_datetime, "s"), side="left")
+    last = np.searchsorted(times, np.datetime64(end_datetime, "s"), side="right")
+    outdoor_temp_K_array = temps[first:last].tolist()
+    if not outdoor_temp_K_array:
+        raise ValueError(f"No weather data in {source} between {start_datetime} and {end_datetime}.")
+    return outdoor_temp_K_array
+
+
+class SimulationCancelled(Exception):
+    # Raised inside a run once its cancel_event is set (see HeatPumpModel.report_progress)
+    pass
+
+
+class HeatPumpModel:
+    '''
+    Simulation of the heat pump, hot water tank and building without a GUI.
+
+    Typical use:
+        model = HeatPumpModel()                      # inputs from inputs.yaml
+        model.initialize_simulation(start, end)      # fit COP, fetch weather, solve the ODE
+        model.calculate_metrics()                    # energy, COP and heat loss metrics
+    '''
+    # Stages of a run with what each one depends on and what it produces, for incremental runs (see run_stage):
+    #   after    : stages whose results it uses
+    #   settings : model attributes it reads (methods are called, e.g. hot_water_included)
+    #   inputs   : input_values it reads (None: all of them)
+    #   outputs  : attributes it sets
+    # A stage is only run again when one of these, or a stage it comes after, has changed.
+    PIPELINE_STAGES = {
+        "cop": {"after": (), "settings": ("yaml_cop_file_path", "cop_file_time", "condenserT", "cop_map_file", "cop_parameters"),
+                "inputs": (), "outputs": ("COPData", "deltaT_array", "A", "B", "cop_fit_covariance", "cop_map")},
+        "weather": {"after": (), "settings": ("location", "weather_file", "weather_file_time", "weather_table", "start_datetime",
+                                              "total_seconds"),
+                    "inputs": (), "outputs": ("outdoor_temp_K_array",)},
+        "heat_load": {"after": ("weather",), "settings": ("building_model",),
+                      "inputs": ("wall_area", "wall_u_value", "roof_area", "roof_u_value", "indoor_setpoint_temperature_K",
+                                 *BUILDING_MASS_DEFAULTS),
+                      "outputs": ("q_load_array", "dT_ambient_list")},
+        "hot_water": {"after": (), "settings": ("building_number", "hot_water_included"), "inputs": (),
+                      "outputs": ("hot_water_demand", "rng_state_at_start")},
+        "solve": {"after": ("cop", "heat_load", "hot_water"),
+                  "settings": ("control_mode", "energy_accounting", "output_grid", "solver_settings", "steps_each_hour",
+                               "modulating_steps_each_hour", "Pump_Power"),
+                  "inputs": None,
+                  "outputs": ("latest_solution", "controller_integral_array", "electrical_energy_array", "run_totals",
+                              "rhs_evaluations", "event_log", "pump_switch_times")},
+        "metrics": {"after": ("solve",), "settings": ("carbon_intensity_file", "tariff_file", "accounting_file_times"), "inputs": (),
+                    "outputs": ("pump_status", "energy_array", "q_transfer_array", "cop_array", "q_loss_list", "time_cop_array",
+                                "energy_metrics", "COP_average", "Q_loss_average", "total_HotWater", "sampled_energy_array")},
+    }
+    # Running totals carried as extra ODE states in the "states" energy accounting mode (all in Joules)
+    ACCUMULATOR_NAMES = ("electrical_energy_J", "delivered_heat_J", "tank_loss_J", "hot_water_energy_J")
+    # Everything a finished run leaves behind for the plots and metrics (copied by adopt_results)
+    RESULT_ATTRIBUTES = ("input_values", "building_number", "building_model", "COPData", "deltaT_array", "A", "B",
+                         "cop_map", "control_mode", "controller", "controller_integral_array", "electrical_energy_array", "real_U_loss", "start_datetime", "total_seconds", "outdoor_temp_K_array", "q_load_array",
+                         "hot_water_demand", "rng_state_at_start", "pump_switch", "pump_switch_times", "run_totals", "event_log", "energy_array",
+                         "cop_array", "q_transfer_array", "q_loss_list", "dT_ambient_list", "pump_status",
+                         "time_cop_array", "sampled_energy_array", "energy_metrics", "COP_average", "Q_loss_average", "total_HotWater")
+
+    def __init__(self, input_values=None, building_number=3, include_hot_water_demand=False,
+                 yaml_sim_file_path=DEFAULT_INPUTS_FILE, yaml_cop_file_path=DEFAULT_COP_FILE, weather_file=None, rng=None):
+        # Dictionary to store the simulation inputs
+        self.input_values = {}
+
+        # Arrays to store simulation data for analysis
+        self.energy_array = []         # Stores energy consumption values during the simulation
+        self.cop_array = []            # Stores Coefficient of Performance (COP) values
+        self.q_transfer_array = []     # Stores heat transfer data from the heat pump
+        self.q_loss_list = []          # Tracks heat loss throughout the simulation
+        self.q_load_array = []         # Tracks heat load on the building
+
+        # Variables to manage heat pump status and temperature tracking
+        self.pump_status = []          # Tracks whether the heat pump is on or off at each timestep
+        self.pump_switch_log = []      # Times (s) the ODE has switched the pump so far in the current solve
+        self.pump_switch_times = np.zeros(0)  # Times (s) the ODE switched the pump in the latest solve (on, off, on, ...)
+        self.run_temps = []            # Stores the tank temperatures for each simulation run
+        self.run_times = []            # Stores the timestamps for each simulation run
+        self.run_numbers = []          # Run number (1, 2, 3, ...) of each stored run, used for the plot labels
+        self.dT_ambient_list = []      # Stores differences between indoor and outdoor temperatures
+
+        # Run history (the GUI keeps earlier runs so they can be compared on the same plot)
+        self.max_runs = 10             # Most runs kept in memory; older runs are dropped or spilled to disk
+        self.history_storage = "float32"  # Copies kept of runs older than the latest: "full", "float32" or "decimated"
+        self.history_plot_points = 2000   # Points kept of each older run when history_storage is "decimated"
+        self.spill_directory = None    # Folder where dropped runs are saved (.npz) instead of being thrown away
+        self.spilled_runs = {}         # Run number -> file, for runs spilled to disk
+        self.run_count = 0             # Runs since the history was last cleared
+
+        # Simulation settings and file paths
+        self.building_number = building_number  # 0 = Library, 1 = Modern Office Building, 2 = Industrial Warehouse, 3 = Apartment
+        self.include_hot_water_demand = include_hot_water_demand  # Include/exclude hot water demand in the simulation
+        self.yaml_sim_file_path = yaml_sim_file_path  # File path for the simulation input YAML file
+        self.yaml_cop_file_path = yaml_cop_file_path  # File path for the COP data YAML file
+        self.weather_file = weather_file  # Optional local CSV of hourly temperatures used instead of Meteostat
+        # Optional (times as datetime64[s], temperatures in K) arrays already in memory, e.g. many years of weather in
+        # shared memory (heat_pump_years.py). Used instead of the weather file or Meteostat when set
+        self.weather_table = None
+        # Optional hourly carbon intensity and tariff files (see CARBON_INTENSITY_COLUMN and TARIFF_COLUMN). When set,
+        # the metrics also give the emissions and the cost of the electricity used
+        self.carbon_intensity_file = None
+        self.tariff_file = None
+        self.stream_accounting = {}  # Series charged in a streamed run and their totals so far (see stream_row)
+        self.stream_charges = {}
+        # Random number generator for the hot water demand. Its state is saved in checkpoints so a resumed run draws the same demand
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.location = (55.9533, -3.1883)  # Latitude and longitude for Meteostat (EDINBURGH)
+
+        # Define constants
+        self.Pump_Power = 2000  # W
+        self.condenserT = 60 + 273.15  # K #Condenser Temperature
+        self.steps_each_hour = 30
+        # The modulating mode has no on/off switching for the solver to step through, so it can take longer steps
+        self.modulating_steps_each_hour = 4
+        self.short_cycle_s = SHORT_CYCLE_S  # Pump runs shorter than this (s) are counted as short cycles
+        # Optional manufacturer COP map (YAML, see heat_pump_cop_map.py) over outdoor and flow temperature. When it is
+        # set the COP is looked up in the map (flow temperature = condenser temperature) instead of the fitted curve
+        self.cop_map_file = None
+        self.cop_map = None
+        # Optional (A, B) of the COP curve used instead of the fitted values (heat_pump_cop_uncertainty.py ensembles)
+        self.cop_parameters = None
+        self.cop_fit_covariance = None  # Covariance of the fitted A and B
+        # Output grid for the stored solution: "uniform" (t_eval with time_points samples),
+        # "dense" (dense output resampled onto time_points samples) or "solver" (every RK45 step)
+        self.output_grid = "uniform"
+        # Energy accounting: "states" integrates running energy totals alongside the tank temperature,
+        # "samples" integrates the stored samples afterwards
+        self.energy_accounting = "states"
+        self.run_totals = None # Totals (J) from the latest run when energy accounting is "states"
+        # Building heat load: "steady" (UA·ΔT, reacts instantly to the outdoor temperature) or
+        # "rc" (envelope, air and internal mass nodes, so the building stores heat)
+        self.building_model = "steady"
+        # Heat pump control: "on_off" (full power between the on and off thresholds) or "modulating"
+        # (a PI controller on the tank temperature sets the compressor power, see compressor_power)
+        self.control_mode = "on_off"
+        self.controller = dict(CONTROLLER_DEFAULTS)  # Controller settings of the latest run
+        self.controller_integral_array = None  # Integral state of the controller at the stored times (modulating mode)
+        self.electrical_energy_array = None  # Electrical energy used so far (J) at the stored times ("states" accounting)
+        self.sampled_energy_array = None  # The same from the samples and pump switches ("samples" accounting)
+        # ODE solver settings (see SOLVER_PROFILE_DEFAULTS), changed by a solver profile file
+        self.solver_profile_file = None
+        self.solver_settings = dict(SOLVER_PROFILE_DEFAULTS)
+        self.rhs_evaluations = 0  # Calls of the ODE right hand side in the latest solve (the cost of a run)
+        # Incremental runs: with a stage_cache (a dict, e.g. kept by the GUI and given to every run) a stage whose
+        # inputs have not changed since the last run reuses its outputs instead of running again (see run_stage).
+        # changed_stages lists the stages the latest run had to compute and stage_fingerprints what each stage of
+        # the latest run depended on (so a display can tell which of its figures are out of date)
+        self.stage_cache = None
+        self.changed_stages = set(self.PIPELINE_STAGES)
+        self.stage_fingerprints = {}
+        self.latest_solution = None  # (times, tank temperatures) of the latest solve
+        self.event_log = None  # EventLog of the latest solve with the "events" output grid
+
+        # Optional hooks for runs in a background thread: progress_callback(stage, fraction) is told how far the
+        # run has got, and setting cancel_event (a threading.Event) stops the run with SimulationCancelled
+        self.progress_callback = None
+        self.cancel_event = None
+
+        # Arrays for hot water demand and total demand tracking
+        self.hot_water_demand = []     # Stores the generated hot water demand profile
+
+        # Initialize time settings for the hot water demand profile (repeats every 24 hours)
+        self.total_hours = 24
+        self.time_steps = self.total_hours * 60 #One step each minute
+        # Create a time array spanning 24 hours, with each step representing one minute
+        self.time = np.linspace(0, self.total_hours, self.time_steps)
+
+        if input_values is None:
+            self.load_inputs()
+        else:
+            self.input_values.update(input_values)
+
+    def hot_water_included(self):
+        # True when the stochastic hot water demand is part of the heat load
+        return bool(self.include_hot_water_demand)
+
+    def load_inputs(self):
+        """Reads inputs.yaml into input_values using the names the simulation expects."""
+        inputs = load_yaml_file(self.yaml_sim_file_path)
+        for yaml_key, input_key in YAML_INPUT_KEYS.items():
+            value = self.get_nested_value(inputs, yaml_key.split('.'))
+            if value == {} and input_key in BUILDING_MASS_DEFAULTS:
+                value = BUILDING_MASS_DEFAULTS[input_key] # Older input files have no thermal mass values
+            if value == {} and input_key in CONTROLLER_DEFAULTS:
+                value = CONTROLLER_DEFAULTS[input_key] # ... or controller settings
+            self.input_values[input_key] = float(value)
+        self.input_values.setdefault('tank_length', 1.0) # Not in the YAML file, same default as the GUI
+        # Output grid and energy accounting are words rather than numbers so they are read separately
+        self.output_grid = self.get_nested_value(inputs, ['simulation_parameters', 'output_grid', 'value']) or "uniform"
+        self.energy_accounting = self.get_nested_value(inputs, ['simulation_parameters', 'energy_accounting', 'value']) or "states"
+        self.building_model = self.get_nested_value(inputs, ['simulation_parameters', 'building_model', 'value']) or "steady"
+        self.cop_map_file = self.get_nested_value(inputs, ['heat_pump', 'cop_map_file', 'value']) or None
+        self.control_mode = self.get_nested_value(inputs, ['simulation_parameters', 'control_mode', 'value']) or "on_off"
+        self.solver_profile_file = self.get_nested_value(inputs, ['simulation_parameters', 'solver_profile', 'value']) or None
+        if self.solver_profile_file:
+            self.apply_solver_profile(load_solver_profile(self.solver_profile_file))
+        self.carbon_intensity_file = self.get_nested_value(inputs, ['grid', 'carbon_intensity_file', 'value']) or None
+        self.tariff_file = self.get_nested_value(inputs, ['grid', 'tariff_file', 'value']) or None
+        self.load_history_settings(inputs)
+
+    def apply_solver_profile(self, profile):
+        # Uses the solver settings of a profile (from load_solver_profile); settings it does not give are left as they are
+        profile = dict(profile)
+        self.output_grid = profile.pop('output_grid', None) or self.output_grid
+        self.solver_settings.update(profile)
+
+    def load_history_settings(self, inputs):
+        # Run history settings from the run_history section of inputs.yaml (kept as they are if it is missing)
+        history = inputs.get('run_history', {})
+        self.max_runs = int(self.get_nested_value(history, ['max_runs', 'value']) or self.max_runs)
+        self.history_storage = self.get_nested_value(history, ['storage', 'value']) or self.history_storage
+        self.history_plot_points = int(self.get_nested_value(history, ['plot_points', 'value']) or self.history_plot_points)
+        self.spill_directory = self.get_nested_value(history, ['spill_directory', 'value']) or self.spill_directory
+
+    def prepare_simulation(self, start_datetime, end_datetime):
+        '''
+        Everything that has to happen before the ODE can be solved: pump state, validation,
+        tank heat loss, COP fit, weather data, heat load values and the hot water demand profile.
+        '''
+        self.pump_switch = False  # Start with pump Off
+        self.pump_switch_log = []
+        self.report_progress("preparing", 0.0)
+
+        # Store total simulation time
+        self.start_datetime = start_datetime
+        self.total_seconds = (end_datetime - start_datetime).total_seconds()
+        if self.total_seconds <= 0:
+            raise ValueError("End date must be after the start date.")
+        # Condenser mathematically cannot reach 60 deg if it is set to 60
+        if self.input_values['fixed_condenser_temperature_K'] < 333.15:
+            raise ValueError("Fixed condenser temperature must be above 60°C (333.15K)")
+        if self.building_model not in ("steady", "rc"):
+            raise ValueError(f"Unknown building model '{self.building_model}'. Use 'steady' or 'rc'.")
+        if self.control_mode not in ("on_off", "modulating"):
+            raise ValueError(f"Unknown control mode '{self.control_mode}'. Use 'on_off' or 'modulating'.")
+        self.controller = self.controller_settings()
+        if not 0 <= self.controller['min_compressor_power_W'] < self.controller['max_compressor_power_W']:
+            raise ValueError("The minimum compressor power must be at least 0 and below the maximum compressor power.")
+
+        self.initialise_tank_params()
+        self.report_progress("fitting COP curve", 0.0)
+        self.run_stage("cop", self.prepare_cop_curve)
+
+        # Extract weather data
+        self.report_progress("loading weather", 0.0)
+        def load_weather():
+            self.outdoor_temp_K_array = self.extract_weather_data(start_datetime, end_datetime)
+        self.run_stage("weather", load_weather)
+        self.report_progress("building heat load", 0.0)
+
+        # Calculate Q load values
+        self.run_stage("heat_load", self.calculate_q_load_values)
+
+        # Generate the hot water demand profile once so the ODE, the metrics and the plot all use the same draw.
+        # The RNG state before the draw is kept so a resumed run can redraw exactly the same profile.
+        # With a stage_cache the draw is kept until the building or the hot water setting changes, so runs that
+        # differ in one setting are compared on the same demand.
+        def draw_hot_water():
+            self.rng_state_at_start = self.rng.bit_generator.state
+            self.hot_water_demand = self.generate_hot_water_demand() if self.hot_water_included() else []
+        self.run_stage("hot_water", draw_hot_water)
+
+    def prepare_cop_curve(self):
+        # COP fit (and COP map if there is one), the "cop" stage of a run
+        self.fit_cop_curve()
+        if self.cop_parameters is not None:
+            self.A, self.B = self.cop_parameters  # Given curve instead of the fit, e.g. one bootstrap draw of A and B
+        self.load_cop_map()
+
+    def accounting_file_times(self):
+        # Modified times of the carbon intensity and tariff files, so editing one invalidates the "metrics" stage
+        return tuple(os.path.getmtime(path) if path else None for path in (self.carbon_intensity_file, self.tariff_file))
+
+    def cop_file_time(self):
+        # Modified times of the COP data file and COP map file, so editing either invalidates the "cop" stage
+        return (os.path.getmtime(self.yaml_cop_file_path),
+                os.path.getmtime(self.cop_map_file) if self.cop_map_file and os.path.exists(self.cop_map_file) else None)
+
+    def weather_file_time(self):
+        # Modified time of the local weather file, so editing it invalidates the "weather" stage
+        return os.path.getmtime(self.weather_file) if self.weather_file and os.path.exists(self.weather_file) else None
+
+    def stage_fingerprint(self, stage):
+        '''
+        Everything the outputs of a stage depend on (see PIPELINE_STAGES): the fingerprints of the stages it
+        comes after, its settings and its input values. Arrays (e.g. a weather table) are identified by a digest of
+        their contents, never by the object: Python reuses the id of a freed object, so a new table could
+        otherwise match the fingerprint of an old one. Files are identified by path and modified time.
+        '''
+        spec = self.PIPELINE_STAGES[stage]
+        def comparable(value):
+            if callable(value):
+                value = value()
+            if isinstance(value, dict):
+                return tuple(sorted((key, comparable(item)) for key, item in value.items()))
+            if isinstance(value, (list, tuple)):
+                return tuple(comparable(item) for item in value)
+            if value is None or isinstance(value, (str, int, float, bool, datetime)):
+                return value
+            if isinstance(value, np.generic):
+                return value.item()
+            if isinstance(value, np.ndarray):
+                data = np.ascontiguousarray(value)
+                return (data.dtype.str, data.shape, hashlib.blake2b(data.view(np.uint8).ravel(), digest_size=16).digest())
+            raise TypeError(f"Stage setting of type {type(value).__name__} cannot be fingerprinted.")
+        names = sorted(self.input_values) if spec["inputs"] is None else spec["inputs"]
+        return (tuple(self.stage_fingerprint(before) for before in spec["after"]),
+                tuple(comparable(getattr(self, name, None)) for name in spec["settings"]),
+                tuple(self.input_values.get(name) for name in names))
+
+    def run_stage(self, stage, compute):
+        '''
+        Runs one stage of a run with compute(), or, when there is a stage_cache and nothing the stage depends
+        on has changed since it was cached, takes its outputs from the cache instead. Returns True if the
+        stage was computed. Outputs are copied in and out of the cache, so later runs cannot change them.
+        '''
+        fingerprint = self.stage_fingerprints[stage] = self.stage_fingerprint(stage)
+        if self.stage_cache is None:
+            compute()
+            self.changed_stages.add(stage)
+            return True
+        cached = self.stage_cache.get(stage)
+        if cached is not None and cached[0] == fingerprint:
+            for name, value in cached[1].items():
+                setattr(self, name, copy.copy(value))
+            return False
+        compute()
+        self.changed_stages.add(stage)
+        self.stage_cache[stage] = (fingerprint, {name: copy.copy(getattr(self, name, None))
+                                                 for name in self.PIPELINE_STAGES[stage]["outputs"]})
+        return True
+
+    def initialize_simulation(self, start_datetime, end_datetime):
+        self.changed_stages = set()
+        self.prepare_simulation(start_datetime, end_datetime)
+        # Solve ODE (unless the stage cache already has the solution for exactly these settings)
+        if not self.run_stage("solve", lambda: self.solve_ode(start_datetime, end_datetime)):
+            self.store_run(*self.latest_solution)
+
+    def fit_cop_curve(self):
+        # The same COP file gives the same fit, so it is only done once per process
+        key = (os.path.abspath(self.yaml_cop_file_path), os.path.getmtime(self.yaml_cop_file_path), self.condenserT)
+        if key in _cop_fit_cache:
+            self.COPData, self.deltaT_array, self.A, self.B, self.cop_fit_covariance = _cop_fit_cache[key]
+            return
+        from scipy.optimize import curve_fit # For performing curve fitting (fitting a function to a dataset).
+
+        # Load COP data from the YAML file
+        # The file path is specified by 'self.yaml_cop_file_path'
+        cop_data = load_yaml_file(self.yaml_cop_file_path)  # Parse the YAML file into a Python dictionary
+
+        # Extract the noisy COP values from the loaded data
+        # 'COP_noisy' contains the Coefficient of Performance values from the dataset
+        self.COPData = [entry['COP_noisy'] for entry in cop_data['heat_pump_cop_data']]
+
+        # Extract the corresponding outdoor temperatures (in °C) from the dataset
+        # These temperatures are needed to analyze the relationship between outdoor conditions and COP
+        outdoor_temps = [entry['outdoor_temp_C'] for entry in cop_data['heat_pump_cop_data']]
+
+        #Finding Temperature Difference between condenser and outside temp
+        self.deltaT_array = [self.condenserT - (temp + 273.15) for temp in outdoor_temps]
+
+        # Fit COP function
+        # The covariance of A and B is kept for their standard errors (see also heat_pump_cop_uncertainty.py)
+        (self.A, self.B), self.cop_fit_covariance = curve_fit(self.COPFunction, self.deltaT_array, self.COPData)
+        _cop_fit_cache[key] = (self.COPData, self.deltaT_array, self.A, self.B, self.cop_fit_covariance)
+
+    def load_cop_map(self):
+        # Reads cop_map_file into a lookup table, once per process for the same file (no file: the fitted curve is used)
+        if not self.cop_map_file:
+            self.cop_map = None
+            return
+        key = (os.path.abspath(self.cop_map_file), os.path.getmtime(self.cop_map_file))
+        if key not in _cop_map_cache:
+            _cop_map_cache[key] = COPMap.from_entries(load_yaml_file(self.cop_map_file)['heat_pump_cop_map'])
+        self.cop_map = _cop_map_cache[key]
+
+    def get_nested_value(self, data, keys):
+        """
+        "Fetch a value from a nested dictionary using a list of keys. Returns the value at the specified path or an empty dictionary if any key is missing."
+        """
+        for key in keys:
+            data = data.get(key, {})
+        return data
+    
+    def initialise_tank_params(self):
+        # Finding the Real U_loss
+        water_volume = self.input_values['mass_of_water'] / 1000 #density of water is assumed to be 1000kg/m³
+        tank_length = self.input_values['tank_length']
+        # Finding the radius of the water tank
+        water_tank_radius = np.sqrt(water_volume/(tank_length*np.pi))
+        # Surface area of a cylinder = A=2πrh+2πr²
+        tank_area = 2 * np.pi * water_tank_radius * tank_length + 2 * np.pi * water_tank_radius **2
+        # Tank area is related to the amount of heat lost in the system
+        self.real_U_loss = self.input_values['heat_loss_coefficient'] * tank_area
+
+
+    ''' Collecting Weather Data'''
+    def extract_weather_data(self, start_datetime, end_datetime):
+        if self.weather_table is not None:
+            return weather_window(*self.weather_table, start_datetime, end_datetime)
+        if self.weather_file:
+            return self.load_weather_file(start_datetime, end_datetime)
+        key = (tuple(self.location), start_datetime, end_datetime)
+        if key in _meteostat_cache:
+            return list(_meteostat_cache[key])
+        # Same Meteostat download as the multi-year runs (heat_pump_years.py), cut to the run's window
+        outdoor_temp_K_array = weather_window(*download_weather_table(self.location, start_datetime, end_datetime),
+                                              start_datetime, end_datetime, f"the Meteostat data for {self.location}")
+        remember(_meteostat_cache, key, list(outdoor_temp_K_array))
+        return outdoor_temp_K_array
+
+    def load_weather_file(self, start_datetime, end_datetime):
+        '''
+        Local stand-in for Meteostat. Reads a CSV file with a 'time' column (ISO format, hourly) and a
+        'temp' column (°C), the same layout as a Meteostat export, and returns the temperatures (K)
+        between the start and end dates (both included, as Meteostat does).
+        '''
+        return weather_window(*read_weather_table(self.weather_file), start_datetime, end_datetime, self.weather_file)
+
+    # Function that finds COP based on temperature difference between condenser and outdoors
+    def COPFunction(self, delta_T, A, B):
+        return A + B / delta_T
+
+    def cop(self, TAmb, part_load=1.0):
+        # COP at outdoor temperature TAmb (K, number or array): from the COP map if there is one, else the fitted curve
+        if self.cop_map is not None:
+            return self.cop_map(TAmb, self.input_values['fixed_condenser_temperature_K'], part_load)
+        return self.COPFunction(self.input_values['fixed_condenser_temperature_K'] - TAmb, self.A, self.B)
+
+    # Determines the Q_load for each outside temperature (T_amb) value entered.
+    def find_heat_load(self, TAmb):
+        '''The heat load, Q_load is the heat used to heat up the Room/House. 
+            It is based on the equation:
+            
+            Q_load = A_w * U_w * (T_amb - T_sp) + A_r * U_r * (T_amb - T_sp)
+            
+        where:
+            A_w   :  Wall area (m²)
+            U_w   :  Wall U-value (W/m²K)
+            A_r   :  Roof area (m²)
+            U_r   :  Roof U-value (W/m²K)
+            T_amb :  Ambient outdoor temperature (K)
+            T_sp  :  Indoor setpoint temperature (K)
+
+        Only ambient outdoor temperature varies.
+        Q load units will be in Watts (W)
+        '''
+        wall_area = self.input_values['wall_area']
+        wall_u_value = self.input_values['wall_u_value']
+        roof_area = self.input_values['roof_area']
+        roof_u_value = self.input_values['roof_u_value']
+        TSetP = self.input_values['indoor_setpoint_temperature_K']
+        Q_load = wall_area * wall_u_value * (TAmb - TSetP) + roof_area * roof_u_value * (TAmb - TSetP)
+        return Q_load
+    
+    # with the outdoor temperature in kelvin this function is used to determine the necessary Q_load.
+    # With the RC building model the hourly values come from rc_heat_load_values instead.
+    def calculate_q_load_values(self):
+        self.q_load_array.clear()
+        self.dT_ambient_list.clear()
+        if self.building_model == "rc":
+            self.q_load_array.extend(self.rc_heat_load_values())
+        for TAmb in self.outdoor_temp_K_array:
+            dT_ambient = TAmb - self.input_values['indoor_setpoint_temperature_K']
+            if self.building_model != "rc":
+                self.q_load_array.append(self.find_heat_load(TAmb))
+            self.dT_ambient_list.append(dT_ambient)
+
+    def building_heat_load(self, t, TAmb):
+        # Building heat load (W) at time t: the steady UA·ΔT value, or the hourly value of the RC model
+        if self.building_model == "rc":
+            hour = min(int(abs(t) // 3600), len(self.q_load_array) - 1)
+            return self.q_load_array[hour]
+        return self.find_heat_load(TAmb)
+
+    def rc_network(self):
+        '''
+        Lumped RC (resistance-capacitance) model of the building with three nodes: the envelope (walls and
+        roof), the indoor air and the internal mass (floors, partitions and furniture).
+
+            C_env  dT_env/dt  = H_out (T_amb - T_env) + H_in (T_air - T_env)
+            C_air  dT_air/dt  = H_in (T_env - T_air) + H_mass (T_mass - T_air) + Q_heat
+            C_mass dT_mass/dt = H_mass (T_air - T_mass)
+
+        where:
+            H_out = H_in = 2 (A_w U_w + A_r U_r)  : Envelope conductance split either side of the envelope node (W/K),
+                                                    so in steady state the heat loss is the same as find_heat_load
+            H_mass = 9.1 * 2.5 * A_floor          : Air to internal mass conductance (W/K), ISO 13790 values
+            C_env  = c_env (A_w + A_r)            : Envelope heat capacity (J/K)
+            C_air  = 1200 * h_storey * A_floor    : Indoor air heat capacity (J/K), 1200 J/m³K for air
+            C_mass = c_int * A_floor              : Internal mass heat capacity (J/K)
+            A_floor : Floor area, taken as the roof area (m²)
+
+        Returns the matrices (A, B) of dx/dt = A x + B u with x = [T_env, T_air, T_mass] and u = [T_amb, Q_heat].
+        '''
+        wall_area = self.input_values['wall_area']
+        roof_area = self.input_values['roof_area']
+        UA = wall_area * self.input_values['wall_u_value'] + roof_area * self.input_values['roof_u_value']
+        mass = {name: self.input_values.get(name, default) for name, default in BUILDING_MASS_DEFAULTS.items()}
+
+        H_out = H_in = 2 * UA
+        H_mass = 9.1 * 2.5 * roof_area
+        C = np.array([mass['envelope_heat_capacity'] * (wall_area + roof_area),
+                      1200 * mass['storey_height'] * roof_area,
+                      mass['internal_heat_capacity'] * roof_area])
+        K = np.array([[-(H_out + H_in), H_in, 0],
+                      [H_in, -(H_in + H_mass), H_mass],
+                      [0, H_mass, -H_mass]])
+        B = np.array([[H_out, 0],
+                      [0, 1],
+                      [0, 0]])
+        return K / C[:, None], B / C[:, None]
+
+    def rc_step_matrices(self, dt=3600):
+        '''
+        Exact step of the RC model over dt seconds with the inputs held constant (the weather is hourly):
+
+            x(t + dt) = Phi x(t) + Gamma u,   Phi = exp(A dt),   Gamma = integral of exp(A s) B ds over [0, dt]
+
+        Both come from one matrix exponential of the augmented matrix [[A, B], [0, 0]] * dt.
+        '''
+        from scipy.linalg import expm # Matrix exponential
+        A, B = self.rc_network()
+        n, m = B.shape
+        augmented = np.zeros((n + m, n + m))
+        augmented[:n, :n] = A
+        augmented[:n, n:] = B
+        exact = expm(augmented * dt)
+        return exact[:n, :n], exact[:n, n:]
+
+    def rc_heat_load_values(self):
+        '''
+        Hourly building heat load (W, negative like find_heat_load) from the RC model. Heating keeps the indoor
+        air at the setpoint: each hour the constant heating power Q_heat is chosen so the air is back at the
+        setpoint at the end of the hour (no cooling, so Q_heat >= 0). The building starts in steady state for
+        the first hour's outdoor temperature. Each hour costs a few 3x3 matrix-vector products, so solve_ivp
+        only sees the hourly values and the stiff air node never enters the ODE.
+        '''
+        Phi, Gamma = self.rc_step_matrices()
+        TSetP = self.input_values['indoor_setpoint_temperature_K']
+        state = np.array([(self.outdoor_temp_K_array[0] + TSetP) / 2, TSetP, TSetP]) # [T_env, T_air, T_mass]
+        q_load_values = []
+        for TAmb in self.outdoor_temp_K_array:
+            free = Phi @ state + Gamma[:, 0] * TAmb # End of hour state without heating
+            Q_heat = max((TSetP - free[1]) / Gamma[1, 1], 0) # Heating that brings the air back to the setpoint
+            state = free + Gamma[:, 1] * Q_heat
+            q_load_values.append(-Q_heat)
+        return q_load_values
+
+    
+    def combined_heat_load(self, t, TAmb):
+        '''
+        The combined heat load accounts for both the building's heat load (Q_load) and the 
+        stochastic hot water demand. It calculates the net heat load based on the following:
+            
+            1. Building heat load (Q_load): The energy required to maintain the desired indoor
+            setpoint temperature (T_sp) considering the ambient temperature (T_amb), wall
+            area, roof area, and their respective U-values. Unit : Watts
+            
+            2. Hot water demand: This is a time-varying component representing the energy
+            required to heat water for usage (e.g., showers, taps). It is stochastic and depends
+            on the building's usage pattern. Unit : Watts 
+            
+            3. Net heat load: The total heat demand minus the hot water demand.
+            
+        Formula:
+            Net Heat Load = Q_load - Hot Water Demand (MINUS BECAUSE QLOAD is negative)
+                
+       '''
+        Q_load = self.building_heat_load(t, TAmb)
+        return Q_load - self.get_hot_water_power(t)
+
+    def get_hot_water_power(self, t):
+        '''
+        Hot water demand (W) at time t, read from the profile generated once at the start of the run
+        so every solver evaluation sees the same demand.
+        '''
+        if len(self.hot_water_demand) == 0:
+            self.hot_water_demand = self.generate_hot_water_demand()
+        index = int((t / 3600) * self.time_steps / self.total_hours) % len(self.hot_water_demand)
+        return self.hot_water_demand[index]
+    
+    def update_pump_status(self, Temp_tank):
+        '''
+        The heat pump is turned off when T_tank is higher than the off threshold (T_off),
+        and vice versa for turning on the tank.
+        
+        The heat into the tank (Q_transfer) follows the equation:
+            
+            if heat pump is on:
+                
+                Q_transfer = U_cond * A_cond * (T_cond - T_tank)
+            
+            if heat pump is off:
+                
+                Q_transfer = 0
+            
+        '''
+        self.pump_switch = self.next_pump_status(Temp_tank, self.pump_switch)
+
+    def record_pump_switch(self, t):
+        '''
+        Keeps the times the ODE switched the pump in pump_switch_log, so the metrics use the pump status the
+        solver really integrated with. The solver can evaluate the ODE back in time (the trial points of a
+        rejected step), so switches recorded after t are dropped first: the log always holds the status
+        the ODE last used at every time. An odd number of switches means the pump is on.
+        '''
+        switches = self.pump_switch_log
+        while switches and switches[-1] > t:
+            switches.pop()
+        if len(switches) % 2 != int(self.pump_switch):
+            if switches and switches[-1] == t:
+                switches.pop() # Switched back at the same time: no run in between
+            else:
+                switches.append(t)
+
+    def pump_status_at(self, times):
+        # Pump status (0 or 1) of the latest solve at the given times (s), from the switch times the ODE made
+        return np.searchsorted(self.pump_switch_times, np.asarray(times, dtype=float), side="right") % 2
+
+    def logged_pump_status(self, t):
+        # Pump status the ODE used at time t of the solve in progress, from pump_switch_log (odd number of switches = on)
+        return bisect.bisect_right(self.pump_switch_log, t) % 2 == 1
+
+    def drop_final_switches(self, t):
+        '''
+        Forgets the switches of pump_switch_log before t, once the solver has passed t and will never evaluate
+        the ODE before it again. They are dropped in pairs so the length of the log keeps its parity (and so
+        the pump status it gives), which keeps the log a few entries long however long a streamed run is.
+        '''
+        final = bisect.bisect_left(self.pump_switch_log, t)
+        del self.pump_switch_log[:final - final % 2]
+
+    def next_pump_status(self, Temp_tank, pump_on):
+        # Same on/off rule as update_pump_status, without changing self.pump_switch
+        if Temp_tank <= self.input_values['on_temperature_threshold_K']:
+            return True #Turn on heat pump
+        elif Temp_tank >= self.input_values['off_temperature_threshold_K']:
+            return False #Turn off heat pump
+        return pump_on
+    #Finding Q_Transfer
+    def get_Q_transfer(self, Temp_tank, TAmb):
+        '''
+        Heat input from the heat pump, Q_hp. We assume that all the 
+        heat from the heat pump is transferred into the heat tank (Q_hp = Q_transfer)
+                
+        where:
+            U_cond  :  Overall heat transfer coefficient (W/m²K)
+            A_cond  :  Heat transfer area (m²)
+            T_cond  :  Fixed temperature of the condenser (K)
+            T_tank  :  Temperature of the water in the tank (K)
+            
+        '''
+        self.update_pump_status(Temp_tank) #Determine if pump is on or not
+        # Not stored here: the solver calls this for every trial step, so values are recomputed on the output grid in calculate_metrics
+        return self.pump_heat_output(Temp_tank, TAmb, self.pump_switch)
+
+    def pump_heat_output(self, Temp_tank, TAmb, pump_on):
+        # Q_transfer (W) for a given pump status, limited to the maximum heat output of the heat pump
+        if pump_on:
+            Q_max = self.max_Q_hp(TAmb) # Finding possible maximum Q
+            U_cond = self.input_values['overall_heat_transfer_coefficient']
+            A_cond = self.input_values['heat_transfer_area']
+            #Q Transfer Formula as mention before. Q Transfer is in terms of Watts
+            Q_transf = U_cond * A_cond * (self.input_values['fixed_condenser_temperature_K'] - Temp_tank) #Watts
+            if Q_transf > Q_max:
+                Q_transf = Q_max #Watts
+        else:
+            Q_transf = 0
+        return Q_transf
+            
+        # Find maximum heat output based on current conditions. We set heat pump power as 2000 which is based on the power supply
+        # for a typical household. We can determine the maximum heat output with the following equation : Q_max = COP * Pump_power
+    def max_Q_hp(self, TAmb):
+        COP = self.cop(TAmb)
+        Q_max = COP * self.Pump_Power #Watts
+        return Q_max
+
+    def get_Q_loss(self, Temp_tank, TAmb):
+        #Define heat loss in system to be used in the ODE
+        '''Aside from thermal load and supply, the tank also loses heat to the surroundings. '''
+        Q_loss = self.real_U_loss * (Temp_tank - TAmb) #Watts
+        return Q_loss
+
+    def find_T_ambient(self, t):
+        hour = int(abs(t) // 3600)# Finds the hour in which the time is taken. Use floor division to get only hour number
+        if hour < len(self.outdoor_temp_K_array):# Gives ambient outdoor temperature based on time
+            return self.outdoor_temp_K_array[hour]
+        else:
+            return self.outdoor_temp_K_array[-1]
+        
+    def tank_ode(self, t, state):
+        """
+        Step 5 combines the supply, extraction, and loss of heat from the Thermal Energy Supply (TES).
+        We also take into account heat loss to the surroundings. 
+        
+        The temperature change in the tank can be modelled with the ODE:
+            
+            d(T_tank)/dt = (Q_hp + Q_load - Q_loss)/(M_water * c_water)
+            
+        where:
+            M_water :  Mass of water in tank (kg)
+            c_water      : Specific heat capacity of water (J/kg·K)
+
+        Note: we add the value of Q_load as it is given as a negative value
+            : we use the equation with M_water as M_water is a given input parameter
+
+        In the "states" energy accounting mode the state vector also carries running totals (J) of
+        electrical energy, delivered heat, tank heat loss and hot water energy, which are integrated
+        together with the tank temperature:
+
+            dE_elec/dt = Q_hp / COP,  dE_heat/dt = Q_hp,  dE_loss/dt = Q_loss,  dE_hw/dt = Q_hot_water
+        """
+        Temp_tank = state[0] # Tank temperature is always the first state
+
+        # Step 1: Find the ambient temperature at the current time (t).
+        TAmb = self.find_T_ambient(t)
+
+        # Step 2: Calculate the heat transferred into the tank by the heat pump (Q_transfer).
+        # In the modulating mode the last state is the integral of the controller and the heat follows the compressor power.
+        modulating = self.control_mode == "modulating"
+        if modulating:
+            power, dIntegraldt = self.compressor_power(Temp_tank, state[-1])
+            Q_transfer, P_electrical, COP = self.modulating_heat_output(Temp_tank, TAmb, power)
+        else:
+            Q_transfer = self.get_Q_transfer(Temp_tank, TAmb)
+            self.record_pump_switch(t)
+        
+        # Step 3: Compute the heat lost to the surroundings (Q_loss).
+        Q_loss = self.get_Q_loss(Temp_tank, TAmb)
+        
+        # Step 4: Compute the heat load (Q_load), including hot water demand if enabled.
+        if self.hot_water_included():
+                Q_load = self.combined_heat_load(t, TAmb)  # Net heat load (building + hot water demand).
+        else:
+                Q_load = self.building_heat_load(t, TAmb)  # Heat load from building only.
+
+        # Step 5: Define constants for water's specific heat capacity and the mass of water in the tank.
+        c_water = self.input_values['specific_heat_capacity']  # Specific heat capacity of water (J/kg·K).
+        MassWater = self.input_values['mass_of_water']  # Mass of water in the tank (kg).
+
+        # Step 6: Calculate the rate of temperature change using the ODE formula.
+        # This considers heat inputs (Q_transfer), heat loads (Q_load), and heat losses (Q_loss).
+        dT_tankdt = (Q_transfer + Q_load - Q_loss) / (MassWater * c_water)
+
+        if len(state) == 1:
+            return [dT_tankdt]
+        if modulating and len(state) == 2:
+            return [dT_tankdt, dIntegraldt]
+
+        # Step 7 (accounting mode): rates of change of the running totals, all in Watts.
+        if not modulating:
+            COP = self.cop(TAmb)
+            P_electrical = Q_transfer / COP if COP > 0 else 0 # Same rule as the energy array in calculate_metrics
+        Q_hot_water = self.get_hot_water_power(t) if self.hot_water_included() else 0
+        derivatives = [dT_tankdt, P_electrical, Q_transfer, Q_loss, Q_hot_water]
+        return derivatives + [dIntegraldt] if modulating else derivatives
+
+    def controller_settings(self):
+        # Modulating controller settings from input_values (CONTROLLER_DEFAULTS for any that are not given)
+        return {name: float(self.input_values.get(name, default)) for name, default in CONTROLLER_DEFAULTS.items()}
+
+    def compressor_power(self, Temp_tank, integral):
+        '''
+        PI control of the compressor power (W) in the modulating mode:
+
+            e = T_set - T_tank,   P = Kp * (e + I / Ti),   dI/dt = e
+
+        P is limited to 0 .. max_compressor_power_W. While P is held at a limit the integral I only moves
+        back towards the range (anti-windup), so the controller reacts as soon as the tank needs it to.
+        The power changes continuously with the tank temperature, so there is no switching for the
+        solver to step through. Returns (P, dI/dt).
+        '''
+        controller = self.controller
+        error = controller['modulation_setpoint_temperature_K'] - Temp_tank
+        demand = controller['controller_gain_W_per_K'] * (error + integral / controller['controller_integral_time_s'])
+        if demand >= controller['max_compressor_power_W']:
+            return controller['max_compressor_power_W'], min(error, 0.0)
+        if demand <= 0.0:
+            return 0.0, max(error, 0.0)
+        return demand, error
+
+    def part_load_cop(self, TAmb, power):
+        '''
+        COP at compressor power `power` (W) in the modulating mode. Between minimum and full power it comes from
+        the part-load axis of the COP map, or (no such axis) rises linearly from the full-load COP to
+        (1 + part_load_cop_gain) x the full-load COP at minimum power. Below minimum power the unit cycles
+        on and off at minimum power and the COP drops by the EN 14825 factor CR / (Cd CR + 1 - Cd),
+        CR = power / minimum power.
+        '''
+        controller = self.controller
+        full, minimum = controller['max_compressor_power_W'], controller['min_compressor_power_W']
+        ratio = max(power, minimum) / full  # Part-load ratio while the compressor runs
+        if self.cop_map is not None and self.cop_map.has_part_load:
+            COP = self.cop(TAmb, ratio)
+        else:
+            COP = self.cop(TAmb) * (1 + controller['part_load_cop_gain'] * (1 - ratio) / (1 - minimum / full))
+        if power < minimum:
+            cycling = power / minimum
+            Cd = controller['cycling_degradation_coefficient']
+            COP *= cycling / (Cd * cycling + 1 - Cd)
+        return COP
+
+    def modulating_heat_output(self, Temp_tank, TAmb, power):
+        # Heat into the tank (W), electrical power (W) and COP at compressor power `power`, limited to what the condenser can pass on
+        COP = self.part_load_cop(TAmb, power)
+        U_cond = self.input_values['overall_heat_transfer_coefficient']
+        A_cond = self.input_values['heat_transfer_area']
+        Q_transf = min(COP * power, max(U_cond * A_cond * (self.input_values['fixed_condenser_temperature_K'] - Temp_tank), 0.0))
+        return Q_transf, (Q_transf / COP if COP > 0 else 0.0), COP
+
+    def solve_ode(self, start_datetime, end_datetime):
+        # Solve ODE for tank temperature dynamics over the simulation period.
+        # Initial condition for the ODE (starting tank temperature, plus running totals in "states" accounting)
+        if self.energy_accounting not in ("states", "samples"):
+            raise ValueError(f"Unknown energy accounting '{self.energy_accounting}'. Use 'states' or 'samples'.")
+        if self.output_grid == "events":
+            return self.solve_events()
+        self.event_log = None
+        y0, atol = self.initial_state(self.energy_accounting == "states")
+
+        # Output grid requested in inputs.yaml (simulation_parameters.time_points). The solver still picks its own
+        # steps, but only these samples are stored, so memory depends on the requested resolution.
+        output_times = self.get_output_times()
+
+        ODE_solution = solve_ivp(
+            self.monitored_ode() if self.progress_callback or self.cancel_event else self.tank_ode,  # ODE function
+            t_span=(0, self.total_seconds), # Time range (start to end in seconds)
+            y0=y0,# Initial condition
+            method=self.solver_settings['method'], # Integration method (RK45 unless a solver profile says otherwise)
+            max_step=self.max_step(), # Maximum step size
+            rtol=self.solver_settings['rtol'], # Relative tolerance
+            atol=atol, # Absolute tolerance per state
+            t_eval=output_times if self.output_grid == "uniform" else None, # Only keep the requested samples
+            dense_output=self.output_grid == "dense" # Keep the interpolant so it can be resampled afterwards
+        )
+        if not ODE_solution.success:
+            raise RuntimeError(f"Solver failed: {ODE_solution.message}")
+        if self.output_grid == "dense" and output_times is not None:
+            # Resample the continuous solution onto the uniform output grid
+            times, states = output_times, ODE_solution.sol(output_times)
+        else:
+            times, states = ODE_solution.t, ODE_solution.y
+        self.rhs_evaluations = ODE_solution.nfev
+        temps = states[0]
+        # Controller integral at the stored times (the last state), needed to recompute the compressor power
+        self.controller_integral_array = states[-1] if self.control_mode == "modulating" else None
+        # Electrical energy used so far (J) at the stored times, from the running total ("states" accounting only)
+        self.electrical_energy_array = states[1] if self.energy_accounting == "states" else None
+        # Store results for plotting and analysis
+        self.pump_switch_times = np.array(self.pump_switch_log if self.control_mode == "on_off" else [], dtype=float)
+        self.latest_solution = (times, temps)
+        self.store_run(times, temps)
+        # Final values of the running totals (J), exact to solver tolerance with no post-processing pass
+        if self.energy_accounting == "states":
+            self.run_totals = dict(zip(self.ACCUMULATOR_NAMES, (float(total) for total in ODE_solution.y[1:, -1])))
+        else:
+            self.run_totals = None
+
+    def solve_events(self):
+        '''
+        The "events" output grid: the run is worked out in closed form between pump switches (EventLog) and
+        only the event log is kept. The stored samples (time_points, or every hour boundary when it is not
+        set) are taken from the log, so the metrics and plots work as for any other run, and the run can be
+        resampled at any other times later with self.event_log.sample.
+        '''
+        if self.control_mode != "on_off":
+            raise ValueError("The 'events' output grid needs the on_off control mode.")
+        self.event_log = EventLog.from_model(self)
+        self.pump_switch_times = self.event_log.switch_times()
+        times = self.get_output_times()
+        if times is None:
+            times = np.append(np.arange(0.0, self.total_seconds, 3600.0), self.total_seconds)
+        temps, _, energy = self.event_log.sample(times)
+        self.rhs_evaluations = 0
+        self.controller_integral_array = None
+        self.electrical_energy_array = energy if self.energy_accounting == "states" else None
+        self.run_totals = (dict(zip(self.ACCUMULATOR_NAMES, (float(total) for total in self.event_log.totals_J)))
+                           if self.energy_accounting == "states" else None)
+        self.latest_solution = (times, temps)
+        self.store_run(times, temps)
+
+    def report_progress(self, stage, fraction):
+        # Tells progress_callback how far the run has got and stops the run if it has been cancelled
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise SimulationCancelled("The run was cancelled.")
+        if self.progress_callback is not None:
+            self.progress_callback(stage, fraction)
+
+    def monitored_ode(self):
+        '''
+        tank_ode with report_progress called as the solver moves forward (every 1 % of the period),
+        so a background run shows its progress and can be cancelled part way through the solve.
+        '''
+        next_report = [0.0]  # Fraction of the period at which progress is next reported
+
+        def ode(t, state):
+            if t >= next_report[0] * self.total_seconds:
+                next_report[0] = t / self.total_seconds + 0.01
+                self.report_progress("solving ODE", t / self.total_seconds)
+            return self.tank_ode(t, state)
+        return ode
+
+    def adopt_results(self, other):
+        '''
+        Takes over the results of a run made by another model (e.g. in a background thread) as if the run
+        had been made here: the RESULT_ATTRIBUTES are copied and its latest run is added to this run history.
+        '''
+        for name in self.RESULT_ATTRIBUTES:
+            if hasattr(other, name):
+                setattr(self, name, getattr(other, name))
+        self.store_run(other.run_times[-1], other.run_temps[-1])
+
+    def max_step(self):
+        # Longest solver step (s): from the solver profile, otherwise for the control mode
+        if self.solver_settings['max_step_s']:
+            return float(self.solver_settings['max_step_s'])
+        return 3600 / (self.modulating_steps_each_hour if self.control_mode == "modulating" else self.steps_each_hour)
+
+    def initial_state(self, with_totals):
+        '''
+        Initial ODE state and absolute tolerances. With running totals the state is
+        [T_tank, E_elec, E_heat, E_loss, E_hot_water]; the totals start at zero and are in Joules,
+        so a 1 J absolute tolerance is plenty. The modulating mode adds the controller integral (K s) at the end.
+        '''
+        y0 = [self.input_values['initial_tank_temperature_K']]
+        atol = [self.solver_settings['atol']] # solve_ivp default unless a solver profile sets it
+        if with_totals:
+            y0 += [0.0] * len(self.ACCUMULATOR_NAMES)
+            atol += [1.0] * len(self.ACCUMULATOR_NAMES)
+        if self.control_mode == "modulating":
+            y0.append(0.0)
+            atol.append(1e-3)
+        return y0, atol[0] if len(atol) == 1 else atol
+
+    def store_run(self, times, temps):
+        '''
+        Adds a run to the run history. The latest run is always kept in full (calculate_metrics uses it);
+        the run before it is only needed for plotting from now on, so it is replaced by a compact copy
+        (history_storage: float32, or float32 with at most history_plot_points points). Once there are more
+        than max_runs runs the oldest is dropped, or saved to spill_directory if one is set.
+        '''
+        if self.run_times:
+            self.run_times[-1], self.run_temps[-1] = self.compact_run(self.run_times[-1], self.run_temps[-1])
+        self.run_count += 1
+        self.run_numbers.append(self.run_count)
+        self.run_times.append(times)
+        self.run_temps.append(temps)
+
+        while len(self.run_times) > max(1, self.max_runs):
+            number, old_times, old_temps = self.run_numbers.pop(0), self.run_times.pop(0), self.run_temps.pop(0)
+            if self.spill_directory:
+                os.makedirs(self.spill_directory, exist_ok=True)
+                path = os.path.join(self.spill_directory, f"run_{number}.npz")
+                np.savez(path, times=old_times, temps=old_temps)
+                self.spilled_runs[number] = path
+
+    def compact_run(self, times, temps):
+        # Copy of a run that is only kept for plotting, as set by history_storage
+        if self.history_storage == "full":
+            return times, temps
+        if self.history_storage not in ("float32", "decimated"):
+            raise ValueError(f"Unknown run history storage '{self.history_storage}'. Use 'full', 'float32' or 'decimated'.")
+        times, temps = np.asarray(times, dtype=np.float32), np.asarray(temps, dtype=np.float32)
+        if self.history_storage == "decimated" and len(times) > self.history_plot_points:
+            # Every n-th point, plus the last point so the line still reaches the end of the run
+            keep = np.arange(0, len(times), math.ceil(len(times) / self.history_plot_points))
+            keep = np.append(keep, len(times) - 1) if keep[-1] != len(times) - 1 else keep
+            times, temps = times[keep], temps[keep]
+        return times, temps
+
+    def load_spilled_run(self, run_number):
+        # (times, temps) of a run that was spilled to disk
+        with np.load(self.spilled_runs[run_number]) as run:
+            return run["times"], run["temps"]
+
+    def history_runs(self):
+        '''
+        (run number, times, temps) of every run in the history, oldest first: the runs spilled to disk, read
+        back one at a time when they are plotted, followed by the runs kept in memory.
+        '''
+        for number in sorted(self.spilled_runs):
+            yield (number, *self.load_spilled_run(number))
+        yield from zip(self.run_numbers, self.run_times, self.run_temps)
+
+    def clear_run_history(self):
+        # Forgets every stored run (and deletes the files of spilled runs)
+        for path in self.spilled_runs.values():
+            if os.path.exists(path):
+                os.remove(path)
+        self.spilled_runs.clear()
+        self.run_times.clear()
+        self.run_temps.clear()
+        self.run_numbers.clear()
+        self.run_count = 0
+
+    def get_output_times(self):
+        '''
+        Returns the uniform output grid (seconds) used to store the solution, or None when every
+        solver step should be kept ("solver" grid or time_points not set).
+        '''
+        time_points = int(self.input_values.get('time_points', 0))
+        if self.output_grid not in ("uniform", "dense", "solver", "events"):
+            raise ValueError(f"Unknown output grid '{self.output_grid}'. Use 'uniform', 'dense', 'solver' or 'events'.")
+        if self.output_grid == "solver" or time_points < 2:
+            return None
+        return np.linspace(0, self.total_seconds, time_points)
+
+    def integrate_over_time(self, values, times):
+        '''
+        Trapezoidal integral of a sampled power series (W) over time (s). Works for uneven spacing,
+        so totals do not depend on how the solver placed its steps. Result is in Joules.
+        '''
+        values = np.asarray(values, dtype=float)
+        times = np.asarray(times, dtype=float)
+        if len(times) < 2:
+            return 0.0
+        return float(np.sum(0.5 * (values[1:] + values[:-1]) * np.diff(times)))
+
+    def sampled_energy(self, times, temps, power):
+        '''
+        Electrical energy used so far (J) at each sample, the trapezoidal integral of the electrical power at
+        the samples. Every pump switch the ODE made between two samples is added as two more samples at the
+        switch time, with the power just before and just after it (at the tank temperature interpolated
+        there), so the pump only counts as running while it really was, however far apart the samples are.
+        '''
+        times, temps, power = (np.asarray(values, dtype=float) for values in (times, temps, power))
+        switches = self.pump_switch_times[(self.pump_switch_times > times[0]) & (self.pump_switch_times < times[-1])]
+        switch_temps = np.interp(switches, times, temps)
+        on_after = self.pump_status_at(switches).astype(bool)
+
+        def electrical_power(Temp_tank, t, pump_on):
+            TAmb = self.find_T_ambient(t)
+            COP = self.cop(TAmb)
+            return self.pump_heat_output(Temp_tank, TAmb, pump_on) / COP if COP > 0 else 0.0
+        before = [electrical_power(T, t, not on) for T, t, on in zip(switch_temps, switches, on_after)]
+        after = [electrical_power(T, t, on) for T, t, on in zip(switch_temps, switches, on_after)]
+        all_times = np.concatenate((times, switches, switches))
+        all_power = np.concatenate((power, before, after))
+        # At equal times: the power before a switch, then a sample, then the power after it
+        rank = np.concatenate((np.ones(len(times)), np.zeros(len(switches)), np.full(len(switches), 2.0)))
+        order = np.lexsort((rank, all_times))
+        sorted_times, sorted_power = all_times[order], all_power[order]
+        energy = np.concatenate(([0.0], np.cumsum(np.diff(sorted_times) * (sorted_power[1:] + sorted_power[:-1]) / 2)))
+        position = np.empty(len(order), dtype=int)
+        position[order] = np.arange(len(order))
+        return energy[position[:len(times)]]
+
+    def stream_simulation(self, start_datetime, end_datetime, output_interval=None, progress=None, on_step=None, resume=None):
+        '''
+        Generator version of the simulation for long horizons. The ODE is advanced one RK45 step at a
+        time and each result is yielded as soon as it is known, so no full time series is ever held
+        in memory.
+
+            output_interval : None to yield every accepted solver step, or a spacing in seconds to
+                              yield evenly spaced samples from the dense output of each step
+            progress        : optional callback progress(fraction_done, t_seconds), called after every step
+            on_step         : optional callback on_step(), called between steps once every row up to the
+                              current solver time has been consumed. stream_snapshot() is valid there.
+            resume          : a snapshot from stream_snapshot() to carry on from instead of starting at t = 0
+
+        Energy totals are always integrated as extra ODE states here ("states" accounting), so the
+        cumulative columns are exact however the rows are spaced.
+        '''
+        if resume is not None:
+            # Restore the RNG first so prepare_simulation draws the same hot water demand as the original run
+            self.rng.bit_generator.state = resume["rng_state"]
+        self.prepare_simulation(start_datetime, end_datetime)
+        y0, atol = self.initial_state(True)
+        t0, first_step = 0.0, None
+        # Emissions and cost so far (carbon intensity and tariff files only), charged for the energy between rows
+        self.stream_accounting = self.accounting_series()
+        self.carbon_and_cost(np.array([0.0, self.total_seconds]), np.zeros(2), self.stream_accounting) # Files cover the run
+        self.stream_charges = {"t": 0.0, "energy_J": 0.0, **{name: 0.0 for name in self.stream_accounting}}
+        if resume is None:
+            yield self.stream_row(0.0, np.array(y0), self.pump_switch)
+            self.stream_next_output = output_interval
+        else:
+            t0, y0, first_step = resume["t"], resume["y"], resume["step_size"]
+            if first_step is not None:
+                first_step = min(first_step, self.total_seconds - t0) # Must not step past the end
+            self.pump_switch = resume["pump_switch"]
+            self.pump_switch_log = [t0] if self.pump_switch else [] # Same status from the switch log
+            self.stream_next_output = resume["next_output"]
+            self.stream_charges = resume.get("charges", self.stream_charges)
+        self.stream_solver = RK45(self.tank_ode, t0, y0, self.total_seconds, max_step=self.max_step(),
+                                  rtol=self.solver_settings['rtol'], atol=atol, first_step=first_step)
+        solver = self.stream_solver
+
+        while solver.status == "running":
+            if on_step is not None:
+                on_step()
+            solver.step()
+            if solver.status == "failed":
+                raise RuntimeError(f"Solver failed at t = {solver.t:.0f} s: {solver.message}")
+            if output_interval:
+                # Evenly spaced samples inside this step, read from the step's interpolant
+                if self.stream_next_output <= solver.t:
+                    step_solution = solver.dense_output()
+                while self.stream_next_output <= solver.t:
+                    # Pump status the ODE itself used at that time, from the switches it made during the step
+                    state = step_solution(self.stream_next_output)
+                    yield self.stream_row(self.stream_next_output, state, self.logged_pump_status(self.stream_next_output))
+                    self.stream_next_output += output_interval
+            else:
+                yield self.stream_row(solver.t, solver.y, self.logged_pump_status(solver.t))
+            self.drop_final_switches(solver.t) # Rows up to solver.t are written, so memory stays constant
+            if progress is not None:
+                progress(solver.t / self.total_seconds, solver.t)
+
+    def stream_snapshot(self):
+        '''
+        Everything needed to carry on a streamed run from the current solver step: time, ODE state
+        (tank temperature and energy totals), pump status, next output time, step size and the RNG
+        state for the hot water demand. Only plain numbers, lists and dicts, so it can be saved as JSON.
+        '''
+        solver = self.stream_solver
+        return {
+            "t": float(solver.t),
+            "y": [float(value) for value in solver.y],
+            "pump_switch": bool(self.pump_switch),
+            "next_output": self.stream_next_output,
+            "step_size": float(solver.h_abs) if solver.h_abs else None,
+            "rng_state": self.rng_state_at_start,
+            "charges": dict(self.stream_charges),
+        }
+
+    def stream_row(self, t, state, pump_on):
+        # One output record of a streamed run: time, tank state, pump status, COP, powers and energy totals
+        Temp_tank = float(state[0])
+        TAmb = self.find_T_ambient(t)
+        if self.control_mode == "modulating":
+            # Status is the fraction of full compressor power
+            power = self.compressor_power(Temp_tank, float(state[-1]))[0]
+            Q_transf, P_electrical, COP = self.modulating_heat_output(Temp_tank, TAmb, power)
+            status = power / self.controller['max_compressor_power_W']
+        else:
+            Q_transf = self.pump_heat_output(Temp_tank, TAmb, pump_on)
+            COP = self.cop(TAmb)
+            P_electrical = Q_transf / COP if COP > 0 else 0.0
+            status = int(pump_on)
+        row = {
+            "time_s": float(t),
+            "timestamp": (self.start_datetime + timedelta(seconds=float(t))).isoformat(sep=" "),
+            "tank_temperature_K": Temp_tank,
+            "outdoor_temperature_K": float(TAmb),
+            "pump_status": status,
+            "COP": float(COP),
+            "Q_transfer_W": float(Q_transf),
+            "electrical_power_W": float(P_electrical),
+            "heat_loss_W": float(self.get_Q_loss(Temp_tank, TAmb)),
+        }
+        # Running totals from the extra ODE states, converted from J to kWh
+        for name, total in zip(self.ACCUMULATOR_NAMES, state[1:]):
+            row[name.replace("_J", "_kWh")] = float(total) / 3.6e6
+        if self.stream_accounting:
+            # Emissions (kgCO2) and cost so far: the energy since the previous row charged at the hourly values
+            charges, energy_J = self.stream_charges, float(state[1])
+            if t > charges["t"]:
+                added = self.carbon_and_cost(np.array([charges["t"], t]), np.array([charges["energy_J"], energy_J]),
+                                             self.stream_accounting)
+                for name, value in added.items():
+                    charges[name] += value
+                charges["t"], charges["energy_J"] = float(t), energy_J
+            row.update({name: charges[name] for name in self.stream_accounting})
+        return row
+
+# TASK C : PERFORMANCE Metrics
+    def calculate_metrics(self):
+        # Metrics of the latest run (taken from the stage cache when the run was too)
+        self.run_stage("metrics", self.compute_metrics)
+
+    def compute_metrics(self):
+        # Only calculate metrics for the latest run
+        '''
+        Calculates key performance metrics for the heating system, including average and total energy consumption, average COP
+        , average heat loss, and hot water demand energy (if applicable).
+
+        '''
+        # Retrieve the latest tank temperatures and timestamps
+        temp_tank_list = self.run_temps[-1]
+        time_list = self.run_times[-1]
+        # Initialize arrays to store computed data
+        energyarray = []  # Stores energy consumption at each timestep
+        q_transfer_array = []  # Stores heat transfer data
+        cop_array = []  # Tracks COP values
+        q_loss_list = []  # Tracks heat loss over time
+        pump_status_list = []  # Tracks heat pump on/off status
+        # Pump status at each sample: the status the ODE itself used there (from its switch times), not a replay
+        # of the thresholds on the samples, which misses every switch between two samples
+        ode_pump_status = self.pump_status_at(time_list)
+
+        for i in range(len(temp_tank_list)):
+            Temp_tank = temp_tank_list[i] #Tank temp at i
+            t = time_list[i] #Time at i
+            TAmb = self.find_T_ambient(t) #Ambient temperature at t
+
+            if self.control_mode == "modulating":
+                # Compressor power from the controller; the pump status is the fraction of full power
+                power = self.compressor_power(Temp_tank, self.controller_integral_array[i])[0]
+                Q_transf, energy, COP = self.modulating_heat_output(Temp_tank, TAmb, power)
+                pump_status_list.append(power / self.controller['max_compressor_power_W'])
+                energyarray.append(energy)
+                cop_array.append(COP)
+                q_transfer_array.append(Q_transf)
+                q_loss_list.append(self.get_Q_loss(Temp_tank, TAmb))
+                continue
+
+            # Pump status the ODE used at this time
+            pump_switch = bool(ode_pump_status[i])
+            pump_status_list.append(int(pump_switch))
+
+            # Compute Q_transfer
+            if pump_switch:
+                Q_max = self.max_Q_hp(TAmb)
+                U_cond = self.input_values['overall_heat_transfer_coefficient']
+                A_cond = self.input_values['heat_transfer_area']
+                Q_transf = U_cond * A_cond * (self.input_values['fixed_condenser_temperature_K'] - Temp_tank)
+                if Q_transf > Q_max:
+                    Q_transf = Q_max #Limit Q_transfer to maximum capacity if necessary
+            else:
+                Q_transf = 0
+
+            # Compute Q_loss: heat lost to the surroundings
+            Q_loss = self.get_Q_loss(Temp_tank, TAmb)
+
+            # Compute COP based on temperature difference (or the COP map)
+            COP = self.cop(TAmb)
+            cop_array.append(COP)
+
+            # Compute Energy Consumption
+            if COP > 0:
+                energy = Q_transf / COP
+                energyarray.append(energy)
+                
+            else:
+                energyarray.append(0)
+            # Append computed values to respective arrays    
+            q_transfer_array.append(Q_transf)
+            q_loss_list.append(Q_loss)
+
+         # Store computed data in class attributes
+        self.pump_status = pump_status_list
+        self.energy_array = energyarray
+        self.q_transfer_array = q_transfer_array
+        self.cop_array = cop_array
+        self.q_loss_list = q_loss_list
+        self.time_cop_array = np.array(time_list)
+
+        # Calculate performance metrics
+        # Totals are time integrals so they stay correct when the samples are not evenly spaced.
+        # In "states" accounting mode they were integrated with the ODE; otherwise use the trapezoidal rule on the samples
+        # (with the pump switches between samples, see sampled_energy).
+        duration = time_list[-1] - time_list[0] if len(time_list) > 1 else 0
+        self.sampled_energy_array = None
+        if self.run_totals is not None:
+            total_energy_J = self.run_totals['electrical_energy_J']
+        else:
+            self.sampled_energy_array = self.sampled_energy(time_list, temp_tank_list, energyarray)
+            total_energy_J = float(self.sampled_energy_array[-1])
+        self.energy_metrics = {
+            "average": total_energy_J / duration / 1000 if duration > 0 else statistics.fmean(energyarray) / 1000,  # Time-weighted average power in kW
+            "total": total_energy_J / 3.6e6  # Total energy consumption in kWh (J -> kWh)
+            }
+        self.COP_average = sum(cop_array) / len(cop_array)  # Average COP over the simulation
+
+        # Compute total heat loss in kWh by integrating `q_loss_list` (W) over time
+        if self.run_totals is not None:
+            self.Q_loss_average = self.run_totals['tank_loss_J'] / 3.6e6
+        else:
+            self.Q_loss_average = self.integrate_over_time(q_loss_list, time_list) / 3.6e6
+        if self.hot_water_included():
+            # Total hot water demand in kWh. The profile is sampled evenly over the simulation period
+            if self.run_totals is not None:
+                self.total_HotWater = self.run_totals['hot_water_energy_J'] / 3.6e6
+            else:
+                # The 24 hour profile repeats every day, so the total is its mean power times the duration
+                self.total_HotWater = float(np.mean(self.hot_water_demand)) * self.total_seconds / 3.6e6
+        # Emissions (kgCO2) and cost of the electricity, from the hourly carbon intensity and tariff (if given)
+        self.energy_metrics.update(self.carbon_and_cost(*self.cumulative_energy()))
+
+    def accounting_series(self):
+        # {"carbon_kgCO2" / "energy_cost": (series, unit factor, file)} for the carbon intensity and tariff files that are set
+        series = {}
+        if self.carbon_intensity_file:
+            # gCO2/kWh x kWh -> kgCO2
+            series["carbon_kgCO2"] = (read_hourly_series(self.carbon_intensity_file, CARBON_INTENSITY_COLUMN), 1e-3,
+                                      self.carbon_intensity_file)
+        if self.tariff_file:
+            series["energy_cost"] = (read_hourly_series(self.tariff_file, TARIFF_COLUMN), 1.0, self.tariff_file)
+        return series
+
+    def carbon_and_cost(self, times, energy, series=None):
+        # Emissions (kgCO2) and cost of the electricity used by energy (J so far) at times (s), for the files that are set
+        series = self.accounting_series() if series is None else series
+        return {name: factor * charge_energy(times, energy, self.start_datetime, table, source)
+                for name, (table, factor, source) in series.items()}
+
+    def results_summary(self):
+        '''
+        Metrics of the latest run as a flat dictionary of numbers (one row of a batch results file).
+        Call after calculate_metrics.
+        '''
+        temps = self.run_temps[-1]
+        return {
+            "energy_total_kWh": float(self.energy_metrics['total']),
+            "average_power_kW": float(self.energy_metrics['average']),
+            "COP_average": float(self.COP_average),
+            "heat_loss_total_kWh": float(self.Q_loss_average),
+            "hot_water_total_kWh": float(self.total_HotWater) if self.hot_water_included() else 0.0,
+            "min_tank_temperature_K": float(np.min(temps)),
+            "max_tank_temperature_K": float(np.max(temps)),
+        }
+
+    def accounting_summary(self):
+        '''
+        Emissions and cost of the electricity used in the latest run, and the average carbon intensity and
+        price it was used at (weighted by the energy). NaN for what has no carbon intensity or tariff file,
+        so every batch row has the same columns. Call after calculate_metrics.
+        '''
+        total_kWh = self.energy_metrics['total']
+        carbon = self.energy_metrics.get("carbon_kgCO2", math.nan)
+        cost = self.energy_metrics.get("energy_cost", math.nan)
+        return {
+            "carbon_kgCO2": carbon,
+            "energy_cost": cost,
+            "carbon_intensity_average_g_per_kWh": carbon * 1000 / total_kWh if total_kWh else math.nan,
+            "price_average_per_kWh": cost / total_kWh if total_kWh else math.nan,
+        }
+
+    def cumulative_energy(self):
+        '''
+        (times in s, electrical energy used so far in J) of the latest run: the running total in "states"
+        accounting, otherwise the time integral of the sampled power with the pump switches (sampled_energy).
+        '''
+        times = np.asarray(self.time_cop_array, dtype=float)
+        if self.electrical_energy_array is not None:
+            return times, np.asarray(self.electrical_energy_array, dtype=float)
+        if self.sampled_energy_array is not None:
+            return times, np.asarray(self.sampled_energy_array, dtype=float)
+        power = np.asarray(self.energy_array, dtype=float)
+        return times, np.concatenate(([0.0], np.cumsum(np.diff(times) * (power[1:] + power[:-1]) / 2)))
+
+    def interval_power(self, interval_s):
+        '''
+        Mean electrical power (W) of the latest run over each interval of interval_s seconds from the start
+        (the last one may be shorter). Taken from the running electrical energy total in "states" accounting,
+        so the intervals add up to the energy total, otherwise from the time integral of the sampled power.
+        Call after calculate_metrics.
+        '''
+        times, energy = self.cumulative_energy()
+        edges = np.append(np.arange(0.0, self.total_seconds, interval_s), self.total_seconds)
+        return np.diff(np.interp(edges, times, energy)) / np.diff(edges)
+
+    def cycling_summary(self):
+        # Pump cycling statistics of the latest run (see pump_cycling). Call after calculate_metrics
+        return pump_cycling(*self.pump_status_series(), self.short_cycle_s)
+
+    def pump_status_series(self):
+        '''
+        Pump status of the latest run as (times, status) for pump_cycling. In the on/off mode this is the start,
+        every switch the ODE made and the end, each status held until the next time, so every on and off run
+        has its real length whatever the output grid. The modulating mode has no switches: its status is the
+        stored fraction of full power at each sample.
+        '''
+        if self.control_mode == "modulating":
+            return self.time_cop_array, self.pump_status
+        inside = (self.pump_switch_times > 0) & (self.pump_switch_times < self.total_seconds)
+        times = np.concatenate(([0.0], self.pump_switch_times[inside], [self.total_seconds]))
+        return times, self.pump_status_at(times)
+
+    def weather_summary(self):
+        # Outdoor temperature statistics (K) of the latest run, e.g. as inputs of the surrogate model
+        temps = np.asarray(self.outdoor_temp_K_array)
+        return {
+            "outdoor_mean_temperature_K": float(np.mean(temps)),
+            "outdoor_min_temperature_K": float(np.min(temps)),
+            "outdoor_max_temperature_K": float(np.max(temps)),
+        }
+
+    def generate_hot_water_demand(self):
+        '''
+        Generates a stochastic hot water demand profile over the simulation period.
+
+        Steps:
+            1. Creates a base demand using a normal distribution (in kW).
+            2. Ensures demand values are non-negative by clipping to zero.
+            3. Applies a bias factor based on a human usage pattern, which depends on the hour of the day
+            and the building type (e.g., office, townhall, or apartment).
+            4. Combines base demand with the bias to create the final demand profile.
+        '''
+        #Base demand (in W) using a normal distribution
+        # - loc=0.1: Mean demand is 0.1 W
+        # - scale=0.05: Standard deviation is 0.05 W
+        base_demand = self.rng.normal(loc=0.1, scale=0.05, size=self.time_steps)  # (kW)
+
+        # Step 2: Ensure all demand values are non-negative by clipping below-zero values to 0
+        base_demand = np.clip(base_demand, 0, None)
+
+        # Step 3: Apply a human usage pattern bias based on hour and building type
+        demand_profile = []
+        for i in range(self.time_steps):
+            hour = (i / 60) % 24  # Convert timestep index to hour of the day
+            bias = self.human_usage_pattern(hour, self.building_number)  # Bias factor (unitless multiplier)
+            demand_profile.append(base_demand[i] * bias*1000)  # Final demand = base demand × bias
+
+        # Step 4: Return the demand profile as a numpy array (in kW)
+        return np.array(demand_profile)
+
+    def human_usage_pattern(self, hour, building_number):
+        """
+        Parameters:
+            hour (float): Hour of the day (0-24). Units: hours.
+            building_number (int): Type of building. Options:
+                0 = Library
+                1 = Modern Office Building
+                2 = Industrial Warehouse
+                3 = Normal Apartment (We are assuming this)
+            int: Bias factor (unitless multiplier) to adjust the base demand profile.
+                    """
+        if building_number == 1 :  # Modern Office Building & Warehouse
+        # Office usage pattern
+            if 0 <= hour < 8 or 18 <= hour < 24:
+                return 0  # No water demand during off-hours
+            elif 12 <= hour < 14:
+                return 2.5  # Peak usage during lunch hours
+            else:
+                return 1  # Moderate usage during working hours
+        elif  building_number == 2:  # Modern Office Building & Warehouse
+        # Office usage pattern
+            if 0 <= hour < 8 or 18 <= hour < 24:
+                return 0.5  # Industrial warehouse is operating 24/7
+            elif 12 <= hour < 14:
+                return 2.5  # Peak usage during lunch hours
+            else:
+                return 1.25  # Moderate usage during working hours
+        elif building_number == 0:  # Library
+            # Library usage pattern
+            if 0 <= hour < 8 or 18 <= hour < 24:
+                return 0  # No water demand during off-hours
+            elif 12 <= hour < 14:
+                return 2.5  # Peak usage during lunch hours
+            else:
+                return 1.25  # Moderate usage during working hours
+
+        else:  # Default (Modelling an apartment)
+            # Default usage pattern
+            if 6 <= hour < 9:
+                return 1.4# Peak usage during morning hours (showers, cooking, cleaning)
+            elif 18 <= hour < 21:
+                return 1.75  # Peak usage during evening hours (showers, cooking, laundry)
+            elif 21 <= hour <= 24:
+                return 1.05  # Moderate usage during late evening (wrapping up daily activities)
+            elif 9 <= hour <= 18:
+                return 0.5  # Low usage during daytime (occupants typically out of home)
+            else:
+                return 0  # Minimal usage during nighttime/off-hours
+
+
+
+def write_stream_csv(rows, output_path, flush_every=1000):
+    '''
+    Writes streamed simulation rows (dictionaries) to a CSV file as they arrive. The header is
+    taken from the first row and the file is flushed every `flush_every` rows so downstream tools
+    can follow the file while the run is still going. Returns the number of rows written.
+    '''
+    row_count = 0
+    with open(output_path, "w", newline="") as output_file:
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(output_file, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+            row_count += 1
+            if row_count % flush_every == 0:
+                output_file.flush()
+    return row_count
+
+
+def save_checkpoint(checkpoint_path, state):
+    '''
+    Saves a checkpoint (a JSON-compatible dictionary) so an interrupted run can be resumed.
+    The file is written next to the old one and then swapped in, so a crash while saving
+    never leaves a half-written checkpoint behind.
+    '''
+    temporary_path = checkpoint_path + ".tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump(state, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path):
+    # Returns the saved checkpoint, or None if there is nothing to resume from
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def clear_checkpoint(checkpoint_path):
+    # Removes the checkpoint once the run has finished
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+def stream_to_csv(model, start_datetime, end_datetime, output_path, output_interval=None, progress=None,
+                  checkpoint_path=None, checkpoint_every=60.0):
+    '''
+    Streams a simulation to CSV with optional checkpointing. Every `checkpoint_every` seconds of
+    wall-clock time the CSV is flushed and the solver state is saved to `checkpoint_path` together
+    with the CSV length. If a checkpoint exists when this is called, the CSV is cut back to that
+    length and the run carries on from the saved step instead of starting again.
+    Returns the number of rows in the CSV.
+    '''
+    resume = load_checkpoint(checkpoint_path)
+    if resume is not None and resume.get("kind") != "stream":
+        raise ValueError(f"{checkpoint_path} is not a checkpoint of a streamed run.")
+    with open(output_path, "r+" if resume is not None else "w", newline="") as output_file:
+        row_count = 0
+        if resume is not None:
+            # Drop rows written after the checkpoint; they are produced again from the saved state
+            output_file.seek(resume["csv_bytes"])
+            output_file.truncate()
+            row_count = resume["rows"]
+        last_save = time.monotonic()
+
+        def save_if_due():
+            # Called between solver steps, when the CSV holds every row up to the solver time
+            nonlocal last_save
+            if checkpoint_path is not None and time.monotonic() - last_save >= checkpoint_every:
+                output_file.flush()
+                save_checkpoint(checkpoint_path, {"kind": "stream", "csv_bytes": output_file.tell(), "rows": row_count,
+                                                  "stream": model.stream_snapshot()})
+                last_save = time.monotonic()
+
+        rows = model.stream_simulation(start_datetime, end_datetime, output_interval=output_interval, progress=progress,
+                                       on_step=save_if_due, resume=resume["stream"] if resume is not None else None)
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(output_file, fieldnames=list(row))
+                if resume is None:
+                    writer.writeheader()
+            writer.writerow(row)
+            row_count += 1
+    clear_checkpoint(checkpoint_path)
+    return row_count
+
+
+def measure_import_time(module_name="heat_pump_model", repeats=3):
+    '''
+    Imports `module_name` in fresh Python interpreters and returns the fastest import time (seconds)
+    and the list of HEAVY_MODULES that the import loaded. A fresh interpreter is used each time
+    because a second import in the same process is free.
+    '''
+    code = ("import sys, time, json; start = time.perf_counter(); import " + module_name + "; "
+            "print(json.dumps([time.perf_counter() - start, [m for m in " + repr(HEAVY_MODULES) + " if m in sys.modules]]))")
+    best_time, heavy_loaded = None, []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd=MODULE_DIR, capture_output=True, text=True, check=True).stdout
+        seconds, heavy_loaded = json.loads(output.strip().splitlines()[-1])
+        best_time = seconds if best_time is None else min(best_time, seconds)
+    return best_time, heavy_loaded
+
+
+def check_import_time(budget=IMPORT_TIME_BUDGET_S, module_name="heat_pump_model"):
+    # Returns True if the headless import is within budget and loads no GUI, plotting or weather modules
+    seconds, heavy_loaded = measure_import_time(module_name)
+    print(f"import {module_name}: {seconds:.3f} s (budget {budget:.3f} s)")
+    if heavy_loaded:
+        print(f"Heavy modules loaded at import: {', '.join(heavy_loaded)}")
+    return seconds <= budget and not heavy_loaded
+
+
+def print_progress(fraction, t):
+    # Progress callback for the command line: percentage done and simulated days.
+    # Only redrawn when the percentage moves by 0.1 % so long runs do not flood the terminal.
+    tenths = int(fraction * 1000)
+    if tenths != print_progress.last_tenths:
+        print_progress.last_tenths = tenths
+        sys.stderr.write(f"\r{fraction * 100:5.1f}% ({t / 86400:.1f} days simulated)")
+        sys.stderr.flush()
+print_progress.last_tenths = -1
+
+
+def parse_datetime(text):
+    # Accepts "YYYY-MM-DD" or "YYYY-MM-DD HH:MM"
+    return datetime.fromisoformat(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless heat pump simulation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stream_parser = subparsers.add_parser("stream", help="Run a simulation step by step and write the results to CSV as they are computed")
+    stream_parser.add_argument("--start", type=parse_datetime, required=True, help="Start date, e.g. 2024-01-01")
+    stream_parser.add_argument("--end", type=parse_datetime, required=True, help="End date, e.g. 2025-01-01")
+    stream_parser.add_argument("--output", required=True, help="CSV file to write")
+    stream_parser.add_argument("--interval", type=float, default=None, help="Output spacing in seconds (default: every solver step)")
+    stream_parser.add_argument("--inputs", default=DEFAULT_INPUTS_FILE, help="Simulation inputs YAML file")
+    stream_parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp) instead of Meteostat")
+    stream_parser.add_argument("--building", type=int, default=3, help="Building number for the hot water demand profile (0-3)")
+    stream_parser.add_argument("--hot-water", action="store_true", help="Include the stochastic hot water demand")
+    stream_parser.add_argument("--seed", type=int, default=None, help="Seed for the hot water demand")
+    stream_parser.add_argument("--carbon-file", default=None, help="CSV of hourly carbon intensity (columns time, carbon_intensity in gCO2/kWh)")
+    stream_parser.add_argument("--tariff-file", default=None, help="CSV of hourly electricity prices (columns time, price per kWh)")
+    stream_parser.add_argument("--checkpoint", default=None, help="Checkpoint file. An existing checkpoint is resumed")
+    stream_parser.add_argument("--checkpoint-every", type=float, default=60.0, help="Seconds between checkpoints (wall clock)")
+    budget_parser = subparsers.add_parser("check-import-time", help="Check the headless import time against its budget")
+    budget_parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET_S, help="Budget in seconds")
+    budget_parser.add_argument("--module", default="heat_pump_model", help="Module to import")
+    args = parser.parse_args(argv)
+
+    if args.command == "check-import-time":
+        if not check_import_time(args.budget, args.module):
+            sys.exit(1)
+
+    if args.command == "stream":
+        model = HeatPumpModel(building_number=args.building, include_hot_water_demand=args.hot_water,
+                              yaml_sim_file_path=args.inputs, weather_file=args.weather_file,
+                              rng=np.random.default_rng(args.seed))
+        model.carbon_intensity_file = args.carbon_file or model.carbon_intensity_file
+        model.tariff_file = args.tariff_file or model.tariff_file
+        row_count = stream_to_csv(model, args.start, args.end, args.output, output_interval=args.interval,
+                                  progress=print_progress, checkpoint_path=args.checkpoint,
+                                  checkpoint_every=args.checkpoint_every)
+        sys.stderr.write(f"\nWrote {row_count} rows to {args.output}\n")
+
+
+# Entry point for headless runs
+if __name__ == "__main__":
+    main()
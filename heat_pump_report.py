@@ -0,0 +1,340 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Figures and reports of the heat pump simulation without the GUI.
+'''
+
+''' Purpose: Draws the figures of the GUI (COP fit, COP over time, tank temperature, heat load, heat pump status and
+hot water demand). The GUI calls the draw_ functions below on its own axes, and the report mode calls the same
+functions on figures rendered with the Agg backend, so a report shows exactly what the GUI would.
+
+The report mode writes one folder per scenario with the figures (PNG) or a multi-page PDF, plus summary.json
+with the settings, input values and metrics. Scenarios come from the results file of a sweep (each row is run
+again with its own seed, so the report matches the row) or from a scenario file. Runs and rendering are shared
+between worker processes.
+
+Examples:
+
+    python heat_pump_batch.py sweep --start 2024-01-01 --end 2024-01-02 --vary wall_u_value=0.2,0.35,0.5 --output sweep.csv
+    python heat_pump_report.py --results sweep.csv --output-dir reports --format pdf --workers 8
+    python heat_pump_report.py --scenarios scenarios.jsonl --start 2024-01-01 --end 2024-01-02 --output-dir reports
+
+'''
+
+## Importing Modules ##
+
+# Maths and Graph Plotting
+import numpy as np
+from matplotlib.figure import Figure  # Figures are made without pyplot, so no GUI backend is ever loaded
+from matplotlib.backends.backend_agg import FigureCanvasAgg  # Renders figures to images
+from matplotlib.backends.backend_pdf import PdfPages  # Multi-page PDF reports
+from matplotlib import colormaps  # Colours of the runs (same as the GUI)
+
+# Data Collection/Extraction
+import os  # Import to make the report folders
+import re  # Import to make file names from scenario names
+import csv  # Import to read the results file of a sweep
+import sys  # Import for writing progress to the terminal
+import json  # Import to write the summary of each report
+import argparse  # Import to read command line options
+import itertools  # Import to read scenarios in blocks
+import multiprocessing  # Import to render reports on several worker processes
+
+from heat_pump_model import HeatPumpModel, DEFAULT_INPUTS_FILE, BUILDING_NUMBERS, parse_datetime
+from heat_pump_batch import (init_worker, make_model, scenario_dates, load_scenarios, SCENARIO_SETTINGS,
+                             SCENARIOS_PER_WORKER_BLOCK, _worker_settings)
+
+
+GRAPH_COLORS = colormaps["tab10"].colors  # Colour of each run on the tank temperature plot
+BUILDING_NAMES = {number: name for name, number in BUILDING_NUMBERS.items()}
+
+
+## Figures (shared with the GUI) ##
+
+def draw_cop_fit(ax, model):
+    # COP data points and the fitted COP curve against the temperature difference
+    ax.scatter(model.deltaT_array, model.COPData, label="Data Points", color="royalblue", edgecolor="black", s=50)
+    x = np.linspace(min(model.deltaT_array), max(model.deltaT_array), 200)
+    y = [model.COPFunction(i, model.A, model.B) for i in x]
+    ax.plot(x, y, label="Best Fit Line", color="darkorange", linewidth=2, linestyle='--')
+    if getattr(model, "cop_map", None) is not None:
+        # COP map at the condenser (flow) temperature used in the simulation, over the outdoor temperatures it covers
+        flow_K = model.input_values['fixed_condenser_temperature_K']
+        outdoor_axis = model.cop_map.axes[0]
+        x = x[(flow_K - x >= outdoor_axis[0]) & (flow_K - x <= outdoor_axis[-1])]
+        ax.plot(x, model.cop_map(flow_K - x, flow_K), label="COP Map", color="seagreen", linewidth=2)
+    ax.set_title("COP vs Temperature Difference", fontsize=16, fontweight='bold')
+    ax.set_xlabel(r"Temperature Difference ($\Delta T$ in °C)", fontsize=14)  # Add delta and degree symbols
+    ax.set_ylabel("COP", fontsize=14)
+    ax.grid(True, linestyle='--', alpha=0.6)
+    ax.legend(fontsize=12, loc="best")
+
+
+def draw_tank_temperature(ax, runs, colors=GRAPH_COLORS):
+    '''
+    Tank temperature over time for each run, with its on and off thresholds as dashed lines.
+    `runs` is a list of (run number, times in s, temperatures in K, on threshold K, off threshold K).
+    '''
+    for run_number, time_data, temp_data, threshold_on, threshold_off in runs:
+        elapsed_hours = np.asarray(time_data) / 3600
+        temps_in_celsius = np.asarray(temp_data) - 273.15
+        color = colors[(run_number - 1) % len(colors)] #Pick a different color for next simulation
+        # Once the colours run out, later runs get a different line style so no two runs look the same
+        linestyle = ("-", "-.", ":")[((run_number - 1) // len(colors)) % 3]
+        ax.plot(elapsed_hours, temps_in_celsius, color=color, linewidth=2, linestyle=linestyle, label=f'Run {run_number}')
+        # Plot the threshold lines
+        ax.axhline(y=threshold_on - 273.15, color=color, linestyle='--', alpha=0.8)
+        ax.axhline(y=threshold_off - 273.15, color=color, linestyle='--', alpha=0.8)
+    ax.set_title("Tank Temperature Vs Time", fontsize=16, fontweight="bold")
+    ax.set_xlabel("Time (hours)", fontsize=14)
+    ax.set_ylabel("Temperature (°C)", fontsize=14)
+    ax.grid(True, linestyle="--", alpha=0.5)
+    # Position the legend on the right side of the graph
+    ax.legend(fontsize=10, loc="center left", bbox_to_anchor=(1, 0.5))
+
+
+def draw_heat_load(ax, model):
+    # Heat load of the building against the temperature difference
+    ax.plot(model.dT_ambient_list, model.q_load_array, label="Heat Load vs ΔT", color="royalblue", linewidth=2)
+    ax.set_title("Heat Load vs ΔT", fontsize=16, fontweight="bold")
+    ax.set_xlabel("ΔT (K)", fontsize=14)
+    ax.set_ylabel("Heat Load (W)", fontsize=14)
+    ax.grid(True, linestyle="--", alpha=0.6)
+
+
+def draw_cop_over_time(ax, model):
+    # COP over the simulation period (call after calculate_metrics)
+    time_in_hours = model.time_cop_array / 3600
+    ax.plot(time_in_hours, model.cop_array, label="COP Over Time", color="royalblue", linewidth=2)
+    ax.set_title("COP Over Time", fontweight="bold", fontsize=16)
+    ax.set_xlabel("Time (hours)", fontsize=14)
+    ax.set_ylabel("COP", fontsize=14)
+    ax.grid(True, linestyle="--", alpha=0.6)
+    ax.legend(fontsize=12, loc="best")
+
+
+def draw_hot_water_demand(ax, model):
+    # The hot water demand profile used in the simulation
+    hot_water_demand = np.asarray(model.hot_water_demand)
+    time = np.linspace(0, 24, len(hot_water_demand))
+    ax.plot(time, hot_water_demand / 1000, label="Stochastic Hot Water Demand", color="blue", linewidth=2)
+    ax.grid(True, linestyle="--", linewidth=0.5, alpha=0.7)
+    ax.set_title("Hot Water Demand Profile", fontsize=14, fontweight="bold")
+    ax.set_xlabel("Time (hours)", fontsize=12)
+    ax.set_ylabel("Hot Water Demand (kW)", fontsize=12) #Hot water demand is measured in terms of kWh
+    ax.legend(loc="upper right", fontsize=10, frameon=True, borderpad=1)
+
+
+def draw_pump_status(ax, model):
+    # Heat pump on/off status (fraction of full power in the modulating mode) over time (call after calculate_metrics)
+    time_in_hours = model.time_cop_array / 3600
+    ax.plot(time_in_hours, model.pump_status)
+    ax.set_title("Heat Pump Status Over Time", fontsize=12, fontweight="bold")
+    ax.set_xlabel("Time (hours)")
+    ax.set_ylabel("Heat Pump Status")
+    ax.grid(True)
+
+
+## Reports ##
+
+def report_summary(model, name, start_datetime, end_datetime, seed=None):
+    # Settings, input values and metrics of a finished run (after calculate_metrics), as written to summary.json
+    return {
+        "name": name,
+        "building": BUILDING_NAMES.get(model.building_number, str(model.building_number)),
+        "include_hot_water_demand": bool(model.hot_water_included()),
+        "building_model": model.building_model,
+        "control_mode": model.control_mode,
+        "location": {"latitude": model.location[0], "longitude": model.location[1]},
+        "start": start_datetime.isoformat(sep=" "),
+        "end": end_datetime.isoformat(sep=" "),
+        "seed": seed,
+        "input_values": {key: float(value) for key, value in model.input_values.items()},
+        "metrics": model.results_summary(),
+    }
+
+
+def report_figures(model, summary):
+    '''
+    The figures of a report: metrics summary, tank temperature, COP (fit and over time) and building
+    performance (heat load, heat pump status and, when included, hot water demand). Returns (file name, Figure) pairs.
+    '''
+    # Metrics summary page
+    fig_summary = Figure(figsize=(8.27, 11.69)) # A4 portrait
+    metrics = summary["metrics"]
+    lines = [
+        f"Scenario: {summary['name']}",
+        f"Building: {summary['building']} ({summary['building_model']} heat load)",
+        f"Heat pump control: {summary['control_mode'].replace('_', '/')}",
+        f"Period: {summary['start']} to {summary['end']}",
+        f"Hot water demand: {'included' if summary['include_hot_water_demand'] else 'not included'}",
+        "",
+        "Performance Metrics",
+        f"    Energy total: {metrics['energy_total_kWh']:.2f} kWh",
+        f"    Average power: {metrics['average_power_kW']:.2f} kW",
+        f"    COP average: {metrics['COP_average']:.2f}",
+        f"    Total heat loss: {metrics['heat_loss_total_kWh']:.2f} kWh",
+        f"    Hot water demand total: {metrics['hot_water_total_kWh']:.2f} kWh",
+        f"    Tank temperature: {metrics['min_tank_temperature_K'] - 273.15:.1f} to {metrics['max_tank_temperature_K'] - 273.15:.1f} °C",
+        "",
+        "Input Values",
+    ] + [f"    {key}: {value:g}" for key, value in summary["input_values"].items()]
+    fig_summary.text(0.08, 0.95, "\n".join(lines), va="top", fontsize=11, family="monospace")
+
+    # Tank temperature (main graph of the GUI)
+    fig_temp = Figure(figsize=(12, 6))
+    draw_tank_temperature(fig_temp.add_subplot(111), [(1, model.run_times[-1], model.run_temps[-1],
+                                                       model.input_values['on_temperature_threshold_K'],
+                                                       model.input_values['off_temperature_threshold_K'])])
+    fig_temp.tight_layout()
+
+    # COP figure with the same two panels as the GUI
+    fig_cop = Figure(figsize=(6, 6))
+    fig_cop.subplots_adjust(hspace=0.5)
+    draw_cop_fit(fig_cop.add_subplot(211), model)
+    draw_cop_over_time(fig_cop.add_subplot(212), model)
+
+    # Performance plots side by side
+    panels = 3 if model.hot_water_included() else 2
+    fig_performance = Figure(figsize=(5 * panels, 4))
+    draw_heat_load(fig_performance.add_subplot(1, panels, 1), model)
+    draw_pump_status(fig_performance.add_subplot(1, panels, 2), model)
+    if model.hot_water_included():
+        draw_hot_water_demand(fig_performance.add_subplot(1, panels, 3), model)
+    fig_performance.tight_layout()
+
+    figures = [("summary", fig_summary), ("tank_temperature", fig_temp), ("cop", fig_cop), ("performance", fig_performance)]
+    for name, figure in figures:
+        FigureCanvasAgg(figure) # Agg canvas, so figures render the same with or without a display
+    return figures
+
+
+def write_report(model, summary, report_dir, file_format="png", dpi=100):
+    '''
+    Writes the report of a finished run to report_dir: summary.json plus one PNG per figure,
+    or a single report.pdf with one page per figure. Returns report_dir.
+    '''
+    os.makedirs(report_dir, exist_ok=True)
+    with open(os.path.join(report_dir, "summary.json"), "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    figures = report_figures(model, summary)
+    if file_format == "pdf":
+        with PdfPages(os.path.join(report_dir, "report.pdf")) as pdf:
+            for name, figure in figures:
+                pdf.savefig(figure)
+    else:
+        for name, figure in figures:
+            figure.savefig(os.path.join(report_dir, f"{name}.{file_format}"), dpi=dpi)
+    return report_dir
+
+
+def report_folder_name(index, name):
+    # Folder of a scenario's report: its index, then its name with anything unsafe in a file name replaced
+    safe_name = re.sub(r"[^\w.-]+", "_", str(name)).strip("_")
+    return f"{index:05d}_{safe_name}" if safe_name else f"{index:05d}"
+
+
+def render_scenario(task):
+    '''
+    Runs one scenario in a worker and writes its report. `task` is (index, scenario, seed, output_dir,
+    file_format, dpi); the seed is the hot water demand seed of the scenario.
+    '''
+    index, scenario, seed, output_dir, file_format, dpi = task
+    settings = _worker_settings
+    start, end = scenario_dates(scenario, settings["start_datetime"], settings["end_datetime"])
+    model = make_model(scenario, settings["base_inputs"], rng=np.random.default_rng(seed),
+                       weather_file=settings["weather_file"])
+    model.initialize_simulation(start, end)
+    model.calculate_metrics()
+    summary = report_summary(model, scenario.get("name") or f"Scenario {index}", start, end, seed)
+    return write_report(model, summary, os.path.join(output_dir, report_folder_name(index, scenario.get("name", ""))),
+                        file_format, dpi)
+
+
+def read_results(results_path, base_inputs):
+    '''
+    Reads the results file of a sweep (heat_pump_batch.py) and yields (index, scenario, seed) for every
+    row, so each report re-runs exactly the scenario of its row. The row holds every setting of its run
+    (output grid, energy accounting, solver profile, COP map and grid files), so inputs.yaml is not needed.
+    '''
+    with open(results_path, newline="") as results_file:
+        for row in csv.DictReader(results_file):
+            if not row.get("seed"):
+                raise ValueError(f"{results_path} has no seed column. Run the sweep again to make a results file with seeds.")
+            scenario = {key: float(value) for key, value in row.items() if key in base_inputs}
+            for name in SCENARIO_SETTINGS:
+                if row.get(name) not in (None, ""):
+                    scenario[name] = row[name]
+            scenario["building_number"] = int(scenario.get("building_number", 3))
+            scenario["include_hot_water_demand"] = row.get("include_hot_water_demand") == "True"
+            for name in ("latitude", "longitude"):
+                if name in scenario:
+                    scenario[name] = float(scenario[name])
+            yield int(row["scenario"]), scenario, int(row["seed"])
+
+
+def render_reports(tasks, output_dir, file_format="png", dpi=100, base_inputs=None, weather_file=None,
+                   start_datetime=None, end_datetime=None, workers=1, progress=None):
+    '''
+    Writes one report per (index, scenario, seed) in tasks, which may be a generator. Scenarios are
+    taken one block at a time and shared between `workers` processes. Returns the number of reports.
+    '''
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=DEFAULT_INPUTS_FILE).input_values
+    os.makedirs(output_dir, exist_ok=True)
+    init_worker(base_inputs, weather_file, start_datetime, end_datetime)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=init_worker,
+                                    initargs=(base_inputs, weather_file, start_datetime, end_datetime))
+    report_count = 0
+    try:
+        pending = ((index, scenario, seed, output_dir, file_format, dpi) for index, scenario, seed in tasks)
+        while True:
+            block = list(itertools.islice(pending, SCENARIOS_PER_WORKER_BLOCK * workers))
+            if not block:
+                break
+            for _ in (pool.imap_unordered(render_scenario, block) if pool is not None else map(render_scenario, block)):
+                report_count += 1
+                if progress is not None:
+                    progress(report_count)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return report_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reports (figures and metrics) of heat pump simulation scenarios")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--results", help="Results CSV of a sweep or scenario run (heat_pump_batch.py)")
+    source.add_argument("--scenarios", help="Scenario file (.jsonl or multi-document YAML)")
+    parser.add_argument("--start", type=parse_datetime, default=None, help="Start date for scenarios without one")
+    parser.add_argument("--end", type=parse_datetime, default=None, help="End date for scenarios without one")
+    parser.add_argument("--output-dir", required=True, help="Folder for the reports (one sub-folder per scenario)")
+    parser.add_argument("--format", choices=("png", "pdf", "svg"), default="png", help="One file per figure (png, svg) or one PDF")
+    parser.add_argument("--dpi", type=int, default=100, help="Resolution of PNG figures")
+    parser.add_argument("--inputs", default=DEFAULT_INPUTS_FILE, help="YAML file with the default inputs")
+    parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the hot water demand (--scenarios only)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args(argv)
+
+    base_inputs = HeatPumpModel(yaml_sim_file_path=args.inputs).input_values
+    if args.results:
+        tasks = read_results(args.results, base_inputs)
+    else:
+        # Same seeds and inputs.yaml settings as heat_pump_batch.py run with the same --seed, so reports match its results file
+        rng = np.random.default_rng(args.seed)
+        tasks = ((index, scenario, int(rng.integers(2**63)))
+                 for index, scenario in enumerate(load_scenarios(args.scenarios, inputs_path=args.inputs,
+                                                                 base_inputs=base_inputs)))
+    report_count = render_reports(tasks, args.output_dir, args.format, args.dpi, base_inputs, args.weather_file,
+                                  args.start, args.end, args.workers,
+                                  progress=lambda done: sys.stderr.write(f"\r{done} reports written"))
+    sys.stderr.write(f"\nWrote {report_count} reports to {args.output_dir}\n")
+
+
+# Entry point for reports
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Global sensitivity analysis of the heat pump simulation.
+'''
+
+''' Purpose: Finds which inputs drive the energy use and the COP of the simulation. The inputs are the parameters of
+the GUI (the values read by fetch_input_values), each varied over a range around its value in inputs.yaml. Every
+run uses the other settings of inputs.yaml too (control mode, building model, COP map, output grid, ...).
+
+Two methods are available:
+    morris : Morris screening. A few trajectories (k + 1 runs each for k inputs) that change one input at a time.
+             mu* is the typical change in an output when the input moves over its whole range, sigma shows
+             non-linear effects and interactions. Cheap, good for sorting out the inputs that do not matter.
+    sobol  : Sobol indices with Saltelli sampling on a scrambled Sobol sequence (N (k + 2) runs).
+             S1 is the share of the output variance caused by the input on its own, ST the share including
+             interactions with the other inputs. Needs thousands of runs.
+
+Every run uses the same weather and COP fit: the weather is fetched once before the runs start and each worker
+process fits the COP curve once. Runs are shared between worker processes.
+
+Examples:
+
+    python heat_pump_sensitivity.py morris --start 2024-01-01 --end 2024-01-08 --trajectories 20 --weather-file edinburgh.csv
+    python heat_pump_sensitivity.py sobol --start 2024-01-01 --end 2024-01-08 --samples 512 --workers 8 --param wall_u_value=0.2,0.6 --param mass_of_water=150,300 --output sobol.csv
+
+'''
+
+## Importing Modules ##
+
+# Maths and Sampling
+import math  # Import to check the number of Sobol samples
+import numpy as np
+from scipy.stats import qmc  # Quasi-random sequences (Sobol and Latin hypercube)
+
+# Data Collection/Extraction
+import csv  # Import to write the indices and the model evaluations
+import sys  # Import for writing progress to the terminal
+import argparse  # Import to read command line options
+import multiprocessing  # Import to run the model on several worker processes
+
+from heat_pump_model import HeatPumpModel, DEFAULT_INPUTS_FILE, remember_weather, parse_datetime
+from heat_pump_batch import init_worker, run_scenario, check_scenario_values, with_inputs_file_settings
+
+
+# Parameters of the GUI (fetch_input_values), varied when no --param is given
+GUI_PARAMETERS = ('wall_area', 'wall_u_value', 'roof_area', 'roof_u_value', 'mass_of_water',
+                  'indoor_setpoint_temperature_K', 'on_temperature_threshold_K', 'off_temperature_threshold_K',
+                  'initial_tank_temperature_K', 'heat_loss_coefficient', 'overall_heat_transfer_coefficient',
+                  'fixed_condenser_temperature_K', 'tank_length')
+# Outputs reported by default (any key of results_summary can be used)
+DEFAULT_OUTPUTS = ("energy_total_kWh", "COP_average")
+MORRIS_LEVELS = 4  # Number of grid levels of the Morris design
+BOOTSTRAP_RESAMPLES = 200  # Resamples used for the confidence intervals of the Sobol indices
+
+
+## Parameters and sampling ##
+
+def default_range(name, value):
+    # Range of an input when none is given: ±3 K for temperatures, ±20 % for everything else
+    if name.endswith("_K"):
+        return (value - 3.0, value + 3.0)
+    return (0.8 * value, 1.2 * value)
+
+
+def parameter_ranges(base_inputs, given=None):
+    '''
+    Ranges (low, high) of the varied inputs. `given` is a list of (name, range) from --param, where
+    range is None to use default_range. Without `given` every GUI parameter is varied.
+    '''
+    given = given or [(name, None) for name in GUI_PARAMETERS]
+    ranges = {}
+    for name, bounds in given:
+        if name not in base_inputs:
+            raise ValueError(f"Unknown input '{name}'. Use one of {', '.join(sorted(base_inputs))}.")
+        low, high = bounds if bounds is not None else default_range(name, base_inputs[name])
+        if not low < high:
+            raise ValueError(f"The range of {name} must have its low value below its high value.")
+        ranges[name] = (float(low), float(high))
+    return ranges
+
+
+def scale_samples(unit_samples, ranges):
+    # Samples in the unit cube -> input values
+    lows = np.array([low for low, high in ranges.values()])
+    highs = np.array([high for low, high in ranges.values()])
+    return lows + unit_samples * (highs - lows)
+
+
+def morris_samples(k, trajectories, rng, levels=MORRIS_LEVELS):
+    '''
+    Morris trajectories in the unit cube: (trajectories * (k + 1), k) points and, for each trajectory,
+    the order in which the inputs are changed and the signed step of each input. Starting points come
+    from a Latin hypercube so the trajectories are spread over the whole range of every input.
+    '''
+    delta = levels / (2 * (levels - 1))
+    start_levels = np.arange(levels // 2) / (levels - 1) # Levels from which a step of +delta stays in [0, 1]
+    starts = qmc.LatinHypercube(d=k, seed=rng).random(trajectories)
+    points, moves = [], []
+    for start in starts:
+        x = start_levels[np.minimum((start * len(start_levels)).astype(int), len(start_levels) - 1)]
+        down = rng.random(k) < 0.5 # Half of the inputs start a step higher and step down instead
+        x = np.where(down, x + delta, x)
+        steps = np.where(down, -delta, delta)
+        order = rng.permutation(k)
+        points.append(x.copy())
+        for i in order:
+            x[i] += steps[i]
+            points.append(x.copy())
+        moves.append((order, steps))
+    return np.array(points), moves
+
+
+def morris_indices(outputs, moves):
+    '''
+    Elementary effects of each input from the model outputs of morris_samples (one row per point).
+    Returns mu, mu* and sigma, each (k, number of outputs). Effects are per whole input range.
+    '''
+    k = len(moves[0][0])
+    effects = np.empty((len(moves), k, outputs.shape[1]))
+    for r, (order, steps) in enumerate(moves):
+        trajectory = outputs[r * (k + 1):(r + 1) * (k + 1)]
+        for j, i in enumerate(order):
+            effects[r, i] = (trajectory[j + 1] - trajectory[j]) / steps[i]
+    sigma = effects.std(axis=0, ddof=1) if len(moves) > 1 else np.full(effects.shape[1:], np.nan)
+    return effects.mean(axis=0), np.abs(effects).mean(axis=0), sigma
+
+
+def saltelli_samples(k, samples, rng):
+    '''
+    Saltelli design in the unit cube: matrices A and B (N rows each, from one scrambled Sobol sequence of
+    2k dimensions) and k matrices AB_i (A with column i from B), stacked into N (k + 2) points.
+    '''
+    base = qmc.Sobol(d=2 * k, scramble=True, seed=rng).random_base2(int(math.log2(samples)))
+    A, B = base[:, :k], base[:, k:]
+    AB = [np.where(np.arange(k) == i, B, A) for i in range(k)]
+    return np.vstack([A, B] + AB)
+
+
+def sobol_indices(outputs, k, rng, resamples=BOOTSTRAP_RESAMPLES):
+    '''
+    First order (S1, Saltelli 2010) and total (ST, Jansen) Sobol indices from the model outputs of
+    saltelli_samples. Returns S1, ST and their 95 % confidence half-widths (bootstrap), each (k, number of outputs).
+    '''
+    N = len(outputs) // (k + 2)
+    outputs = outputs - outputs[:2 * N].mean(axis=0) # Centred outputs keep the S1 estimator accurate for large means
+    fA, fB = outputs[:N], outputs[N:2 * N]
+    fAB = outputs[2 * N:].reshape(k, N, outputs.shape[1])
+
+    def estimate(rows):
+        variance = np.var(np.concatenate([fA[rows], fB[rows]]), axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"): # An output that never changes has no indices
+            S1 = np.mean(fB[rows] * (fAB[:, rows] - fA[rows]), axis=1) / variance
+            ST = 0.5 * np.mean((fA[rows] - fAB[:, rows]) ** 2, axis=1) / variance
+        return S1, ST
+
+    S1, ST = estimate(np.arange(N))
+    resampled = [estimate(rng.integers(N, size=N)) for _ in range(resamples)]
+    S1_conf = 1.96 * np.std([S1_b for S1_b, ST_b in resampled], axis=0)
+    ST_conf = 1.96 * np.std([ST_b for S1_b, ST_b in resampled], axis=0)
+    return S1, ST, S1_conf, ST_conf
+
+
+## Model evaluations ##
+
+def init_sensitivity_worker(base_inputs, weather_file, start_datetime, end_datetime, location, outdoor_temp_K_array):
+    # Runs once in each worker process: batch worker settings plus the weather fetched by the main process
+    init_worker(base_inputs, weather_file, start_datetime, end_datetime)
+    if not weather_file:
+        remember_weather(location, start_datetime, end_datetime, outdoor_temp_K_array)
+
+
+def evaluate(values, names, start_datetime, end_datetime, output_names, base_inputs, weather_file=None,
+             include_hot_water_demand=False, seed=None, workers=1, progress=None, evaluations_path=None,
+             inputs_path=DEFAULT_INPUTS_FILE):
+    '''
+    Runs the model for every row of `values` (one column per input in `names`) and returns the chosen
+    outputs as an array (rows, outputs). Every run has the same hot water demand draw (one seed for all),
+    so differences between runs only come from the inputs, and the settings of inputs_path (control mode,
+    building model, COP map, output grid, ...) as a batch run of the same file would. With evaluations_path,
+    every run is also written to a CSV file with the same columns as a batch sweep.
+    '''
+    samples = (dict(zip(names, map(float, row)), include_hot_water_demand=include_hot_water_demand) for row in values)
+    scenarios = []
+    for scenario in with_inputs_file_settings(samples, inputs_path):
+        check_scenario_values({**base_inputs, **scenario}, f"sample {len(scenarios)}")
+        scenarios.append(scenario)
+    seed = int(np.random.default_rng(seed).integers(2**63))
+    tasks = [(index, scenario, seed) for index, scenario in enumerate(scenarios)]
+
+    # Fetch the weather and fit the COP curve once, before any run
+    model = HeatPumpModel(input_values=base_inputs, weather_file=weather_file)
+    model.fit_cop_curve()
+    initargs = (base_inputs, weather_file, start_datetime, end_datetime, model.location,
+                model.extract_weather_data(start_datetime, end_datetime))
+    init_sensitivity_worker(*initargs)
+
+    outputs = np.empty((len(tasks), len(output_names)))
+    pool = multiprocessing.Pool(workers, initializer=init_sensitivity_worker, initargs=initargs) if workers > 1 else None
+    evaluations_file = open(evaluations_path, "w", newline="") if evaluations_path else None
+    try:
+        rows = pool.imap(run_scenario, tasks, chunksize=max(1, len(tasks) // (workers * 16))) if pool is not None \
+            else map(run_scenario, tasks)
+        writer = None
+        for done, row in enumerate(rows, start=1):
+            outputs[row["scenario"]] = [row[name] for name in output_names]
+            if evaluations_file is not None:
+                if writer is None:
+                    writer = csv.DictWriter(evaluations_file, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+            if progress is not None:
+                progress(done, len(tasks))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if evaluations_file is not None:
+            evaluations_file.close()
+    return outputs
+
+
+## Analyses ##
+
+def run_morris(ranges, start_datetime, end_datetime, trajectories=10, output_names=DEFAULT_OUTPUTS, seed=None, **options):
+    '''
+    Morris screening of the inputs in `ranges`. Returns a list of rows (method, output, parameter, mu, mu_star, sigma).
+    `options` are passed on to evaluate (base_inputs, weather_file, workers, ...).
+    '''
+    rng = np.random.default_rng(seed)
+    names = list(ranges)
+    unit_samples, moves = morris_samples(len(names), trajectories, rng)
+    outputs = evaluate(scale_samples(unit_samples, ranges), names, start_datetime, end_datetime, output_names,
+                       seed=seed, **options)
+    mu, mu_star, sigma = morris_indices(outputs, moves)
+    return [{"method": "morris", "output": output, "parameter": name, "mu": mu[i, o], "mu_star": mu_star[i, o],
+             "sigma": sigma[i, o]}
+            for o, output in enumerate(output_names) for i, name in enumerate(names)]
+
+
+def run_sobol(ranges, start_datetime, end_datetime, samples=256, output_names=DEFAULT_OUTPUTS, seed=None, **options):
+    '''
+    Sobol indices of the inputs in `ranges` from N = `samples` (a power of 2) Saltelli samples.
+    Returns a list of rows (method, output, parameter, S1, S1_conf, ST, ST_conf).
+    '''
+    if samples < 2 or samples & (samples - 1):
+        raise ValueError("The number of Sobol samples must be a power of 2 (e.g. 256, 512 or 1024).")
+    rng = np.random.default_rng(seed)
+    names = list(ranges)
+    unit_samples = saltelli_samples(len(names), samples, rng)
+    outputs = evaluate(scale_samples(unit_samples, ranges), names, start_datetime, end_datetime, output_names,
+                       seed=seed, **options)
+    S1, ST, S1_conf, ST_conf = sobol_indices(outputs, len(names), rng)
+    return [{"method": "sobol", "output": output, "parameter": name, "S1": S1[i, o], "S1_conf": S1_conf[i, o],
+             "ST": ST[i, o], "ST_conf": ST_conf[i, o]}
+            for o, output in enumerate(output_names) for i, name in enumerate(names)]
+
+
+def format_report(rows):
+    # Table of the indices for each output, most important input first
+    lines = []
+    for output in dict.fromkeys(row["output"] for row in rows):
+        output_rows = [row for row in rows if row["output"] == output]
+        if output_rows[0]["method"] == "morris":
+            lines.append(f"\nMorris screening of {output} (effect over the whole input range)")
+            lines.append(f"  {'parameter':<36}{'mu*':>12}{'mu':>12}{'sigma':>12}")
+            for row in sorted(output_rows, key=lambda row: -np.nan_to_num(row["mu_star"])):
+                lines.append(f"  {row['parameter']:<36}{row['mu_star']:>12.4g}{row['mu']:>12.4g}{row['sigma']:>12.4g}")
+        else:
+            lines.append(f"\nSobol indices of {output} (± 95 % confidence)")
+            lines.append(f"  {'parameter':<36}{'S1':>9}{'±':>8}{'ST':>9}{'±':>8}")
+            for row in sorted(output_rows, key=lambda row: -np.nan_to_num(row["ST"])):
+                lines.append(f"  {row['parameter']:<36}{row['S1']:>9.3f}{row['S1_conf']:>8.3f}{row['ST']:>9.3f}{row['ST_conf']:>8.3f}")
+    return "\n".join(lines)
+
+
+def parse_param(text):
+    # "wall_u_value=0.2,0.6" -> ("wall_u_value", (0.2, 0.6)); "wall_u_value" -> ("wall_u_value", None)
+    if "=" not in text:
+        return text.strip(), None
+    name, bounds = text.split("=", 1)
+    low, high = (float(value) for value in bounds.split(","))
+    return name.strip(), (low, high)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Global sensitivity analysis of the heat pump simulation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    morris_parser = subparsers.add_parser("morris", help="Morris screening (cheap, ranks the inputs)")
+    morris_parser.add_argument("--trajectories", type=int, default=10, help="Number of trajectories (k + 1 runs each)")
+    sobol_parser = subparsers.add_parser("sobol", help="Sobol indices (thousands of runs)")
+    sobol_parser.add_argument("--samples", type=int, default=256, help="Base samples N, a power of 2 (N (k + 2) runs)")
+    for command_parser in (morris_parser, sobol_parser):
+        command_parser.add_argument("--start", type=parse_datetime, required=True, help="Start date, e.g. 2024-01-01")
+        command_parser.add_argument("--end", type=parse_datetime, required=True, help="End date, e.g. 2024-01-08")
+        command_parser.add_argument("--param", type=parse_param, action="append", default=None,
+                                    help="Input to vary, optionally with its range, e.g. wall_u_value=0.2,0.6 "
+                                         "(repeat for more inputs; default: every GUI parameter, ±20 %% or ±3 K)")
+        command_parser.add_argument("--outputs", default=",".join(DEFAULT_OUTPUTS),
+                                    help="Outputs to analyse (keys of results_summary, comma separated)")
+        command_parser.add_argument("--inputs", default=DEFAULT_INPUTS_FILE, help="YAML file with the default inputs")
+        command_parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp)")
+        command_parser.add_argument("--hot-water", action="store_true", help="Include the hot water demand (same draw in every run)")
+        command_parser.add_argument("--seed", type=int, default=None, help="Seed for the samples and the hot water demand")
+        command_parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+        command_parser.add_argument("--output", default=None, help="CSV file for the indices")
+        command_parser.add_argument("--evaluations", default=None, help="CSV file for every model run")
+    args = parser.parse_args(argv)
+
+    base_inputs = HeatPumpModel(yaml_sim_file_path=args.inputs).input_values
+    ranges = parameter_ranges(base_inputs, args.param)
+    options = dict(output_names=[name.strip() for name in args.outputs.split(",")], seed=args.seed,
+                   base_inputs=base_inputs, weather_file=args.weather_file, include_hot_water_demand=args.hot_water,
+                   workers=args.workers, evaluations_path=args.evaluations, inputs_path=args.inputs,
+                   progress=lambda done, total: sys.stderr.write(f"\r{done}/{total} runs finished"))
+    if args.command == "morris":
+        rows = run_morris(ranges, args.start, args.end, trajectories=args.trajectories, **options)
+    else:
+        rows = run_sobol(ranges, args.start, args.end, samples=args.samples, **options)
+    sys.stderr.write("\n")
+    print(format_report(rows))
+    if args.output:
+        with open(args.output, "w", newline="") as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+# Entry point for sensitivity analysis
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Local HTTP service for the heat pump simulation.
+'''
+
+''' Purpose: Lets other programs run the headless HeatPumpModel by sending JSON over HTTP, instead of starting a
+new Python (and the GUI) for every simulation. Requests are queued onto a pool of worker processes. Each worker
+imports the model, fits the COP curve and reads the local weather file once when it starts, and keeps them for
+every request it runs afterwards.
+
+Requests (POST /simulate) use the input_values names of the model, plus the building and the date range:
+
+    {
+      "building_type": "Library",                      # or "building_number": 0 (preset values are only set by building_type)
+      "start": "2024-01-01", "end": "2024-01-02",
+      "input_values": {"wall_u_value": 0.3, "mass_of_water": 180},
+      "include_hot_water_demand": true,
+      "location": {"latitude": 55.95, "longitude": -3.19},
+      "seed": 1,                                       # hot water demand draw (optional)
+      "series": false,                                 # true: also return the tank temperature over time
+      "wait": false                                    # true: answer with the results instead of a job id
+    }
+
+Anything not given keeps its value from the building type preset, then from inputs.yaml (including its settings,
+as for a scenario file of heat_pump_batch.py).
+
+Responses (JSON):
+    POST /simulate       202 {"job_id": ..., "status": "queued"}  (or 200 with the job and its results when "wait" is true)
+    GET  /jobs/<job_id>  200 {"job_id": ..., "status": "queued" | "running" | "done" | "failed", "result": ... or "error": ...}
+    GET  /health         200 {"status": "ok", "workers": ..., "jobs": {...}}
+Bad requests get 400 with {"error": ...}, unknown jobs 404 and a full queue 503.
+
+Example (local weather file as a stand-in for Meteostat):
+
+    python heat_pump_service.py --port 8023 --workers 4 --weather-file edinburgh.csv
+    curl -X POST localhost:8023/simulate -d '{"building_type": "Library", "start": "2024-01-01", "end": "2024-01-02", "wait": true}'
+
+'''
+
+## Importing Modules ##
+
+# Data Collection/Extraction
+import json  # Import to read requests and write responses
+import uuid  # Import to make job ids
+import argparse  # Import to read command line options
+import threading  # Import to guard the job table (the HTTP server answers each request on its own thread)
+import multiprocessing  # Import to start the worker processes
+from collections import OrderedDict  # Import to keep jobs in the order they were submitted
+from concurrent.futures import ProcessPoolExecutor, TimeoutError  # Import for the pool of warm worker processes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Import for the HTTP server
+from urllib.parse import urlsplit  # Import to split the path from the query string
+import numpy as np
+
+from heat_pump_model import HeatPumpModel, DEFAULT_INPUTS_FILE, YAML_INPUT_KEYS, BUILDING_NUMBERS, read_weather_table
+from heat_pump_batch import (init_worker, make_model, scenario_dates, validate_scenario, check_scenario_values,
+                             with_inputs_file_settings, _worker_settings)
+
+
+# Names accepted in "input_values": the same names the model uses
+INPUT_NAMES = set(YAML_INPUT_KEYS.values()) | {"tank_length"}
+# Other fields of a request
+REQUEST_FIELDS = {"name", "building_type", "building_number", "include_hot_water_demand", "location", "start", "end",
+                  "input_values", "output_grid", "energy_accounting", "building_model", "control_mode", "seed", "series",
+                  "wait"}
+MAX_FINISHED_JOBS = 10000  # Finished jobs kept for polling before the oldest are forgotten
+WAIT_TIMEOUT = 600  # Longest time (s) a "wait" request is held open before a job id is returned instead
+
+
+## Worker processes ##
+
+def init_service_worker(base_inputs, weather_file):
+    '''
+    Runs once in each worker process when it starts. Pays the start-up costs for every later
+    request: fits the COP curve and reads the weather file into the per-process caches of heat_pump_model.
+    '''
+    init_worker(base_inputs, weather_file, None, None)
+    model = HeatPumpModel(input_values=base_inputs, weather_file=weather_file)
+    model.fit_cop_curve()
+    if weather_file:
+        read_weather_table(weather_file)
+
+
+def warm_up():
+    # Does nothing; submitted once per worker at start-up so every worker is started before the first request
+    return True
+
+
+def run_job(scenario, seed, include_series):
+    '''
+    Runs one validated request in a worker and returns its results: the settings and input values used,
+    the metrics from results_summary() and, if asked for, the tank temperature over time.
+    '''
+    settings = _worker_settings
+    start, end = scenario_dates(scenario, None, None)
+    model = make_model(scenario, settings["base_inputs"], rng=np.random.default_rng(seed),
+                       weather_file=settings["weather_file"])
+    model.initialize_simulation(start, end)
+    model.calculate_metrics()
+    result = {
+        "name": scenario.get("name", ""),
+        "building_number": model.building_number,
+        "include_hot_water_demand": model.include_hot_water_demand,
+        "building_model": model.building_model,
+        "control_mode": model.control_mode,
+        "location": {"latitude": model.location[0], "longitude": model.location[1]},
+        "start": start.isoformat(sep=" "),
+        "end": end.isoformat(sep=" "),
+        "input_values": {key: float(value) for key, value in model.input_values.items()},
+        "metrics": {key: float(value) for key, value in model.results_summary().items()},
+    }
+    if include_series:
+        result["series"] = {"time_s": np.asarray(model.run_times[-1]).tolist(),
+                            "tank_temperature_K": np.asarray(model.run_temps[-1]).tolist()}
+    return result
+
+
+## Service ##
+
+class SimulationService:
+    '''
+    Job queue in front of the pool of worker processes. Used by the HTTP handler, but can also be
+    used directly from Python:
+        service = SimulationService(workers=4, weather_file="edinburgh.csv")
+        job_id = service.submit({"building_type": "Library", "start": "2024-01-01", "end": "2024-01-02"})
+        service.job(job_id, wait=True)
+    '''
+    def __init__(self, workers=1, weather_file=None, yaml_sim_file_path=DEFAULT_INPUTS_FILE, max_queue=1000):
+        self.base_inputs = HeatPumpModel(yaml_sim_file_path=yaml_sim_file_path).input_values
+        self.yaml_sim_file_path = yaml_sim_file_path  # Its settings (output grid, control mode, ...) are the defaults of every request
+        self.weather_file = weather_file
+        self.workers = workers
+        self.max_queue = max_queue  # Most jobs waiting or running at once; more are turned away (503)
+        self.jobs = OrderedDict()   # job id -> Future
+        self.lock = threading.Lock()
+        # "spawn" workers do not inherit the server threads, which "fork" cannot do safely
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=init_service_worker, initargs=(self.base_inputs, weather_file))
+        # Start every worker now, so the start-up costs are not paid by the first requests
+        for warm in [self.executor.submit(warm_up) for _ in range(workers)]:
+            warm.result()
+
+    def parse_request(self, request):
+        '''
+        Checks a request and turns it into (scenario, seed, series, wait), where scenario is in the flat
+        form used by heat_pump_batch.make_model. Raises ValueError with a message for the client on any problem.
+        '''
+        if not isinstance(request, dict):
+            raise ValueError("The request must be a JSON object.")
+        unknown = sorted(set(request) - REQUEST_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}.")
+        request = dict(request)
+        seed = request.pop("seed", None)
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+            raise ValueError("seed must be a non-negative whole number.")
+        series, wait = request.pop("series", False), request.pop("wait", False)
+        if not isinstance(series, bool) or not isinstance(wait, bool):
+            raise ValueError("series and wait must be true or false.")
+        if "start" not in request or "end" not in request:
+            raise ValueError("start and end are required.")
+
+        # Settings, building type and dates are checked the same way as a scenario file
+        building_number = request.pop("building_number", None)
+        input_values = request.pop("input_values", {}) or {}
+        simulation_parameters = {name: request.pop(name) for name in ("output_grid", "energy_accounting", "building_model",
+                                                                       "control_mode") if name in request}
+        if simulation_parameters:
+            request["simulation_parameters"] = simulation_parameters
+        scenario = validate_scenario(request, self.base_inputs, "request")
+
+        if building_number is not None:
+            if building_number not in BUILDING_NUMBERS.values() or isinstance(building_number, bool):
+                raise ValueError(f"building_number must be one of {sorted(BUILDING_NUMBERS.values())}.")
+            scenario["building_number"] = building_number
+        if not isinstance(input_values, dict):
+            raise ValueError("input_values must be an object of input names and numbers.")
+        for name, value in input_values.items():
+            if name not in INPUT_NAMES:
+                raise ValueError(f"Unknown input value '{name}'.")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+                raise ValueError(f"input_values.{name} must be a finite number.")
+            scenario[name] = float(value)
+        scenario = next(with_inputs_file_settings([scenario], self.yaml_sim_file_path))
+        check_scenario_values({**self.base_inputs, **scenario}, "request")
+        return scenario, seed, series, wait
+
+    def submit(self, request):
+        # Queues a request and returns its job id. Raises ValueError for a bad request, OverflowError if the queue is full
+        scenario, seed, series, wait = self.parse_request(request)
+        with self.lock:
+            if self.pending() >= self.max_queue:
+                raise OverflowError(f"The queue is full ({self.max_queue} jobs). Try again later.")
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = self.executor.submit(run_job, scenario, seed, series)
+            self.forget_old_jobs()
+        return job_id, wait
+
+    def pending(self):
+        # Number of jobs waiting or running
+        return sum(1 for future in self.jobs.values() if not future.done())
+
+    def forget_old_jobs(self):
+        # Drops the oldest finished jobs once more than MAX_FINISHED_JOBS are kept
+        finished = [job_id for job_id, future in self.jobs.items() if future.done()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def job(self, job_id, wait=False):
+        '''
+        Status of a job as a dictionary for the client, or None for an unknown job id.
+        With wait=True, waits (up to WAIT_TIMEOUT) for the job to finish first.
+        '''
+        with self.lock:
+            future = self.jobs.get(job_id)
+        if future is None:
+            return None
+        if wait:
+            try:
+                future.exception(timeout=WAIT_TIMEOUT)
+            except TimeoutError:
+                pass # Still running: the client gets the job id to poll
+        if not future.done():
+            return {"job_id": job_id, "status": "running" if future.running() else "queued"}
+        if future.exception() is not None:
+            return {"job_id": job_id, "status": "failed", "error": str(future.exception())}
+        return {"job_id": job_id, "status": "done", "result": future.result()}
+
+    def health(self):
+        with self.lock:
+            futures = list(self.jobs.values())
+        done = [future for future in futures if future.done()]
+        return {"status": "ok", "workers": self.workers, "weather_file": self.weather_file,
+                "jobs": {"pending": len(futures) - len(done), "finished": len(done)}}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    # Answers the HTTP requests; self.server.service is the SimulationService
+    MAX_BODY = 1 << 20  # Largest request body accepted (1 MB)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        service = self.server.service
+        if path == "/health":
+            self.send_json(200, service.health())
+        elif path.startswith("/jobs/"):
+            job = service.job(path[len("/jobs/"):])
+            if job is None:
+                self.send_json(404, {"error": "Unknown job id."})
+            else:
+                self.send_json(200, job)
+        else:
+            self.send_json(404, {"error": "Not found. Use POST /simulate, GET /jobs/<job_id> or GET /health."})
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip("/") != "/simulate":
+            self.send_json(404, {"error": "Not found. Use POST /simulate."})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.MAX_BODY:
+            self.send_json(413, {"error": "Request body too large."})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job_id, wait = self.server.service.submit(request)
+        except (ValueError, TypeError, KeyError) as error: # json.JSONDecodeError is a ValueError
+            self.send_json(400, {"error": str(error)})
+            return
+        except OverflowError as error:
+            self.send_json(503, {"error": str(error)})
+            return
+        if wait:
+            job = self.server.service.job(job_id, wait=True)
+            self.send_json(200 if job["status"] in ("done", "failed") else 202, job)
+        else:
+            self.send_json(202, {"job_id": job_id, "status": "queued"})
+
+    def log_message(self, format, *args):
+        # Quiet by default; the server is started with verbose=True to log every request
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8023, workers=1, weather_file=None, yaml_sim_file_path=DEFAULT_INPUTS_FILE,
+                max_queue=1000, verbose=False):
+    # Starts the worker pool and returns the (not yet serving) HTTP server
+    server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.service = SimulationService(workers=workers, weather_file=weather_file,
+                                       yaml_sim_file_path=yaml_sim_file_path, max_queue=max_queue)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP service for the heat pump simulation.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: this computer only)")
+    parser.add_argument("--port", type=int, default=8023, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() - 1), help="Number of worker processes")
+    parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp) used instead of Meteostat")
+    parser.add_argument("--inputs", default=DEFAULT_INPUTS_FILE, help="YAML file with the default inputs")
+    parser.add_argument("--max-queue", type=int, default=1000, help="Most jobs waiting or running at once")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.workers, args.weather_file, args.inputs, args.max_queue, args.verbose)
+    print(f"Heat pump simulation service on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
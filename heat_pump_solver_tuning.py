@@ -0,0 +1,234 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Automatic tuning of the ODE solver settings of the heat pump simulation.
+'''
+
+''' Purpose: The solver settings (integration method, tolerances, longest step and output grid) decide how long a run
+takes, and the defaults (RK45, solve_ivp tolerances, 120 s steps) were picked by hand. This tool finds the cheapest
+settings that still give the right answer for a scenario:
+
+    1. A reference run with very tight settings (DOP853, rtol 1e-10, steps of at most 10 s, every step kept).
+    2. A run for every combination of the settings to search, timed (fastest of --repeats runs).
+    3. Each run is compared with the reference: relative error of the total energy, difference in the number of
+       pump switches the ODE made and tank temperature error. The temperature error is the largest difference
+       between the percentiles (1st to 99th) of the tank temperature over the run, i.e. of how long the tank spends
+       at each temperature. A pointwise difference would jump by the whole on/off band when a switch comes a
+       few seconds later than in the reference; the percentiles only move by as much as the run really differs.
+    4. The fastest run with every error within the budget is written as a solver profile.
+
+A solver profile is a small YAML file. Give it as simulation_parameters.solver_profile in inputs.yaml (or in a
+scenario file) to use its settings for every run. Every run of the search uses the same hot water demand draw.
+
+Examples:
+
+    python heat_pump_solver_tuning.py --start 2024-01-01 --end 2024-01-03 --weather-file edinburgh.csv --profile solver_profile.yaml
+    python heat_pump_solver_tuning.py --scenarios scenarios.jsonl --scenario-index 2 --start 2024-01-01 --end 2024-01-08 --max-energy-error 0.001 --max-step 120,300,600 --output tuning.csv
+
+'''
+
+## Importing Modules ##
+
+import csv  # Import to write every run of the search
+import time  # Import to time the runs (wall clock)
+import math  # Import for the infinite starting time
+import argparse  # Import to read command line options
+import itertools  # Import to build every combination of the settings to search
+import sys  # Import for writing progress to the terminal
+import numpy as np
+
+from heat_pump_model import HeatPumpModel, DEFAULT_INPUTS_FILE, SOLVER_PROFILE_DEFAULTS, parse_datetime
+from heat_pump_batch import make_model, load_scenarios
+
+
+# Settings of the reference run: far tighter than any run needs, so its errors are negligible
+REFERENCE_SETTINGS = {"method": "DOP853", "rtol": 1e-10, "atol": 1e-9, "max_step_s": 10.0, "output_grid": "solver"}
+
+# Settings searched when they are not given on the command line
+DEFAULT_SEARCH = {
+    "method": ["RK45", "RK23", "DOP853"],
+    "rtol": [1e-2, 1e-3, 1e-4],
+    "atol": [1e-6, 1e-3],
+    "max_step_s": [60.0, 120.0, 300.0, 600.0, 1200.0],
+    "output_grid": ["uniform", "solver"],
+}
+
+# Error budget used when it is not given on the command line
+DEFAULT_BUDGET = {"energy_error": 0.005, "switch_error": 1, "temperature_error_K": 0.2}
+
+# Percentiles of the tank temperature compared with the reference for the temperature error
+TEMPERATURE_PERCENTILES = np.arange(1, 100)
+
+
+def run_with_settings(scenario, base_inputs, start, end, settings, seed, weather_file=None, repeats=1):
+    '''
+    Runs a scenario with one set of solver settings (any of SOLVER_PROFILE_DEFAULTS plus output_grid).
+    Returns the model of the last run and the fastest wall time (s) of `repeats` runs. Every run uses the
+    same seed, so the hot water demand is the same for every setting.
+    '''
+    fastest = math.inf
+    for repeat in range(repeats):
+        model = make_model(scenario, base_inputs, rng=np.random.default_rng(seed), weather_file=weather_file)
+        model.apply_solver_profile(settings)
+        began = time.perf_counter()
+        model.initialize_simulation(start, end)
+        model.calculate_metrics()
+        fastest = min(fastest, time.perf_counter() - began)
+    return model, fastest
+
+
+def pump_switches(model):
+    '''
+    Number of times the pump turns on or off. In the on/off mode these are the switches the ODE made
+    (pump_status_series), so the count does not depend on the output grid. The modulating mode has no
+    switches; its starts and stops are counted on the stored samples.
+    '''
+    times, status = model.pump_status_series()
+    running = np.asarray(status, dtype=float) > 0
+    return int(np.count_nonzero(running[1:] != running[:-1]))
+
+
+def temperature_percentiles(model, step_s=REFERENCE_SETTINGS["max_step_s"]):
+    # TEMPERATURE_PERCENTILES of the tank temperature over the run, resampled every step_s seconds so every moment counts the same
+    times = np.append(np.arange(0.0, model.total_seconds, step_s), model.total_seconds)
+    return np.percentile(np.interp(times, model.run_times[-1], model.run_temps[-1]), TEMPERATURE_PERCENTILES)
+
+
+def run_errors(model, reference):
+    # Errors of a run against the reference run
+    reference_energy = reference.energy_metrics['total']
+    energy = model.energy_metrics['total']
+    return {
+        "energy_error": abs(energy - reference_energy) / abs(reference_energy) if reference_energy else abs(energy),
+        "switch_error": abs(pump_switches(model) - pump_switches(reference)),
+        "temperature_error_K": float(np.max(np.abs(temperature_percentiles(model) - temperature_percentiles(reference)))),
+    }
+
+
+def within_budget(errors, budget):
+    return all(errors[name] <= limit for name, limit in budget.items())
+
+
+def tune_solver(scenario, start, end, base_inputs=None, search=None, budget=None, seed=0, weather_file=None,
+                repeats=3, progress=None):
+    '''
+    Searches every combination of the `search` settings ({setting: [values]}, DEFAULT_SEARCH for settings
+    not given) for the fastest run whose errors against the reference are all within `budget`
+    ({error: largest allowed}, see DEFAULT_BUDGET).
+    Returns (rows, best): one row per setting combination (settings, time, right hand side calls, results
+    and errors) and the settings of the fastest run within budget, or None if no run was within budget.
+    The first row is the reference run and the second the default settings.
+    '''
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=DEFAULT_INPUTS_FILE).input_values
+    search = {**DEFAULT_SEARCH, **(search or {})}
+    budget = {**DEFAULT_BUDGET, **(budget or {})}
+    reference, reference_seconds = run_with_settings(scenario, base_inputs, start, end, REFERENCE_SETTINGS, seed, weather_file)
+
+    def row(kind, settings, model, seconds, errors):
+        return {"run": kind, **{name: settings.get(name) for name in DEFAULT_SEARCH}, "seconds": seconds,
+                "rhs_evaluations": model.rhs_evaluations if model is not None else "",
+                "energy_total_kWh": model.energy_metrics['total'] if model is not None else "",
+                "pump_switches": pump_switches(model) if model is not None else "", **errors,
+                "within_budget": model is not None and within_budget(errors, budget)}
+
+    rows = [row("reference", REFERENCE_SETTINGS, reference, reference_seconds, run_errors(reference, reference))]
+    default_settings = {**SOLVER_PROFILE_DEFAULTS, "output_grid": make_model(scenario, base_inputs).output_grid}
+    combinations = [dict(zip(search, values)) for values in itertools.product(*search.values())]
+    best = None
+    for done, (kind, settings) in enumerate([("default", default_settings)] + [("search", settings) for settings in combinations]):
+        try:
+            model, seconds = run_with_settings(scenario, base_inputs, start, end, settings, seed, weather_file, repeats)
+            errors = run_errors(model, reference)
+        except (RuntimeError, ValueError) as error:
+            # Settings the solver cannot work with (e.g. a step too long for the method) are simply not chosen
+            sys.stderr.write(f"\n{settings}: {error}\n")
+            model, seconds, errors = None, math.inf, {name: math.inf for name in budget}
+        rows.append(row(kind, settings, model, seconds, errors))
+        if kind == "search" and rows[-1]["within_budget"] and (best is None or seconds < best[1]):
+            best = (settings, seconds)
+        if progress is not None:
+            progress(done + 1, len(combinations) + 1)
+    return rows, (best[0] if best else None)
+
+
+def write_profile(profile_path, settings, details):
+    # Writes a solver profile (settings, then what they were tuned for) for simulation_parameters.solver_profile
+    import yaml  # Import to write the profile in the same format as the input files
+    with open(profile_path, "w") as profile_file:
+        profile_file.write("# Solver profile from heat_pump_solver_tuning.py. "
+                           "Use it with simulation_parameters.solver_profile in inputs.yaml\n")
+        yaml.safe_dump({"solver_profile": settings, "tuned_for": details}, profile_file, sort_keys=False)
+
+
+def parse_list(kind):
+    # Comma separated command line list of numbers or words, e.g. "1e-3,1e-4"
+    return lambda text: [kind(value) for value in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the fastest ODE solver settings that still match a reference run")
+    parser.add_argument("--start", type=parse_datetime, required=True, help="Start date, e.g. 2024-01-01")
+    parser.add_argument("--end", type=parse_datetime, required=True, help="End date, e.g. 2024-01-03")
+    parser.add_argument("--scenarios", default=None, help="Scenario file (.jsonl or multi-document YAML); default: inputs.yaml")
+    parser.add_argument("--scenario-index", type=int, default=0, help="Scenario of the file to tune for")
+    parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the hot water demand (the same in every run)")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of each setting; the fastest is kept")
+    parser.add_argument("--methods", type=parse_list(str), default=None, help="Methods to search, e.g. RK45,RK23,DOP853")
+    parser.add_argument("--rtol", type=parse_list(float), default=None, help="Relative tolerances to search, e.g. 1e-3,1e-4")
+    parser.add_argument("--atol", type=parse_list(float), default=None, help="Tank temperature tolerances (K) to search")
+    parser.add_argument("--max-step", type=parse_list(float), default=None, help="Longest steps (s) to search, e.g. 120,300,600")
+    parser.add_argument("--output-grids", type=parse_list(str), default=None, help="Output grids to search, e.g. uniform,dense,solver")
+    parser.add_argument("--max-energy-error", type=float, default=DEFAULT_BUDGET["energy_error"],
+                        help="Largest relative error of the total energy")
+    parser.add_argument("--max-switch-error", type=int, default=DEFAULT_BUDGET["switch_error"],
+                        help="Largest difference in the number of pump switches")
+    parser.add_argument("--max-temperature-error", type=float, default=DEFAULT_BUDGET["temperature_error_K"],
+                        help="Largest difference between the tank temperature percentiles of a run and the reference (K)")
+    parser.add_argument("--output", default=None, help="CSV file with every run of the search")
+    parser.add_argument("--profile", default="solver_profile.yaml", help="Solver profile file to write")
+    args = parser.parse_args(argv)
+
+    scenario = next(itertools.islice(load_scenarios(args.scenarios), args.scenario_index, None))
+    search = {name: values for name, values in (("method", args.methods), ("rtol", args.rtol), ("atol", args.atol),
+                                                ("max_step_s", args.max_step), ("output_grid", args.output_grids)) if values}
+    budget = {"energy_error": args.max_energy_error, "switch_error": args.max_switch_error,
+              "temperature_error_K": args.max_temperature_error}
+    rows, best = tune_solver(scenario, args.start, args.end, search=search, budget=budget, seed=args.seed,
+                             weather_file=args.weather_file, repeats=args.repeats,
+                             progress=lambda done, total: sys.stderr.write(f"\r{done} of {total} settings run"))
+    sys.stderr.write("\n")
+    if args.output:
+        with open(args.output, "w", newline="") as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    reference, default = rows[0], rows[1]
+    print(f"Reference: {reference['energy_total_kWh']:.3f} kWh, {reference['pump_switches']} pump switches, {reference['seconds']:.2f} s")
+    print(f"Default settings: {default['seconds']:.3f} s, energy error {default['energy_error']:.2e}, "
+          f"switch error {default['switch_error']}, temperature error {default['temperature_error_K']:.3f} K"
+          f"{'' if default['within_budget'] else ' (outside the budget)'}")
+    if best is None:
+        print("No setting searched is within the error budget; widen the budget or search tighter settings.")
+        return
+    chosen = next(row for row in rows[2:] if all(row[name] == value for name, value in best.items()))
+    print(f"Fastest within budget: {best} in {chosen['seconds']:.3f} s ({default['seconds'] / chosen['seconds']:.1f}x the default), "
+          f"energy error {chosen['energy_error']:.2e}, switch error {chosen['switch_error']}, "
+          f"temperature error {chosen['temperature_error_K']:.3f} K")
+    write_profile(args.profile, best, {
+        "scenario": scenario.get("name", "") if args.scenarios else "inputs.yaml",
+        "start": args.start.isoformat(sep=" "),
+        "end": args.end.isoformat(sep=" "),
+        "budget": budget,
+        "errors": {name: float(chosen[name]) for name in budget},
+        "seconds": float(chosen["seconds"]),
+        "default_seconds": float(default["seconds"]),
+    })
+    print(f"Wrote {args.profile}")
+
+
+# Entry point for solver tuning
+if __name__ == "__main__":
+    main()
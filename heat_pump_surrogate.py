@@ -0,0 +1,285 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Surrogate model of the heat pump simulation for instant estimates.
+'''
+
+''' Purpose: Learns the results of a sweep (heat_pump_batch.py) so new designs can be estimated without solving
+the ODE. The surrogate predicts the daily energy use, the average COP and the minimum tank temperature from the
+building and tank parameters and the outdoor temperature statistics (mean, minimum and maximum) of the period.
+
+The surrogate is a polynomial (quadratic by default) fitted by ridge regression on standardised inputs, so an
+estimate is one small dot product. Every estimate comes with an error estimate (residual spread of the fit, larger
+away from the training designs) and a flag saying when the full simulation should be run instead: when an input
+is outside the range covered by the sweep, or the design is further from the training designs than any of them.
+
+Examples:
+
+    python heat_pump_batch.py sweep --start 2024-01-01 --end 2024-01-02 --vary wall_u_value=0.2,0.35,0.5 --vary mass_of_water=150,200,250 --vary wall_area=100,150,200 --output sweep.csv
+    python heat_pump_surrogate.py train --results sweep.csv --output surrogate.npz
+    python heat_pump_surrogate.py predict --surrogate surrogate.npz --set wall_u_value=0.3 --set mass_of_water=180
+
+The GUI loads surrogate.npz (next to this file) when it exists and shows the estimates as the fields change.
+
+'''
+
+## Importing Modules ##
+
+# Maths
+import itertools  # Import to list the terms of the polynomial
+import json  # Import to store the names of the inputs and outputs in the surrogate file
+import numpy as np
+
+# Data Collection/Extraction
+import os  # Import for the default surrogate file
+import csv  # Import to read the results files of sweeps
+import argparse  # Import to read command line options
+from datetime import datetime  # Import to find the length of each scenario
+
+from heat_pump_model import MODULE_DIR, CYCLING_METRICS, ACCOUNTING_METRICS
+
+
+DEFAULT_SURROGATE_FILE = os.path.join(MODULE_DIR, "surrogate.npz")
+# Outputs learnt by the surrogate (daily energy is the energy total divided by the number of days)
+SURROGATE_OUTPUTS = ("daily_energy_kWh", "COP_average", "min_tank_temperature_K")
+# Columns of a results file that are not inputs of the surrogate
+NON_INPUT_COLUMNS = {"scenario", "name", "building_number", "building_model", "control_mode", "cop_map_file", "output_grid",
+                     "energy_accounting", "solver_profile", "carbon_intensity_file", "tariff_file", "latitude", "longitude", "start", "end", "seed", "event_log", "time_points", "energy_total_kWh", "average_power_kW", "COP_average", "heat_loss_total_kWh",
+                     "hot_water_total_kWh", "min_tank_temperature_K", "max_tank_temperature_K", *CYCLING_METRICS,
+                     *ACCOUNTING_METRICS}
+RANGE_MARGIN = 0.05  # Inputs may go this fraction of their training range outside it before an estimate is flagged
+# Settings that change the model itself rather than its inputs, with their value in results files older than the column.
+# Every row a surrogate learns from must have the same settings, and an estimate for other settings is flagged
+SETTING_COLUMNS = {"control_mode": "on_off", "building_model": "steady", "cop_map_file": ""}
+
+
+class SurrogateModel:
+    '''
+    Polynomial ridge regression from the inputs (input_values names, include_hot_water_demand and the
+    outdoor temperature statistics) to SURROGATE_OUTPUTS.
+
+        y = phi(x_s) . beta,   x_s = (x - mean) / scale,   phi = every product of up to `degree` inputs
+
+    Estimate error: s * sqrt(1 + h) with s the residual standard deviation of the fit and
+    h = phi M phi^T the leverage of the design (M = (Phi^T Phi + ridge I)^-1); h grows away from the training designs.
+    '''
+    def __init__(self, input_names, output_names, degree, terms, mean, scale, coefficients, inverse_gram,
+                 residual_std, cv_rmse, max_leverage, low, high, typical, settings=None):
+        self.input_names = list(input_names)    # Inputs used by the polynomial (the ones that varied in the sweep)
+        self.output_names = list(output_names)
+        self.degree = degree
+        self.terms = np.asarray(terms)           # (number of terms, degree) indices into [inputs, 1]
+        self.mean, self.scale = np.asarray(mean), np.asarray(scale)
+        self.coefficients = np.asarray(coefficients)  # (number of terms, number of outputs)
+        self.inverse_gram = np.asarray(inverse_gram)  # M, for the leverage of a new design
+        self.residual_std = np.asarray(residual_std)  # s of each output
+        self.cv_rmse = np.asarray(cv_rmse)            # Cross-validated error of each output (reported after training)
+        self.max_leverage = float(max_leverage)       # Largest leverage of a training design
+        # Range of every candidate input in the training data (also inputs that did not vary), and its typical value
+        self.low, self.high, self.typical = dict(low), dict(high), dict(typical)
+        # SETTING_COLUMNS of the training runs (control mode, building model, COP map file)
+        self.settings = dict(settings or {})
+
+    @staticmethod
+    def polynomial_terms(input_count, degree):
+        # Every product of up to `degree` inputs, as index tuples padded with the index of a constant 1
+        ones = input_count
+        return np.array([combination + (ones,) * (degree - len(combination))
+                         for order in range(degree + 1)
+                         for combination in itertools.combinations_with_replacement(range(input_count), order)],
+                        dtype=int).reshape(-1, degree)
+
+    def design(self, X):
+        # Polynomial terms of standardised inputs, one row per design
+        scaled = (np.atleast_2d(X) - self.mean) / self.scale
+        padded = np.hstack([scaled, np.ones((len(scaled), 1))])
+        return padded[:, self.terms].prod(axis=2) if self.degree > 0 else np.ones((len(scaled), 1))
+
+    @classmethod
+    def fit(cls, X, Y, input_names, output_names, degree=2, ridge=1e-6, folds=5, candidates=None, rng=None, settings=None):
+        '''
+        Fits the surrogate to designs X (rows, inputs) and results Y (rows, outputs). Inputs that never change
+        are left out of the polynomial, but their range is kept so a design that changes them is flagged.
+        `candidates` maps every candidate input to its column of training values (for the ranges), and
+        `settings` gives the SETTING_COLUMNS the training runs were made with.
+        '''
+        X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+        varying = [i for i in range(X.shape[1]) if np.ptp(X[:, i]) > 0]
+        X = X[:, varying]
+        input_names = [input_names[i] for i in varying]
+        terms = cls.polynomial_terms(len(input_names), degree)
+        if len(X) <= len(terms):
+            raise ValueError(f"A degree {degree} surrogate of {len(input_names)} inputs needs more than {len(terms)} "
+                             f"results, but the sweep has {len(X)}. Run a larger sweep or use a lower --degree.")
+        candidates = candidates or dict(zip(input_names, X.T))
+        # Typical values come from one training design (the one nearest the middle of the sweep), so inputs
+        # that are not given still go together (the outdoor mean, minimum and maximum of one period)
+        columns = np.array(list(candidates.values()), dtype=float)
+        spread = np.where(np.ptp(columns, axis=1) > 0, np.ptp(columns, axis=1), 1.0)
+        middle = np.argmin((((columns.T - columns.mean(axis=1)) / spread) ** 2).sum(axis=1))
+        ranges = ({name: float(np.min(values)) for name, values in candidates.items()},
+                  {name: float(np.max(values)) for name, values in candidates.items()},
+                  {name: float(values[middle]) for name, values in candidates.items()})
+
+        def solve(rows):
+            surrogate = cls(input_names, output_names, degree, terms, X[rows].mean(axis=0), X[rows].std(axis=0),
+                            np.zeros((len(terms), Y.shape[1])), np.eye(len(terms)), np.zeros(Y.shape[1]),
+                            np.zeros(Y.shape[1]), 0.0, *ranges, settings)
+            Phi = surrogate.design(X[rows])
+            gram = Phi.T @ Phi + ridge * len(rows) * np.eye(len(terms))
+            surrogate.inverse_gram = np.linalg.inv(gram)
+            surrogate.coefficients = surrogate.inverse_gram @ (Phi.T @ Y[rows])
+            return surrogate, Phi
+
+        # k-fold cross-validation for an honest error of each output
+        rng = np.random.default_rng(rng)
+        order = rng.permutation(len(X))
+        squared_errors = np.zeros(Y.shape[1])
+        for fold in np.array_split(order, min(folds, len(X))):
+            training = np.setdiff1d(order, fold)
+            if len(training) <= len(terms):
+                continue
+            surrogate, _ = solve(training)
+            squared_errors += ((surrogate.design(X[fold]) @ surrogate.coefficients - Y[fold]) ** 2).sum(axis=0)
+
+        surrogate, Phi = solve(np.arange(len(X)))
+        residuals = Phi @ surrogate.coefficients - Y
+        surrogate.residual_std = np.sqrt((residuals ** 2).sum(axis=0) / (len(X) - len(terms)))
+        surrogate.cv_rmse = np.sqrt(squared_errors / len(X))
+        surrogate.max_leverage = float(np.max(np.einsum("ij,jk,ik->i", Phi, surrogate.inverse_gram, Phi)))
+        return surrogate
+
+    def predict(self, features, settings=None):
+        '''
+        Estimate for one design. `features` maps input names to values; inputs it does not give take their
+        typical training value. `settings` gives the SETTING_COLUMNS of the design, if known.
+        Returns (estimates, errors, reasons) where estimates and errors map output names
+        to values and reasons lists why the full simulation should be run (empty when the estimate can be trusted).
+        '''
+        reasons = []
+        for name, trained in self.settings.items():
+            given = (settings or {}).get(name, trained)
+            if given != trained:
+                reasons.append(f"the sweep was run with {name} {trained or 'none'}, not {given or 'none'}")
+        for name in self.low:
+            value = features.get(name, self.typical[name])
+            margin = RANGE_MARGIN * (self.high[name] - self.low[name]) + 1e-9 * max(1.0, abs(self.high[name]))
+            if not self.low[name] - margin <= value <= self.high[name] + margin:
+                reasons.append(f"{name} is outside the sweep ({self.low[name]:g} to {self.high[name]:g})")
+        x = np.array([features.get(name, self.typical[name]) for name in self.input_names], dtype=float)
+        phi = self.design(x)[0]
+        leverage = float(phi @ self.inverse_gram @ phi)
+        if leverage > self.max_leverage and not reasons:
+            reasons.append("the design is far from every design of the sweep")
+        estimates = dict(zip(self.output_names, (phi @ self.coefficients).tolist()))
+        errors = dict(zip(self.output_names, (self.residual_std * np.sqrt(1 + leverage)).tolist()))
+        return estimates, errors, reasons
+
+    def save(self, path):
+        np.savez(path, names=json.dumps({"inputs": self.input_names, "outputs": self.output_names, "low": self.low,
+                                          "high": self.high, "typical": self.typical, "settings": self.settings}),
+                 degree=self.degree, terms=self.terms, mean=self.mean, scale=self.scale, coefficients=self.coefficients,
+                 inverse_gram=self.inverse_gram, residual_std=self.residual_std, cv_rmse=self.cv_rmse,
+                 max_leverage=self.max_leverage)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            names = json.loads(str(data["names"]))
+            return cls(names["inputs"], names["outputs"], int(data["degree"]), data["terms"], data["mean"], data["scale"],
+                       data["coefficients"], data["inverse_gram"], data["residual_std"], data["cv_rmse"],
+                       float(data["max_leverage"]), names["low"], names["high"], names["typical"], names.get("settings"))
+
+
+def numeric_value(text):
+    # Value of a results file cell as a number (True / False as 1 / 0), or None if it is not a number
+    if text in ("True", "False"):
+        return 1.0 if text == "True" else 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def read_training_data(results_paths):
+    '''
+    Reads one or more results files of heat_pump_batch.py and returns (input names, X, Y, settings) with X the
+    numeric inputs of every row (input values, include_hot_water_demand and outdoor temperatures), Y the
+    SURROGATE_OUTPUTS and settings the SETTING_COLUMNS of the rows. Columns that are not numbers (file names
+    and other settings) are never inputs. Raises ValueError if the rows do not all have the same settings,
+    as one polynomial cannot learn e.g. on/off and modulating runs together.
+    '''
+    input_names, X, Y, settings = None, [], [], None
+    for results_path in results_paths:
+        with open(results_path, newline="") as results_file:
+            for row in csv.DictReader(results_file):
+                if "outdoor_mean_temperature_K" not in row:
+                    raise ValueError(f"{results_path} has no outdoor temperature columns. Run the sweep again to make a "
+                                     "results file the surrogate can learn from.")
+                if input_names is None:
+                    input_names = [name for name in row
+                                   if name not in NON_INPUT_COLUMNS and numeric_value(row[name]) is not None]
+                row_settings = {name: row.get(name, default) or default for name, default in SETTING_COLUMNS.items()}
+                if settings is None:
+                    settings = row_settings
+                for name, value in row_settings.items():
+                    if value != settings[name]:
+                        raise ValueError(f"The results mix runs with {name} {settings[name] or 'none'} and {value or 'none'}. "
+                                         "Train a separate surrogate for each.")
+                days = (datetime.fromisoformat(row["end"]) - datetime.fromisoformat(row["start"])).total_seconds() / 86400
+                X.append([numeric_value(row[name]) for name in input_names])
+                Y.append([float(row["energy_total_kWh"]) / days, float(row["COP_average"]),
+                          float(row["min_tank_temperature_K"])])
+    if not X:
+        raise ValueError("The results files have no rows.")
+    return input_names, np.array(X), np.array(Y), settings
+
+
+def train_surrogate(results_paths, degree=2, ridge=1e-6, seed=None):
+    # Fits a surrogate to the results files of one or more sweeps
+    input_names, X, Y, settings = read_training_data(results_paths)
+    return SurrogateModel.fit(X, Y, input_names, SURROGATE_OUTPUTS, degree=degree, ridge=ridge,
+                              candidates=dict(zip(input_names, X.T)), rng=seed, settings=settings)
+
+
+def parse_setting(text):
+    # "wall_u_value=0.3" -> ("wall_u_value", 0.3)
+    name, value = text.split("=", 1)
+    return name.strip(), float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Surrogate model of the heat pump simulation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="Fit a surrogate to sweep results")
+    train_parser.add_argument("--results", action="append", required=True, help="Results CSV of a sweep (repeat for more)")
+    train_parser.add_argument("--output", default=DEFAULT_SURROGATE_FILE, help="Surrogate file (.npz)")
+    train_parser.add_argument("--degree", type=int, default=2, help="Degree of the polynomial")
+    train_parser.add_argument("--ridge", type=float, default=1e-6, help="Ridge regularisation")
+    train_parser.add_argument("--seed", type=int, default=None, help="Seed for the cross-validation folds")
+    predict_parser = subparsers.add_parser("predict", help="Estimate one design")
+    predict_parser.add_argument("--surrogate", default=DEFAULT_SURROGATE_FILE, help="Surrogate file (.npz)")
+    predict_parser.add_argument("--set", type=parse_setting, action="append", default=[],
+                                help="Input value, e.g. wall_u_value=0.3 (repeat for more; others take typical values)")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        surrogate = train_surrogate(args.results, args.degree, args.ridge, args.seed)
+        surrogate.save(args.output)
+        print(f"Surrogate of degree {surrogate.degree} on {len(surrogate.input_names)} inputs: {', '.join(surrogate.input_names)}")
+        print("Trained with " + ", ".join(f"{name} {value or 'none'}" for name, value in surrogate.settings.items()))
+        for name, cv_rmse, residual_std in zip(surrogate.output_names, surrogate.cv_rmse, surrogate.residual_std):
+            print(f"  {name:<26} cross-validated error {cv_rmse:.4g}, fit error {residual_std:.4g}")
+        print(f"Saved to {args.output}")
+    else:
+        surrogate = SurrogateModel.load(args.surrogate)
+        estimates, errors, reasons = surrogate.predict(dict(args.set))
+        for name in surrogate.output_names:
+            print(f"{name:<26} {estimates[name]:.4g} ± {errors[name]:.2g}")
+        for reason in reasons:
+            print(f"Run the full simulation: {reason}")
+
+
+# Entry point for the surrogate model
+if __name__ == "__main__":
+    main()
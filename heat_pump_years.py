@@ -0,0 +1,274 @@
+'''
+Computational Methods and Modelling 3 Group Project
+
+Multi-year weather runs of the heat pump simulation.
+'''
+
+''' Purpose: Runs the same building (or every scenario of a scenario file) over many historical years, e.g. the
+last 20 winters, to show how much the results depend on the weather rather than on the design.
+
+The hourly temperatures of every year are read once, from a weather file or one Meteostat download covering all
+the years, and put in shared memory. Worker processes map the same block of memory instead of each getting a copy,
+and every run takes its own window (a view, nothing is copied) out of it.
+
+For every scenario and year one row is written with the energy use, the peak hourly electrical demand, the peak
+building heat load and the minimum tank temperature. The distribution of each over the years (mean, standard
+deviation, minimum, 10th/50th/90th percentiles and maximum) is printed and can be written to a second CSV file.
+
+Examples:
+
+    python heat_pump_years.py --years 2004-2023 --window 10-01:04-01 --weather-file edinburgh.csv --workers 8 --output winters.csv --summary winters_summary.csv
+    python heat_pump_years.py --years 2014-2023 --scenarios scenarios.jsonl --output years.csv
+
+'''
+
+## Importing Modules ##
+
+import csv  # Import to write the results files
+import argparse  # Import to read command line options
+import multiprocessing  # Import to run the years on several worker processes
+from multiprocessing import shared_memory  # Import to share the weather arrays between processes without copying
+import sys  # Import for writing progress to the terminal
+from datetime import datetime  # Import datetime to handle date and time operations
+import numpy as np
+
+from heat_pump_model import HeatPumpModel, DEFAULT_INPUTS_FILE, read_weather_table, download_weather_table
+from heat_pump_batch import make_model, load_scenarios, SCENARIOS_PER_WORKER_BLOCK
+
+
+# Metrics whose distribution over the years is summarised
+YEAR_METRICS = ("energy_total_kWh", "peak_hourly_power_kW", "peak_heat_load_kW", "min_tank_temperature_K")
+PERCENTILES = (10, 50, 90)
+
+# Samples per hour of the stored solution, so the peak hourly demand includes the on/off cycling of the pump
+SAMPLES_PER_HOUR = 4
+
+# Shared weather arrays, attached once in each worker process by init_year_worker
+_year_worker = {}
+
+
+def parse_years(text):
+    # "2004-2023" -> [2004, ..., 2023]; "2010,2013,2018" -> [2010, 2013, 2018]
+    years = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        years.extend(range(int(first), int(last or first) + 1))
+    if not years:
+        raise ValueError(f"No years in '{text}'.")
+    return years
+
+
+def parse_window(text):
+    # "10-01:04-01" -> ((10, 1), (4, 1)): month and day of the start and end of the window in each year
+    start, end = text.split(":")
+    return tuple(tuple(int(part) for part in day.split("-")) for day in (start, end))
+
+
+def year_windows(years, window):
+    '''
+    (year, start, end) for every year. The window starts on its start day of the year; if its end day is not
+    after the start day (a winter, 10-01:04-01, or a whole year, 01-01:01-01) it ends in the following year.
+    '''
+    (start_month, start_day), (end_month, end_day) = window
+    windows = []
+    for year in years:
+        start = datetime(year, start_month, start_day)
+        end = datetime(year, end_month, end_day)
+        if end <= start:
+            end = datetime(year + 1, end_month, end_day)
+        windows.append((year, start, end))
+    return windows
+
+
+def check_weather_coverage(times, windows, source):
+    # Every window needs (nearly) all its hours in the weather data, otherwise that year is not comparable
+    missing = []
+    for year, start, end in windows:
+        expected = int((end - start).total_seconds() // 3600) + 1
+        found = np.searchsorted(times, np.datetime64(end, "s"), side="right") - np.searchsorted(times, np.datetime64(start, "s"))
+        if found < 0.9 * expected:
+            missing.append(f"{year} ({found} of {expected} hours)")
+    if missing:
+        raise ValueError(f"Not enough weather data in {source} for: {', '.join(missing)}.")
+
+
+def share_weather(times, temps):
+    '''
+    Copies the weather table into one block of shared memory (times as int64 seconds, then temperatures)
+    and returns the block and the description a worker needs to attach to it.
+    '''
+    length = len(times)
+    memory = shared_memory.SharedMemory(create=True, size=max(16 * length, 1))
+    shared_times, shared_temps = weather_views(memory, length)
+    shared_times[:] = np.asarray(times, dtype="datetime64[s]")
+    shared_temps[:] = temps
+    return memory, {"name": memory.name, "length": length}
+
+
+def weather_views(memory, length):
+    # (times, temperatures) arrays that use the shared memory block as their buffer, without copying it
+    times = np.ndarray((length,), dtype="datetime64[s]", buffer=memory.buf, offset=0)
+    temps = np.ndarray((length,), dtype=np.float64, buffer=memory.buf, offset=8 * length)
+    return times, temps
+
+
+def init_year_worker(weather, base_inputs):
+    # Runs once in each worker process (and once in the main process for a single worker run)
+    memory = shared_memory.SharedMemory(name=weather["name"])
+    _year_worker.update(memory=memory, table=weather_views(memory, weather["length"]), base_inputs=base_inputs)
+
+
+def run_year(task):
+    '''
+    Runs one scenario over the window of one year and returns its results row. `task` is
+    (scenario index, scenario, year, start, end, seed).
+    '''
+    index, scenario, year, start, end, seed = task
+    model = make_model(scenario, _year_worker["base_inputs"], rng=np.random.default_rng(seed))
+    model.weather_table = _year_worker["table"]
+    hours = int((end - start).total_seconds() // 3600)
+    model.input_values['time_points'] = max(int(model.input_values.get('time_points', 0)), hours * SAMPLES_PER_HOUR + 1)
+    model.initialize_simulation(start, end)
+    model.calculate_metrics()
+    summary = model.results_summary()
+    return {
+        "scenario": index,
+        "name": scenario.get("name", ""),
+        "year": year,
+        "start": start.isoformat(sep=" "),
+        "end": end.isoformat(sep=" "),
+        "seed": seed,
+        "energy_total_kWh": summary["energy_total_kWh"],
+        "peak_hourly_power_kW": float(np.max(model.interval_power(3600))) / 1000,
+        "peak_heat_load_kW": -float(np.min(model.q_load_array)) / 1000, # Heat loads are negative (heat leaving)
+        "min_tank_temperature_K": summary["min_tank_temperature_K"],
+        "COP_average": summary["COP_average"],
+        "heat_loss_total_kWh": summary["heat_loss_total_kWh"],
+        "hot_water_total_kWh": summary["hot_water_total_kWh"],
+        **model.weather_summary(),
+    }
+
+
+def distribution(values):
+    # Mean, standard deviation, range and percentiles of one metric over the years
+    values = np.asarray(values, dtype=float)
+    stats = {"years": len(values), "mean": float(np.mean(values)),
+             "std": float(np.std(values, ddof=1)) if len(values) > 1 else 0.0, "min": float(np.min(values))}
+    stats.update({f"p{q}": float(np.percentile(values, q)) for q in PERCENTILES})
+    stats["max"] = float(np.max(values))
+    return stats
+
+
+def run_years(scenarios, windows, results_path, base_inputs=None, weather_file=None, seed=None, workers=1, progress=None):
+    '''
+    Runs every scenario over every (year, start, end) window and writes one row per scenario and year to
+    results_path. The weather of all the windows is loaded once (weather_file, or Meteostat at the location of
+    the scenarios) and shared with the workers. Each scenario and year gets its own hot water demand seed,
+    drawn in order from one generator seeded with `seed`, so results are the same for any number of workers.
+    Returns {(scenario index, name): {metric: distribution}} for the metrics in YEAR_METRICS.
+    '''
+    scenarios = list(scenarios)
+    if base_inputs is None:
+        base_inputs = HeatPumpModel(yaml_sim_file_path=DEFAULT_INPUTS_FILE).input_values
+    first_start = min(start for year, start, end in windows)
+    last_end = max(end for year, start, end in windows)
+    if weather_file:
+        times, temps = read_weather_table(weather_file)
+        source = weather_file
+    else:
+        # One download for every year; the table is for one place, so every scenario must be at that place
+        locations = {tuple(make_model(scenario, base_inputs).location) for scenario in scenarios}
+        if len(locations) > 1:
+            raise ValueError("Every scenario must have the same location for a multi-year run (or use --weather-file).")
+        location = locations.pop()
+        times, temps = download_weather_table(location, first_start, last_end)
+        source = f"the Meteostat data for {location}"
+    check_weather_coverage(times, windows, source)
+
+    rng = np.random.default_rng(seed)
+    tasks = [(index, scenario, year, start, end, int(rng.integers(2**63)))
+             for index, scenario in enumerate(scenarios) for year, start, end in windows]
+    values = {}
+    memory, weather = share_weather(times, temps)
+    pool = None
+    try:
+        init_year_worker(weather, base_inputs)
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=init_year_worker, initargs=(weather, base_inputs))
+        with open(results_path, "w", newline="") as results_file:
+            writer = None
+            rows = (pool.imap(run_year, tasks, chunksize=SCENARIOS_PER_WORKER_BLOCK) if pool is not None
+                    else map(run_year, tasks))
+            for done, row in enumerate(rows, 1):
+                if writer is None:
+                    writer = csv.DictWriter(results_file, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+                metrics = values.setdefault((row["scenario"], row["name"]), {metric: [] for metric in YEAR_METRICS})
+                for metric in YEAR_METRICS:
+                    metrics[metric].append(row[metric])
+                if progress is not None:
+                    progress(done, len(tasks))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        _year_worker.pop("table", None) # Drop the views before closing the memory they point into
+        _year_worker.pop("memory").close()
+        memory.close()
+        memory.unlink()
+    return {key: {metric: distribution(metric_values) for metric, metric_values in metrics.items()}
+            for key, metrics in values.items()}
+
+
+def write_summary(summary, summary_path):
+    # One row per scenario and metric with its distribution over the years
+    with open(summary_path, "w", newline="") as summary_file:
+        writer = None
+        for (index, name), metrics in summary.items():
+            for metric, stats in metrics.items():
+                row = {"scenario": index, "name": name, "metric": metric, **stats}
+                if writer is None:
+                    writer = csv.DictWriter(summary_file, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+
+
+def print_summary(summary):
+    # Distribution of each metric over the years, one block per scenario
+    columns = ["mean", "std", "min"] + [f"p{q}" for q in PERCENTILES] + ["max"]
+    for (index, name), metrics in summary.items():
+        years = next(iter(metrics.values()))["years"]
+        print(f"Scenario {index}{' (' + name + ')' if name else ''} over {years} years:")
+        print(f"  {'':24}" + "".join(f"{column:>10}" for column in columns))
+        for metric, stats in metrics.items():
+            print(f"  {metric:24}" + "".join(f"{stats[column]:10.2f}" for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the heat pump simulation over many historical weather years")
+    parser.add_argument("--years", type=parse_years, required=True, help="Years to run, e.g. 2004-2023 or 2010,2013,2018")
+    parser.add_argument("--window", type=parse_window, default=((1, 1), (1, 1)),
+                        help="Part of each year as MM-DD:MM-DD, e.g. 10-01:04-01 for winters (default: the whole year)")
+    parser.add_argument("--scenarios", default=None, help="Scenario file (.jsonl or multi-document YAML); default: inputs.yaml")
+    parser.add_argument("--output", required=True, help="Results CSV file (one row per scenario and year)")
+    parser.add_argument("--summary", default=None, help="CSV file for the distribution of each metric over the years")
+    parser.add_argument("--weather-file", default=None, help="Local CSV of hourly temperatures (columns time, temp)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the hot water demand")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios) # Every scenario (or inputs.yaml on its own) with the inputs.yaml settings
+    windows = year_windows(args.years, args.window)
+    summary = run_years(scenarios, windows, args.output, weather_file=args.weather_file, seed=args.seed,
+                        workers=args.workers,
+                        progress=lambda done, total: sys.stderr.write(f"\r{done} of {total} years finished"))
+    sys.stderr.write(f"\nWrote {args.output}\n")
+    print_summary(summary)
+    if args.summary:
+        write_summary(summary, args.summary)
+
+
+# Entry point for multi-year runs
+if __name__ == "__main__":
+    main()